@@ -22,6 +22,7 @@ except ImportError:
 import os
 from AbstractAnalysis import AbstractAnalysis
 from numpy import mean, std
+from ..utils import interpolate_checkpoints
 
 
 class SummarizeAnalysis(AbstractAnalysis):
@@ -67,7 +68,13 @@ class SummarizeAnalysis(AbstractAnalysis):
                 prev = self.summaries[um][data]["agg_online_ndcg"][i - 1][-1]
             self.summaries[um][data]["agg_online_ndcg"][i].append(prev +
                                             self.discount_factor ** i * value)
-        for i, value in enumerate(yamldata["offline_ndcg"]):
+        offline_ndcg = yamldata["offline_ndcg"]
+        if "offline_evaluation_checkpoints" in yamldata:
+            # offline performance was only evaluated on a schedule
+            offline_ndcg = interpolate_checkpoints(
+                yamldata["offline_evaluation_checkpoints"], offline_ndcg,
+                len(yamldata["online_ndcg"]))
+        for i, value in enumerate(offline_ndcg):
             self.summaries[um][data]["agg_offline_ndcg"][i].append(value)
 
         return True
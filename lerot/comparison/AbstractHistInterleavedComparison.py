@@ -20,8 +20,40 @@ Abstract base class for interleaved comparison methods with historical data
 """
 
 
+from numpy import zeros
+
+
 class AbstractHistInterleavedComparison:
 
     def infer_outcome(self, l, a, c, target_r1, target_r2, query):
         raise NotImplementedError("The derived class needs to implement "
             "infer_outcome.")
+
+    def infer_outcomes(self, log, target_r1, target_r2):
+        """Outcomes of all impressions of a HistoryLog for the target
+        rankers, in the order in which they were logged."""
+        outcomes = zeros(len(log))
+        for group in log.get_groups():
+            outcomes[group.indexes] = self._infer_group_outcomes(log, group,
+                target_r1, target_r2)
+        return outcomes.tolist()
+
+    def _infer_group_outcomes(self, log, group, target_r1, target_r2):
+        """Outcomes of the impressions of a single query of the log.
+        Derived classes can override this to compare on all impressions at
+        once."""
+        return [self.infer_outcome(l, a, c, target_r1, target_r2, query)
+                for l, a, c, query in (log.impressions[i]
+                                       for i in group.indexes)]
+
+    def _get_target_rankings(self, target_r1, target_r2, query, length):
+        """The top length documents of each target ranker."""
+        target_r1.init_ranking(query)
+        target_r2.init_ranking(query)
+        length = min(target_r1.document_count(), target_r2.document_count(),
+            length)
+        l1, l2 = [], []
+        for _ in range(length):
+            l1.append(target_r1.next())
+            l2.append(target_r2.next())
+        return l1, l2
@@ -34,3 +34,11 @@ class AbstractInterleavedComparison:
     def infer_outcome(self, l, a, c, query):
         raise NotImplementedError("The derived class needs to implement "
             "infer_outcome.")
+
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        """ Outcomes of a batch of impressions; interleavings holds the (l, a)
+        pairs (as returned by interleave_n) and clicks the clicks observed on
+        each list. Default implementation just calls infer_outcome n times.
+        """
+        return [self.infer_outcome(l, a, c, query)
+                for (l, a), c in zip(interleavings, clicks)]
@@ -17,12 +17,12 @@
 
 import argparse
 
-from numpy import asarray, where
+from numpy import asarray, maximum, minimum, newaxis, sign, where
 from random import randint
 
 
 from .AbstractInterleavedComparison import AbstractInterleavedComparison
-from ..utils import split_arg_str
+from ..utils import get_positions, split_arg_str
 
 
 class BalancedInterleave(AbstractInterleavedComparison):
@@ -46,73 +46,84 @@ class BalancedInterleave(AbstractInterleavedComparison):
             self.startinglist = arg_str
 
     def interleave(self, r1, r2, query, length):
+        return self.interleave_n(r1, r2, query, length, 1)[0]
+
+    def interleave_n(self, r1, r2, query, length, num_repeat_interleaving):
+        """Interleave num_repeat_interleaving times, using a single ranked
+        list of each ranker for all impressions. Only the starting list is
+        random, so there are at most two different interleaved lists."""
         # get ranked list for each ranker (put in assignment var)
-        l1, l2 = [], []
         r1.init_ranking(query)
         r2.init_ranking(query)
         length = min(r1.document_count(), r2.document_count(), length)
-        for _ in range(length):
-            l1.append(r1.next())
-            l2.append(r2.next())
-        # interleave
-        l = []
-        i1, i2 = 0, 0
+        l1 = [r1.next() for _ in range(length)]
+        l2 = [r2.next() for _ in range(length)]
+        # for balanced interleave the assignment captures the two original
+        # ranked result lists l1 and l2
+        a = (asarray(l1), asarray(l2))
+        lists = {}
+        interleavings = []
+        for _ in xrange(num_repeat_interleaving):
+            first = self._get_first()
+            if first not in lists:
+                lists[first] = self._merge(l1, l2, first, length)
+            interleavings.append((lists[first], a))
+        return interleavings
 
+    def _get_first(self):
         if self.startinglist == "random":
             # pick starting list at random
-            first = randint(0, 1)
+            return randint(0, 1)
         elif self.startinglist == "fixed":
-            first = 0
-        else:
-            raise Exception("Unknown starting method '%s' for "
-                            "comparison method %s." %
-                            (self.startinglist, self.__class__.__name__))
+            return 0
+        raise Exception("Unknown starting method '%s' for "
+                        "comparison method %s." %
+                        (self.startinglist, self.__class__.__name__))
 
+    def _merge(self, l1, l2, first, length):
         # interleave deterministically
+        l = []
+        in_l = set()
+        i1, i2 = 0, 0
         while len(l) < length:
             if (i1 < i2) or (i1 == i2 and first == 0):
-                if l1[i1] not in l:
-                    l.append(l1[i1])
+                next_doc = l1[i1]
                 i1 += 1
             else:
-                if l2[i2] not in l:
-                    l.append(l2[i2])
+                next_doc = l2[i2]
                 i2 += 1
-        # for balanced interleave the assignment captures the two original
-        # ranked result lists l1 and l2
-        return (asarray(l), (asarray(l1), asarray(l2)))
+            if next_doc not in in_l:
+                l.append(next_doc)
+                in_l.add(next_doc)
+        return asarray(l)
 
     def infer_outcome(self, l, a, c, query):
-        c = asarray(c)
-        a = (asarray(a[0]), asarray(a[1]))
-        click_ids = where(c == 1)[0]
-        if not len(click_ids):  # no clicks, will be a tie
-            return 0
-        # find minimum rank of the lowest click: k
-        clicks_on_l1 = []
-        clicks_on_l2 = []
-        for clicked in click_ids:
-            a1_clicks = where(a[0] == l[clicked])
-            if len(a1_clicks[0]):
-                clicks_on_l1.append(a1_clicks[0][0])
-            a2_clicks = where(a[1] == l[clicked])
-            if len(a2_clicks[0]):
-                clicks_on_l2.append(a2_clicks[0][0])
-        # lowest click
-        lowest_click = -1
-        if len(clicks_on_l1) and len(clicks_on_l2):
-            lowest_click = min(max(clicks_on_l1), max(clicks_on_l2))
-        elif len(clicks_on_l1):
-            lowest_click = max(clicks_on_l1)
-        elif len(clicks_on_l2):
-            lowest_click = max(clicks_on_l2)
-        # get number of clicked documents ranked higher or equal to N
+        return self.infer_outcome_batch([(l, a)], [c], query)[0]
+
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        """Count the clicks within the top k of each original list, where k
+        is the minimum rank of the lowest click, for all impressions at
+        once."""
+        # rank of each document in the original lists (-1 if not in there)
+        ranks1 = asarray([get_positions(l, a[0]) for l, a in interleavings])
+        ranks2 = asarray([get_positions(l, a[1]) for l, a in interleavings])
+        return self._get_outcomes(ranks1, ranks2,
+                                  asarray(clicks) == 1).tolist()
+
+    def _get_outcomes(self, ranks1, ranks2, c):
+        """Outcome of each impression, given the rank of each document in
+        the original lists and the clicks, one impression per row."""
+        on_l1 = c & (ranks1 >= 0)
+        on_l2 = c & (ranks2 >= 0)
+        # find minimum rank of the lowest click: k (-1 if there are no clicks)
+        lowest1 = where(on_l1, ranks1, -1).max(axis=1)
+        lowest2 = where(on_l2, ranks2, -1).max(axis=1)
+        lowest_click = where((lowest1 >= 0) & (lowest2 >= 0),
+                             minimum(lowest1, lowest2),
+                             maximum(lowest1, lowest2))[:, newaxis]
+        # get number of clicked documents ranked higher or equal to k
         # for both lists
-        c1, c2 = 0, 0
-        for i in click_ids:
-            if where(a[0] == l[i]) <= lowest_click:
-                c1 += 1
-            if where(a[1] == l[i]) <= lowest_click:
-                c2 += 1
+        c1 = (on_l1 & (ranks1 <= lowest_click)).sum(axis=1)
+        c2 = (on_l2 & (ranks2 <= lowest_click)).sum(axis=1)
         # compare and return outcome
-        return -1 if c1 > c2 else 1 if c2 > c1 else 0
+        return sign(c2 - c1)
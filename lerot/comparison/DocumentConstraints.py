@@ -17,11 +17,12 @@
 
 import argparse
 
-from numpy import asarray, where
+from numpy import (arange, asarray, full, hstack, minimum, newaxis, sign,
+    where, zeros)
 from random import randint
 
 from .AbstractInterleavedComparison import AbstractInterleavedComparison
-from ..utils import split_arg_str
+from ..utils import get_positions, split_arg_str
 
 
 class DocumentConstraints(AbstractInterleavedComparison):
@@ -48,86 +49,111 @@ class DocumentConstraints(AbstractInterleavedComparison):
             self.constraints = 3
 
     def interleave(self, r1, r2, query, length):
+        return self.interleave_n(r1, r2, query, length, 1)[0]
+
+    def interleave_n(self, r1, r2, query, length, num_repeat_interleaving):
+        """Interleave num_repeat_interleaving times, using a single ranked
+        list of each ranker for all impressions. Only the starting list is
+        random, so there are at most two different interleaved lists."""
         # get ranked list for each ranker (put in assignment var)
-        l1, l2 = [], []
         r1.init_ranking(query)
         r2.init_ranking(query)
         length = min(r1.document_count(), r2.document_count(), length)
-        for _ in range(length):
-            l1.append(r1.next())
-            l2.append(r2.next())
-        # interleave
-        l = []
-        i1, i2 = 0, 0
+        l1 = [r1.next() for _ in range(length)]
+        l2 = [r2.next() for _ in range(length)]
+        # for balanced interleave the assignment captures the two original
+        # ranked result lists l1 and l2
+        a = (asarray(l1), asarray(l2))
+        lists = {}
+        interleavings = []
+        for _ in xrange(num_repeat_interleaving):
+            first = self._get_first()
+            if first not in lists:
+                lists[first] = self._merge(l1, l2, first, length)
+            interleavings.append((lists[first], a))
+        return interleavings
 
+    def _get_first(self):
         if self.startinglist == "random":
             # pick starting list at random
-            first = randint(0, 1)
+            return randint(0, 1)
         elif self.startinglist == "fixed":
-            first = 0
+            return 0
         elif self.startinglist == "0":
-            first = 0
+            return 0
         elif self.startinglist == "1":
-            first = 1
-        else:
-            raise Exception("Unknown starting method '%s' for "
-                            "comparison method %s." %
-                            (self.startinglist, self.__class__.__name__))
+            return 1
+        raise Exception("Unknown starting method '%s' for "
+                        "comparison method %s." %
+                        (self.startinglist, self.__class__.__name__))
 
+    def _merge(self, l1, l2, first, length):
         # interleave deterministically
+        l = []
+        in_l = set()
+        i1, i2 = 0, 0
         while len(l) < length:
             if (i1 < i2) or (i1 == i2 and first == 0):
-                if l1[i1] not in l:
-                    l.append(l1[i1])
+                next_doc = l1[i1]
                 i1 += 1
             else:
-                if l2[i2] not in l:
-                    l.append(l2[i2])
+                next_doc = l2[i2]
                 i2 += 1
-        # for balanced interleave the assignment captures the two original
-        # ranked result lists l1 and l2
-        return (asarray(l), (asarray(l1), asarray(l2)))
+            if next_doc not in in_l:
+                l.append(next_doc)
+                in_l.add(next_doc)
+        return asarray(l)
 
     def check_constraints(self, l, a, click_ids):
-        c1, c2 = 0, 0
-        for hi in click_ids:
-            # now hi is the rank of the clicked document, l[hi] is the docid
-            # for each clicked document, get documents above it
-            doc_range = range(hi)
-            # if we're not at the lowest document, add the document after the
-            # clicked one as another potential constraint
-            # addtl. constraints for non-clicked documents directly after hi
-            if self.constraints > 1 and len(l) > hi + 1:
-                doc_range.append(hi + 1)
-            for lo in doc_range:
-                if lo in click_ids:  # y was clicked as well, no constraint.
-                    # Add a potential constraint for the document after that.
-                    # (OPTIONAL additional constraint)
-                    if self.constraints > 2 and lo > hi and len(l) > lo + 1:
-                        doc_range.append(lo + 1)
-                    continue
-                # if those docs are in the same order in l*, then a constraint
-                # is violated
-                if len(where(a[0] == l[lo])[0]):
-                    # doc we want lower is in top N
-                    if not len(where(a[0] == l[hi])[0]) or (
-                        where(a[0] == l[lo]) < where(a[0] == l[hi])):
-                        # and the other is not in top N or has a lower rank
-                        c1 += 1
-                if len(where(a[1] == l[lo])[0]):
-                    if not len(where(a[1] == l[hi])[0]) or (
-                        where(a[1] == l[lo]) < where(a[1] == l[hi])):
-                        c2 += 1
-        return (c1, c2)
+        c = zeros((1, len(l)), dtype=bool)
+        c[0, click_ids] = True
+        c1, c2 = self._count_violations(
+            [get_positions(l, a[0])], [get_positions(l, a[1])], c)
+        return (c1[0], c2[0])
+
+    def _count_violations(self, ranks1, ranks2, c):
+        """Count the constraints violated by each original list, given the
+        rank of each document in the original lists (-1 if not in there) and
+        the clicks, one impression per row."""
+        ranks1, ranks2, c = asarray(ranks1), asarray(ranks2), asarray(c)
+        length = c.shape[1]
+        positions = arange(length)
+        # each clicked document (hi) is preferred over the documents above it
+        # (lo) that were not clicked
+        pairs = positions[:, newaxis] < positions
+        if self.constraints > 1:
+            # addtl. constraints for the non-clicked document directly after
+            # hi, or (with 3 constraint types) the first non-clicked document
+            # after hi
+            if self.constraints > 2:
+                not_clicked = where(c, length, positions)
+                next_doc = minimum.accumulate(not_clicked[:, ::-1],
+                                              axis=1)[:, ::-1]
+                next_doc = hstack([next_doc[:, 1:],
+                                   full((len(c), 1), length, dtype=int)])
+            else:
+                next_doc = positions + 1 + zeros(c.shape, dtype=int)
+            pairs = pairs | (positions[:, newaxis] == next_doc[:, newaxis, :])
+        # pairs[n, lo, hi]: constraint lo < hi in impression n
+        pairs = pairs & ~c[:, :, newaxis] & c[:, newaxis, :]
+        counts = []
+        for ranks in (ranks1, ranks2):
+            # if those docs are in the same order in l*, then a constraint is
+            # violated: lo is in top N and hi is not or has a lower rank
+            lo, hi = ranks[:, :, newaxis], ranks[:, newaxis, :]
+            violated = (lo >= 0) & ((hi < 0) | (lo < hi))
+            counts.append((pairs & violated).sum(axis=(1, 2)))
+        return tuple(counts)
 
     def infer_outcome(self, l, a, c, query):
-        c = asarray(c)
-        a = (asarray(a[0]), asarray(a[1]))
-        click_ids = where(c == 1)[0]
-        if not len(click_ids):  # no clicks, will be a tie
-            return 0
+        return self.infer_outcome_batch([(l, a)], [c], query)[0]
 
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        """Count the violated constraints of all impressions at once."""
+        ranks1 = [get_positions(l, a[0]) for l, a in interleavings]
+        ranks2 = [get_positions(l, a[1]) for l, a in interleavings]
         # check for violated constraints
-        c1, c2 = self.check_constraints(l, a, click_ids)
+        c1, c2 = self._count_violations(ranks1, ranks2,
+                                        asarray(clicks) == 1)
         # now we have constraints, not clicks, reverse outcome
-        return 1 if c1 > c2 else -1 if c2 > c1 else 0
+        return sign(c1 - c2).tolist()
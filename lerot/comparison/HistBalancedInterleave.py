@@ -28,17 +28,19 @@ class HistBalancedInterleave(AbstractHistInterleavedComparison):
         self.bi = BalancedInterleave()
 
     def _get_assignment(self, r1, r2, query, length):
-        r1.init_ranking(query)
-        r2.init_ranking(query)
-        length = min(r1.document_count(), r2.document_count(), length)
         # get ranked list for each ranker
-        l1, l2 = [], []
-        for _ in range(length):
-            l1.append(r1.next())
-            l2.append(r2.next())
+        l1, l2 = self._get_target_rankings(r1, r2, query, length)
         return (asarray(l1), asarray(l2))
 
     def infer_outcome(self, l, a, c, target_r1, target_r2, query):
         """count clicks within the top-k interleaved list"""
         return self.bi.infer_outcome(l, self._get_assignment(target_r1,
             target_r2, query, len(l)), c, query)
+
+    def _infer_group_outcomes(self, log, group, target_r1, target_r2):
+        """count clicks within the top-k of all logged lists at once"""
+        l1, l2 = self._get_target_rankings(target_r1, target_r2, group.query,
+            group.length)
+        _, clicks = group.get_arrays()
+        return self.bi._get_outcomes(group.get_ranks(l1),
+            group.get_ranks(l2), clicks)
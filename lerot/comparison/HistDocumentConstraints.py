@@ -15,7 +15,7 @@
 
 # KH, 2012/08/21
 
-from numpy import asarray, where
+from numpy import asarray, sign, where
 
 from .AbstractHistInterleavedComparison import AbstractHistInterleavedComparison
 from .DocumentConstraints import DocumentConstraints
@@ -39,17 +39,19 @@ class HistDocumentConstraints(AbstractHistInterleavedComparison):
             return 0
 
         # get ranked list for each ranker
-        target_r1.init_ranking(query)
-        target_r2.init_ranking(query)
-        length = min(target_r1.document_count(), target_r2.document_count(),
-            len(l))
-        a = ([], [])
-        for _ in range(length):
-            a[0].append(target_r1.next())
-            a[1].append(target_r2.next())
+        a = self._get_target_rankings(target_r1, target_r2, query, len(l))
         a = (asarray(a[0]), asarray(a[1]))
 
         # check for violated constraints
         c1, c2 = self.dc.check_constraints(l, a, click_ids)
         # now we have constraints, not clicks, reverse outcome
         return 1 if c1 > c2 else -1 if c2 > c1 else 0
+
+    def _infer_group_outcomes(self, log, group, target_r1, target_r2):
+        """check the constraints of all logged lists at once"""
+        l1, l2 = self._get_target_rankings(target_r1, target_r2, group.query,
+            group.length)
+        _, clicks = group.get_arrays()
+        c1, c2 = self.dc._count_violations(group.get_ranks(l1),
+            group.get_ranks(l2), clicks)
+        return sign(c1 - c2)
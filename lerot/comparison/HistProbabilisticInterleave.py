@@ -18,7 +18,7 @@
 import argparse
 import logging
 
-from numpy import asarray, where
+from numpy import asarray, exp, where
 
 from .AbstractHistInterleavedComparison import AbstractHistInterleavedComparison
 from .ProbabilisticInterleave import ProbabilisticInterleave
@@ -61,17 +61,26 @@ class HistProbabilisticInterleave(AbstractHistInterleavedComparison):
     def _infer_outcome_with_marginalization(self, l, a, c, r1, r2, target_r1,
         target_r2, query, biased):
         # get outcome using the target rankers
-        target_context = (None, target_r1, target_r2)
         if r1 == r2:
             raise ValueError("r1 and r2 cannot point to the same object.")
-        outcome = self.pi.infer_outcome(l, target_context, c, query)
+        # are there any clicks? (otherwise it's a tie)
+        click_ids = where(asarray(c) == 1)
+        if not len(click_ids[0]):  # no clicks, will be a tie
+            return 0
+        outcome_probabilities = self.pi._get_outcome_probabilities(l, c,
+            target_r1, target_r2, query)
+        if outcome_probabilities is None:
+            return 0
+        o1, o2, log_p_l = outcome_probabilities
+        outcome = self.pi._aggregate_outcome(o1, o2)
         if outcome == 0:
             return 0
         if biased:
             return outcome
         # if biased is False, compensate for bias using importance sampling
-        target_p_list = self.pi.get_probability_of_list(l, target_context,
-            query)
+        # (the probability of the list under the target rankers is a
+        # by-product of marginalizing over assignments)
+        target_p_list = exp(log_p_l)
         orig_context = (None, r1, r2)
         orig_p_list = self.pi.get_probability_of_list(l, orig_context, query)
         if target_p_list == 0 or orig_p_list == 0:
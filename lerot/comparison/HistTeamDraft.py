@@ -15,7 +15,9 @@
 
 # KH, 2012/08/14
 
-from random import randint
+from numpy import (arange, asarray, count_nonzero, hstack, maximum, newaxis,
+                   sign, where, zeros)
+from numpy.random import randint
 
 from .AbstractHistInterleavedComparison import AbstractHistInterleavedComparison
 
@@ -27,94 +29,71 @@ class HistTeamDraft(AbstractHistInterleavedComparison):
         pass
 
     def _get_possible_assignment(self, l, r1, r2, query):
-        r1.init_ranking(query)
-        r2.init_ranking(query)
-        length = min(r1.document_count(), r2.document_count(), len(l))
-        a = []
-        # get ranked list for each ranker
-        l1, l2 = [], []
-        for i in range(length):
-            l1.append(r1.next())
-            l2.append(r2.next())
+        l1, l2 = self._get_target_rankings(r1, r2, query, len(l))
+        codes = {}
+        lists = asarray([[codes.setdefault(d, len(codes)) for d in l]])
+        a, possible = self._get_possible_assignments(lists,
+            asarray([codes.get(d, -1) for d in l1], dtype=int),
+            asarray([codes.get(d, -1) for d in l2], dtype=int))
+        return a[0].tolist() if possible[0] else None
 
-        # determine overlap in top results (and whether the overlap matches l)
-        i1, i2 = 0, 0
-        for i in range(length):
-            if l1[i] == l2[i]:
-                if l[i] == l1[i]:
-                    a.append(-1)
-                    i1 += 1
-                    i2 += 1
-                else:
-                    return None
-            else:
-                break
+    def _get_possible_assignments(self, lists, l1, l2):
+        """Assignments with which team draft could have produced each of the
+        lists (as integer codes, one per row) from the rankings l1 and l2
+        (codes, -1 for documents that are not in any list), and whether such
+        an assignment exists."""
+        length = len(l1)
+        lists = lists[:, :length]
+        a = zeros(lists.shape, dtype=int)
+        # the overlap in the top results has to match the list
+        overlap = 0
+        while overlap < length and l1[overlap] == l2[overlap] and \
+                l1[overlap] >= 0:
+            overlap += 1
+        a[:, :overlap] = -1
+        possible = (lists[:, :overlap] == l1[:overlap]).all(axis=1)
         # now check pairwise; per rank pair, one document needs to come from
         # each ranker
-        while len(a) < length:
-            # forward i1 and i2 to point to the next documents not yet in
-            # l[0:len(a)]
-            while i1 < len(a):
-                if l1[i1] in l[:len(a)]:
-                    i1 += 1
-                else:
-                    break
-            while i2 < len(a):
-                if l2[i2] in l[:len(a)]:
-                    i2 += 1
-                else:
-                    break
+        next_docs = []
+        for ranking in (l1, l2):
+            # the next document of each ranker for the rank pair at position
+            # j is its highest ranked document that is not in l[:j]
+            found = lists[:, newaxis, :] == ranking[:, newaxis]
+            ranks = where(found.any(axis=2), found.argmax(axis=2), length)
+            ranks = maximum.accumulate(ranks, axis=1)
+            next_i = (ranks[:, :, newaxis] < arange(length)).sum(axis=1)
+            # -1 after the end of the ranking
+            ranking = hstack([ranking, [-1, -1]])
+            next_docs.append((ranking[next_i], ranking[next_i + 1]))
+        (first_1, second_1), (first_2, second_2) = next_docs
+        pairs = arange(overlap, length - 1, 2)
+        if len(pairs):
+            next_1, next_2 = lists[:, pairs], lists[:, pairs + 1]
+            f1, s1 = first_1[:, pairs], second_1[:, pairs]
+            f2, s2 = first_2[:, pairs], second_2[:, pairs]
+            # we have a match if the next document matches l1, and the next
+            # document from l2 that is not yet in l matches next_2
+            match_1 = (f1 == next_1) & (((f2 == next_1) & (s2 == next_2)) |
+                                        ((f2 != next_1) & (f2 == next_2)))
+            # or if the same is true for l2
+            match_2 = (f2 == next_1) & (((f1 == next_1) & (s1 == next_2)) |
+                                        ((f1 != next_1) & (f1 == next_2)))
+            # two matches: pick one at random
+            first = where(match_1 & match_2, randint(0, 2, match_1.shape),
+                          where(match_1, 0, 1))
+            a[:, pairs] = first
+            a[:, pairs + 1] = 1 - first
+            possible &= (match_1 | match_2).all(axis=1)
+        if (length - overlap) % 2:
             # if there is only one document left, we're fine with a document
             # from either list
-            if length - len(a) == 1:
-                next_doc = l[len(a)]
-                if l1[i1] == next_doc and l2[i2] == next_doc:
-                    random_pick = randint(0, 1)
-                    a.append(random_pick)
-                    if random_pick == 0:
-                        i1 += 1
-                    else:
-                        i2 += 1
-                elif l1[i1] == next_doc:
-                    a.append(0)
-                    i1 += 1
-                elif l2[i2] == next_doc:
-                    a.append(1)
-                    i2 += 1
-                else:
-                    return None
-            else:
-                next_1 = l[len(a)]
-                next_2 = l[len(a) + 1]
-                assert(next_1 != next_2)
-                match_1, match_2 = False, False
-                # we have a match if the next document matches l1, and the next
-                # document from l2 that is not yet in l matches next_2
-                if l1[i1] == next_1 and ((l2[i2] == next_1 and
-                    l2[i2 + 1] == next_2) or (l2[i2] != next_1 and
-                    l2[i2] == next_2)):
-                    match_1 = True
-                # or if the same is true for l2
-                if l2[i2] == next_1 and ((l1[i1] == next_1 and
-                    l1[i1 + 1] == next_2) or (l1[i1] != next_1 and
-                    l1[i1] == next_2)):
-                    match_2 = True
-                # two matches: delete one at random
-                if match_1 and match_2:
-                    if randint(0, 1):
-                        match_2 = False
-                    else:
-                        match_1 = False
-                # now we have at most one match left
-                if match_1:
-                    a.append(0)
-                    a.append(1)
-                elif match_2:
-                    a.append(1)
-                    a.append(0)
-                else:
-                    return None
-        return a
+            next_doc = lists[:, -1]
+            match_1 = first_1[:, -1] == next_doc
+            match_2 = first_2[:, -1] == next_doc
+            a[:, -1] = where(match_1 & match_2, randint(0, 2, len(lists)),
+                             where(match_1, 0, 1))
+            possible &= match_1 | match_2
+        return a, possible
 
     def infer_outcome(self, l, a, c, target_r1, target_r2, query):
         """assign clicks for contributed documents"""
@@ -123,8 +102,18 @@ class HistTeamDraft(AbstractHistInterleavedComparison):
         if a is None:
             return 0
 
-        c1 = sum([1 if val_a == 0 and val_c == 1 else 0
-            for val_a, val_c in zip(a, c)])
-        c2 = sum([1 if val_a == 1 and val_c == 1 else 0
-            for val_a, val_c in zip(a, c)])
+        a, c = asarray(a), asarray(c)[:len(a)] == 1
+        c1 = count_nonzero(c & (a == 0))
+        c2 = count_nonzero(c & (a == 1))
         return -1 if c1 > c2 else 1 if c2 > c1 else 0
+
+    def _infer_group_outcomes(self, log, group, target_r1, target_r2):
+        """assign clicks for all logged lists at once"""
+        l1, l2 = self._get_target_rankings(target_r1, target_r2, group.query,
+            group.length)
+        a, possible = self._get_possible_assignments(group.get_arrays()[0],
+            group.encode(l1), group.encode(l2))
+        c = group.get_arrays()[1][:, :len(l1)]
+        c1 = (c & (a == 0)).sum(axis=1)
+        c2 = (c & (a == 1)).sum(axis=1)
+        return where(possible, sign(c2 - c1), 0)
@@ -0,0 +1,95 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+
+from numpy import arange, asarray, full
+
+
+class HistoryLog:
+    """
+    Impressions (result list, assignment and clicks) collected with source
+    rankers, to be reused by historical interleaved comparison methods (see
+    AbstractHistInterleavedComparison.infer_outcomes).
+
+    The impressions are grouped by query and list length. The result lists
+    of a group are encoded once, as integer codes of their documents, so
+    that target rankers can be compared on all impressions of a group in a
+    few array operations.
+    """
+
+    def __init__(self):
+        self.impressions = []
+        self.groups = OrderedDict()
+
+    def __len__(self):
+        return len(self.impressions)
+
+    def add(self, l, a, c, query):
+        """Log result list l with assignment a and clicks c for query."""
+        key = (id(query), len(l))
+        if key not in self.groups:
+            self.groups[key] = QueryHistory(query, len(l))
+        self.groups[key].add(len(self.impressions), l, c)
+        self.impressions.append((l, a, c, query))
+
+    def get_groups(self):
+        return self.groups.values()
+
+
+class QueryHistory:
+    """The impressions of a HistoryLog for a single query and list length."""
+
+    def __init__(self, query, length):
+        self.query = query
+        self.length = length
+        # code of each logged document, and the index of each impression in
+        # the log
+        self.codes = {}
+        self.indexes = []
+        self._lists = []
+        self._clicks = []
+        self._arrays = None
+
+    def add(self, index, l, c):
+        codes = self.codes
+        self._lists.append([codes.setdefault(d, len(codes)) for d in l])
+        self._clicks.append(asarray(c) == 1)
+        self.indexes.append(index)
+        self._arrays = None
+
+    def get_arrays(self):
+        """The encoded result lists and the clicks, one impression per
+        row."""
+        if self._arrays is None:
+            self._arrays = (
+                asarray(self._lists, dtype=int).reshape(-1, self.length),
+                asarray(self._clicks, dtype=bool).reshape(-1, self.length))
+        return self._arrays
+
+    def encode(self, ranking):
+        """Codes of the documents of ranking (-1 for documents that were not
+        logged)."""
+        return asarray([self.codes.get(d, -1) for d in ranking], dtype=int)
+
+    def get_ranks(self, ranking):
+        """Rank of each logged document in ranking (-1 if it is not in
+        there), one impression per row."""
+        table = full(len(self.codes), -1, dtype=int)
+        encoded = self.encode(ranking)
+        logged = encoded >= 0
+        # reversed, so that the first occurrence of a document is kept
+        table[encoded[logged][::-1]] = arange(len(encoded))[logged][::-1]
+        return table[self.get_arrays()[0]]
@@ -18,14 +18,26 @@ import argparse
 import numpy as np
 import math
 import time
+from collections import OrderedDict
+from scipy.special import xlogy
 
 from .AbstractInterleavedComparison import AbstractInterleavedComparison
+from .OptimizedSolver import SOLVERS
+from ..document import Document
 from ..utils import split_arg_str
 
 
 # Maximum number of documents (in A and B) that we can feed to OI* alggorithms
 MAX_NUMBER_OF_DOCS = 20
 
+
+def _canonical_ranking(ranking):
+    """Hashable version of a ranking. Documents are identified by their id
+    and type (ids are only unique within a query, but the solution only
+    depends on the positions of the documents)."""
+    return tuple((d.get_id(), d.get_type()) if isinstance(d, Document) else d
+                 for d in ranking)
+
 class OptimizedInterleave(AbstractInterleavedComparison):
     """
     An implementation of Optimized Interleave as described in:
@@ -37,7 +49,7 @@ class OptimizedInterleave(AbstractInterleavedComparison):
     @author: Anne Schuth
     @contact: anne.schuth@uva.nl
     @since: February 2013
-    @requires: Gurobi from http://www.gurobi.com/
+    @requires: Gurobi from http://www.gurobi.com/ for "--solver gurobi"
     """
 
     def __init__(self, arg_str=""):
@@ -55,6 +67,12 @@ class OptimizedInterleave(AbstractInterleavedComparison):
                             default="prefix_constraint")
         parser.add_argument("--sample_size", type=int, default=-1)
         parser.add_argument("--prefix_bound", type=int, default=-1)
+        parser.add_argument("--solver", choices=sorted(SOLVERS),
+                            default="linprog")
+        parser.add_argument("--cache_size", type=int, default=128,
+                            help="Number of solutions (allowed lists, their "
+                            "credit and probabilities) to keep for recurring "
+                            "rankings, 0 disables the cache.")
         parser.add_argument("--verbose", action="store_true", default=False)
         args = vars(parser.parse_known_args(split_arg_str(arg_str))[0])
         self.credit = getattr(self, args["credit"])
@@ -62,6 +80,11 @@ class OptimizedInterleave(AbstractInterleavedComparison):
         self.verbose = args["verbose"]
         self.prefix_bound = args["prefix_bound"]
         self.sample_size = args["sample_size"]
+        self.solver = SOLVERS[args["solver"]]()
+        self.cache_size = args["cache_size"]
+        self.solutions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
 
     def f(self, i):
         # Implemented as footnote 4 suggests
@@ -242,8 +265,6 @@ class OptimizedInterleave(AbstractInterleavedComparison):
         return self.interleave_n(r1, r2, query, length, 1, bias=0)[0]
 
     def interleave_n(self, r1, r2, query, length, num_repeat, bias=0):
-        import gurobipy
-
         r1.init_ranking(query)
         r2.init_ranking(query)
         rA, rB = (r.getDocs() for r in [r1, r2])
@@ -252,84 +273,93 @@ class OptimizedInterleave(AbstractInterleavedComparison):
         # We may need longer rA and rB for interleaving, so this is not a bug.
         rA = rA[:length]
         rB = rB[:length]
+
+        key = self.get_cache_key([rA, rB], length)
+        sign = 1
+        if key is not None and key not in self.solutions:
+            # credit is antisymmetric, so the solution for the swapped pair
+            # can be reused by negating the credit
+            swapped_key = self.get_cache_key([rB, rA], length)
+            if swapped_key in self.solutions:
+                key, sign = swapped_key, -1
+        L, credit, P, self.relaxed = self.get_solution(key,
+            lambda: self.solve_interleave(rA, rB, length))
+
+        # Sample n lists from L using the computed probabilities
+        return [(np.asarray(L[i]), (sign * credit[i]).tolist())
+                for i in self.sample_lists(P, num_repeat)]
+
+    def solve_interleave(self, rA, rB, length):
+        """Allowed lists, their credit and probabilities, and whether the
+        constraints had to be relaxed."""
         L = self.allowed_leavings([rA, rB], length)
         assert len(L) > 0, (rA, rB, length)
 
         # Pre-compute credit for each list l in L
         rankA = self.precompute_rank(rA)
         rankB = self.precompute_rank(rB)
-        credit = [[self.credit(li, rankA, rankB) for li in l] for l in L]
-
-        # Construct a set of constraints
-        m = gurobipy.Model("system")
-        m.params.outputFlag = 0
-        P = []
-        # Add a parameter Pi for each list that adheres to equation (6)
-        for i in range(len(L)):
-            P.append(m.addVar(lb=0.0, ub=1.0, name='p%d' % i))
-        m.update()
-        # Constraint for equation (7)
-        m.addConstr(gurobipy.quicksum(P) == 1, 'sum')
-        # Constraints for equation(8) for each k
-        for k in xrange(length):
-            m.addConstr(gurobipy.quicksum([P[n] * credit[n][k] for n in xrange(len(L))]) == 0, "c%d" % k)
-
-        # Add sensitivity as an objective to the optimization, equation (13)
-        S = []
-        for i in range(len(L)):
-            # Equation (9)
-            wa = sum([self.f(k + 1)
-                      for k in range(len(L[i])) if credit[i][k] > 0])
-            # Equation (10)
-            wb = sum([self.f(k + 1)
-                      for k in range(len(L[i])) if credit[i][k] < 0])
-            # Equation (11)
-            wt = sum([self.f(k + 1)
-                      for k in range(len(L[i])) if credit[i][k] == 0])
-            if wa + wb > 0:
-                s = -((1 - wt) /
-                      (wa + wb)) * math.log(((wa ** wa) * (wb ** wb)) /
-                                             ((wa + wb) ** (wa + wb)), 2)
-                S.append(P[i] * s)
-        m.setObjective(gurobipy.quicksum(S), gurobipy.GRB.MAXIMIZE)
-
-        # Optimize the system and if it is infeasible, relax the constraints
-        self.relaxed = False
-        m.optimize()
-        if m.status == gurobipy.GRB.INFEASIBLE:
-            self.relaxed = True
-            m.feasRelaxS(1, False, False, True)
-            # Restore constraint for equation (7)
-            m.addConstr(gurobipy.quicksum(P) == 1, 'sum')
-            m.addConstr(gurobipy.quicksum(
-                [gurobipy.quicksum([P[n] * credit[n][k] for n in xrange(len(L))]) for k in xrange(length)]
-            ) == 0, "c%d" % k)
-
-            m.optimize()
-
-        assert m.status != gurobipy.GRB.INFEASIBLE
+        credit = np.asarray([[self.credit(li, rankA, rankB) for li in l]
+                             for l in L])
+
+        # Find a probability Pi for each list that adheres to equations (6)
+        # and (7), such that the constraints of equation (8) hold for each k
+        # and sensitivity is maximized, equation (13)
+        P, relaxed = self.solver.solve(self.get_sensitivity(credit),
+                                       credit.T, np.zeros(length),
+                                       maximize=True)
 
         if self.verbose:
             print rA
             print rB
             for i in range(len(L)):
-                print L[i], credit[i], P[i].x
-            m.printStats()
-
-        # Sample n lists from L using the computed probabilities
-        problist = sorted([(P[i].x, L[i], credit[i])
-                           for i in range(len(L)) if P[i].x > 0])
-        result = []
-        for i in xrange(num_repeat):
-            cumprob = 0.0
-            randsample = random.random()
-            for (p, l, cr) in problist:
-                cumprob += p
-                if randsample <= cumprob:
-                    result.append((np.asarray(l), cr))
-                    break
-        assert len(result) == num_repeat
-        return result
+                print L[i], credit[i], P[i]
+        return L, credit, P, relaxed
+
+    def get_cache_key(self, rankings, length):
+        """Key of the solution for the given rankings, None if it cannot be
+        cached (when the allowed lists are sampled)."""
+        if self.cache_size < 1 or \
+                self.allowed_leavings.__name__.startswith("sample"):
+            return None
+        return (self.credit.__name__, self.precompute_rank.__name__, length,
+                tuple(_canonical_ranking(r) for r in rankings))
+
+    def get_solution(self, key, solve):
+        """Result of solve(), kept in a bounded LRU cache under key."""
+        if key is None:
+            return solve()
+        solution = self.solutions.pop(key, None)
+        if solution is None:
+            self.misses += 1
+            solution = solve()
+            if len(self.solutions) >= self.cache_size:
+                # evict the least recently used solution
+                self.solutions.popitem(last=False)
+        else:
+            self.hits += 1
+        self.solutions[key] = solution
+        return solution
+
+    def sample_lists(self, P, n):
+        """Indexes of n lists sampled from the probabilities P."""
+        support = np.flatnonzero(P)
+        cumprob = np.cumsum(P[support])
+        draws = np.searchsorted(cumprob, [random.random() * cumprob[-1]
+                                          for _ in xrange(n)])
+        return support[np.minimum(draws, len(support) - 1)]
+
+    def get_sensitivity(self, credit):
+        """Sensitivity of each list, given the credit of its documents."""
+        credit = np.asarray(credit, dtype=float)
+        f = np.asarray([self.f(k + 1) for k in range(credit.shape[1])])
+        # Equations (9), (10) and (11)
+        wa = np.dot(credit > 0, f)
+        wb = np.dot(credit < 0, f)
+        wt = np.dot(credit == 0, f)
+        # Equation (12), the entropy of wa and wb (0 if wa + wb == 0)
+        w = wa + wb
+        entropy = (xlogy(wa, wa) + xlogy(wb, wb) - xlogy(w, w)) / np.log(2)
+        return -np.where(w > 0, (1 - wt) / np.where(w > 0, w, 1), 0) * entropy
 
     def infer_outcome(self, l, credit, clicks, query):
         return sum(cr for (cr, c) in zip(credit, clicks) if c > 0)
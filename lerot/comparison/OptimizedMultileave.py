@@ -17,9 +17,9 @@ import random
 import argparse
 import numpy as np
 import math
+from ..ranker.AbstractRankingFunction import init_rankings
 from ..utils import split_arg_str
 from OptimizedInterleave import OptimizedInterleave
-#import gurobipy
 import os
 
 
@@ -34,7 +34,7 @@ class OptimizedMultileave(OptimizedInterleave):
     @author: Anne Schuth
     @contact: anne.schuth@uva.nl
     @since: December 2013
-    @requires: Gurobi from http://www.gurobi.com/
+    @requires: Gurobi from http://www.gurobi.com/ for "--solver gurobi"
     """
 
     def __init__(self, arg_str=""):
@@ -70,113 +70,72 @@ class OptimizedMultileave(OptimizedInterleave):
         return -rank
 
     def interleave(self, rankers, query, length):
-        rankings = []
-        for r in rankers:
-            r.init_ranking(query)
-            rankings.append(r.docids)
+        init_rankings(rankers, query)
+        rankings = [r.get_ranking() for r in rankers]
         length = min(min([len(r) for r in rankings]), length)
-        L = self.allowed_leavings(rankings, length)
-        #print len(L)
-
-        # Pre-compute credit for each list l in L
-        C = [[[self.credit(li, ranking)
-               for ranking in rankings]
-              for li in l]
-             for l in L]
-
-        # Construct a set of constraints
-        m = gurobipy.Model("system")
-        m.params.outputFlag = 0
-        P = []
-        # Add a parameter Pi for each list that adheres to equation (6)
-        for i in range(len(L)):
-            P.append(m.addVar(lb=0.0, ub=1.0, name='p%d' % i))
-        m.update()
-        m.addConstr(gurobipy.quicksum(P) == 1, 'sum')
-        biasconstrs = []
-        if self.bias == "per_k_bias":
-            V = []
-            for k in range(length):
-                V.append(m.addVar(name='var%d' % k))
-            m.update()
-            # Constraint for equation (7)
-            # Constraints for equation(8) for each k
-            for k in range(length):
-                for x in range(len(rankings)):
-                    s = []
-                    for i in range(len(L)):
-                        s.append(P[i] * gurobipy.quicksum(
-                                            [C[i][j][x] for j in range(k)]))
-                    biasconstrs.append(
-                        m.addConstr(gurobipy.quicksum(s) == V[k], "c%d" % k))
-        elif self.bias == "position_bias":
-            V = [m.addVar(name='var')]
-            m.update()
-            for x in range(len(rankings)):
-                s = []
-                for i in range(len(L)):
-                    s.append(P[i] * gurobipy.quicksum(
-                                            [self.f(j + 1) * C[i][j][x]
-                                             for j in range(length)]))
-                biasconstrs.append(
-                        m.addConstr(gurobipy.quicksum(s) == V[0], "c%d" % x))
-
-        # Add sensitivity as an objective to the optimization, equation (13)
-        S = []
-        for i in range(len(L)):
-            # Replacing Equation (9, 10, 11)
-            s = []
-
-            if self.sensitivity == "Floor":
-                mu = 0.0
-                for x in range(len(rankings)):
-                    for j in range(length):
-                        mu += self.f(j + 1) * C[i][j][x]
-                mu /= len(rankings)
-                for x in range(len(rankings)):
-                    s.append((sum([
-                              self.f(j + 1) * C[i][j][x]
-                              for j in range(length)]) - mu) ** 2
-                             )
-            elif self.sensitivity == "Shimon":
-                for x in range(len(rankings)):
-                    mu = 0.0
-                    for j in range(length):
-                        mu += self.f(j + 1) * C[i][j][x]
-                    mu /= length
-                    s.append((sum([
-                              self.f(j + 1) * C[i][j][x] - mu
-                              for j in range(length)])) ** 2
-                             )
-
-            S.append(P[i] * sum(s))
-
-        m.setObjective(gurobipy.quicksum(S), gurobipy.GRB.MINIMIZE)
-
-        # Optimize the system and if it is infeasible, relax the constraints
-        self.relaxed = False
-        m.optimize()
-        if m.status == gurobipy.GRB.INFEASIBLE:
-            self.relaxed = True
-            m.feasRelaxS(1, False, True, True)
-            m.optimize()
+        L, credit, P, self.relaxed = self.get_solution(
+            self.get_cache_key(rankings, length),
+            lambda: self.solve_multileave(rankings, length))
 
         # Sample a list l from L using the computed probabilities
-        sumprob = sum([P[i].x for i in range(len(L)) if P[i].x > 0])
-        problist = sorted([(P[i].x / sumprob, L[i], C[i])
-                           for i in range(len(L)) if P[i].x > 0])
+        i = self.sample_lists(P, 1)[0]
+        return (np.asarray(L[i]), credit[i].tolist())
+
+    def solve_multileave(self, rankings, length):
+        """Allowed lists, their credit and probabilities, and whether the
+        constraints had to be relaxed."""
+        L = self.allowed_leavings(rankings, length)
+
+        # Pre-compute credit for each list l in L (the credit of a document
+        # does not depend on the list it is in)
+        doc_credit = dict((li, [self.credit(li, ranking)
+                                for ranking in rankings])
+                          for li in set().union(*rankings))
+        credit = np.asarray([[doc_credit[li] for li in l] for l in L],
+                            dtype=float).reshape(len(L), length,
+                                                 len(rankings))
+
+        # Find a probability Pi for each list that adheres to equation (6)
+        # and (7), such that each ranker gets the same expected credit
+        # (replacing equation (8)), and the variance in credit between
+        # rankers is minimized (replacing equation (13))
+        A_eq, b_eq = self.get_bias_constraints(credit)
+        P, relaxed = self.solver.solve(self.get_credit_variance(credit),
+                                       A_eq, b_eq, relax_bounds=True)
         if self.verbose:
-            m.printStats()
-            for (p, l, C) in problist:
-                print l, p
-
-        randsample = random.random()
-        p = l = C = None
-        cumprob = 0.0
-        for (p, l, C) in problist:
-            cumprob += p
-            if randsample <= cumprob:
-                return (np.asarray(l), C)
+            for i in np.flatnonzero(P):
+                print L[i], P[i]
+        return L, credit, P, relaxed
+
+    def get_bias_constraints(self, credit):
+        """Constraints (A_eq, b_eq) that make the expected credit of each
+        ranker equal, given the credit of each document (for each ranker) in
+        each list."""
+        n_lists, length, n_rankers = credit.shape
+        if self.bias == "per_k_bias":
+            # for each k, the expected credit of the top k documents
+            weighted = np.cumsum(credit, axis=1) - credit
+        elif self.bias == "position_bias":
+            f = np.asarray([self.f(j + 1) for j in range(length)])
+            weighted = np.einsum("ijx,j->ix", credit, f)[:, np.newaxis, :]
+        # the expected credit of each ranker equals that of the first ranker
+        A_eq = (weighted[:, :, 1:] -
+                weighted[:, :, :1]).reshape(n_lists, -1).T
+        return A_eq, np.zeros(len(A_eq))
+
+    def get_credit_variance(self, credit):
+        """Sensitivity of each list (to be minimized), given the credit of
+        each document (for each ranker) in each list."""
+        n_lists, length, n_rankers = credit.shape
+        f = np.asarray([self.f(j + 1) for j in range(length)])
+        # the (position weighted) credit of each ranker
+        ranker_credit = np.einsum("ijx,j->ix", credit, f)
+        if self.sensitivity == "Floor":
+            mu = ranker_credit.mean(axis=1)[:, np.newaxis]
+            return ((ranker_credit - mu) ** 2).sum(axis=1)
+        elif self.sensitivity == "Shimon":
+            mu = ranker_credit / length
+            return ((ranker_credit - length * mu) ** 2).sum(axis=1)
 
     def infer_outcome(self, l, C, clicked, query):
         creditsum = np.zeros(len(C[0]))
@@ -192,6 +151,9 @@ if __name__ == '__main__':
         def init_ranking(self, query):
             pass
 
+        def get_ranking(self):
+            return self.docids
+
 #    r1 = TestRanker(["a", "b", "c", "d"])
 #    r2 = TestRanker(["b", "d", "c", "a"])
 #    r3 = TestRanker(["z", "y", "c", "d", "b", "a"])
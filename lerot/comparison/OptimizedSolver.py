@@ -0,0 +1,141 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Solvers for the optimization problems of optimized interleaving and
+multileaving: find a probability distribution p over the allowed lists
+(equations (6) and (7) in Radlinski & Craswell, 2013) that optimizes a linear
+objective subject to the linear constraints A_eq p == b_eq (equation (8)).
+"""
+
+import warnings
+
+import numpy as np
+from scipy.linalg import qr
+from scipy.optimize import linprog, nnls, OptimizeWarning
+
+# probabilities below this value are considered to be zero
+EPSILON = 1e-7
+
+
+def minimize_violation(A_eq, b_eq, weight=1e3):
+    """Probability distribution p that minimizes ||A_eq p - b_eq||^2. Solved
+    as a non-negative least squares problem, with sum(p) == 1 added as a
+    heavily weighted equation."""
+    p, _ = nnls(np.vstack([A_eq, weight * np.ones(A_eq.shape[1])]),
+                np.append(b_eq, weight))
+    if p.sum() <= 0:
+        return np.ones(A_eq.shape[1]) / A_eq.shape[1]
+    return p
+
+
+def remove_redundant_constraints(A_eq, b_eq, tol=1e-9):
+    """Drop the equations of A_eq p == b_eq that are linear combinations of
+    the others (these systems have few equations but many variables, so this
+    is much cheaper than the generic check of linprog)."""
+    augmented = np.column_stack([A_eq, b_eq])
+    if not len(augmented):
+        return A_eq, b_eq
+    _, R, pivots = qr(augmented.T, mode="economic", pivoting=True)
+    diagonal = np.abs(np.diag(R))
+    independent = pivots[:len(diagonal)][diagonal > tol * max(diagonal[0], 1)]
+    keep = np.sort(independent)
+    return A_eq[keep], b_eq[keep]
+
+
+def _normalize(p):
+    p = np.where(p > EPSILON, p, 0)
+    return p / p.sum()
+
+
+class LinprogSolver:
+    """Solves the linear program with scipy.optimize.linprog. If it is
+    infeasible, the constraints are relaxed: the distribution that minimizes
+    the sum of squared constraint violations is returned instead."""
+
+    def __init__(self, method="interior-point"):
+        self.method = method
+
+    def solve(self, objective, A_eq, b_eq, maximize=False,
+              relax_bounds=False):
+        """Returns the distribution p and whether the constraints had to be
+        relaxed. relax_bounds is ignored, the relaxed p is a distribution."""
+        objective = np.asarray(objective, dtype=float)
+        A_eq = np.asarray(A_eq, dtype=float).reshape(-1, len(objective))
+        b_eq = np.asarray(b_eq, dtype=float)
+        # add equation (7), and drop redundant constraints
+        A, b = remove_redundant_constraints(
+            np.vstack([A_eq, np.ones(len(objective))]), np.append(b_eq, 1.0))
+        with warnings.catch_warnings():
+            # the constraints of equation (8) are often linearly dependent
+            warnings.simplefilter("ignore", OptimizeWarning)
+            try:
+                result = linprog(-objective if maximize else objective,
+                                 A_eq=A, b_eq=b, bounds=(0, None),
+                                 method=self.method, options={"rr": False})
+            except ValueError:
+                # numerical problems, treat as infeasible
+                result = None
+        if result is not None and result.status == 0:
+            return _normalize(result.x), False
+        return _normalize(minimize_violation(A_eq, b_eq)), True
+
+
+class GurobiSolver:
+    """Solves the linear program with Gurobi (http://www.gurobi.com/). If it
+    is infeasible, Gurobi's feasibility relaxation (minimizing the sum of
+    squared violations) is used instead, see solve."""
+
+    def __init__(self):
+        import gurobipy
+        self.gurobipy = gurobipy
+
+    def solve(self, objective, A_eq, b_eq, maximize=False,
+              relax_bounds=False):
+        """Returns the distribution p and whether the constraints had to be
+        relaxed. By default only the constraints are relaxed, after which
+        equation (7) and the sum of the equations (8) are restored as hard
+        constraints (as in OptimizedInterleave). With relax_bounds, the
+        bounds of p are relaxed as well and nothing is restored (as in
+        OptimizedMultileave)."""
+        gurobipy = self.gurobipy
+        m = gurobipy.Model("system")
+        m.params.outputFlag = 0
+        P = [m.addVar(lb=0.0, ub=1.0, name="p%d" % i)
+             for i in range(len(objective))]
+        m.update()
+        m.addConstr(gurobipy.quicksum(P) == 1, "sum")
+        for k, row in enumerate(A_eq):
+            m.addConstr(gurobipy.LinExpr(list(row), P) == b_eq[k], "c%d" % k)
+        m.setObjective(gurobipy.LinExpr(list(objective), P),
+                       gurobipy.GRB.MAXIMIZE if maximize
+                       else gurobipy.GRB.MINIMIZE)
+        m.optimize()
+        relaxed = False
+        if m.status == gurobipy.GRB.INFEASIBLE:
+            relaxed = True
+            m.feasRelaxS(1, False, relax_bounds, True)
+            if not relax_bounds:
+                # restore equation (7), and require the violations of
+                # equation (8) to cancel out overall
+                m.addConstr(gurobipy.quicksum(P) == 1, "sum")
+                if len(A_eq):
+                    m.addConstr(gurobipy.LinExpr(
+                        list(np.sum(A_eq, axis=0)), P) == np.sum(b_eq), "c")
+            m.optimize()
+        return _normalize(np.array([v.x for v in P])), relaxed
+
+
+SOLVERS = {"linprog": LinprogSolver, "gurobi": GurobiSolver}
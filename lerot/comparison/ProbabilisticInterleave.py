@@ -17,11 +17,13 @@
 
 import argparse
 
-from numpy import asarray, e, log, where, exp
+import numpy as np
+from numpy import (arange, asarray, exp, flatnonzero, full, inf, log,
+    logaddexp, minimum, newaxis, ones, sign, where, zeros)
 from random import randint
 
 from .AbstractInterleavedComparison import AbstractInterleavedComparison
-from ..utils import split_arg_str
+from ..utils import get_positions, split_arg_str
 
 
 class ProbabilisticInterleave(AbstractInterleavedComparison):
@@ -79,83 +81,166 @@ class ProbabilisticInterleave(AbstractInterleavedComparison):
                 pass
         return (asarray(l), (a, r1, r2))
 
+    def interleave_n(self, r1, r2, query, length, num_repeat_interleaving):
+        """Interleave num_repeat_interleaving times at once: the documents
+        are drawn for all impressions together, from the document weights of
+        a single ranking of each ranker."""
+        r1.init_ranking(query)
+        r2.init_ranking(query)
+        length = min(r1.document_count(), r2.document_count(), length)
+        docids, weights, deterministic = [], [], []
+        for r in (r1, r2):
+            ranked, w = r.get_document_weights()
+            deterministic.append(w is None or self.det_interleave)
+            if deterministic[-1]:
+                # documents are produced in rank order: the remaining
+                # document with the largest weight is picked
+                w = arange(len(ranked), 0, -1)
+            docids.append(ranked)
+            weights.append(dict(zip(ranked, w)))
+        # index the documents ranked by either ranker
+        docids = docids[0] + [d for d in docids[1] if d not in weights[0]]
+        weights = [asarray([w.get(d, 0) for d in docids], dtype=float)
+                   for w in weights]
+
+        n = num_repeat_interleaving
+        # random bits indicate which r to use at each rank
+        a = np.random.randint(0, 2, (n, length))
+        remaining = ones((n, len(docids)), dtype=bool)
+        picks = zeros((n, length), dtype=int)
+        for i in range(length):
+            for select in (0, 1):
+                rows = flatnonzero(a[:, i] == select)
+                if not len(rows):
+                    continue
+                w = where(remaining[rows], weights[select], 0)
+                if deterministic[select]:
+                    pick = w.argmax(axis=1)
+                else:
+                    # draw doc, proportionally to the remaining weights
+                    cumulative = w.cumsum(axis=1)
+                    draws = np.random.random((len(rows), 1)) * \
+                        cumulative[:, -1:]
+                    pick = (cumulative <= draws).sum(axis=1)
+                    # rounding errors can only lead past the last document
+                    last = w.shape[1] - 1 - (w[:, ::-1] > 0).argmax(axis=1)
+                    pick = minimum(pick, last)
+                picks[rows, i] = pick
+                # remove the document for both rankers
+                remaining[rows, pick] = False
+        return [(asarray([docids[j] for j in picks[k]]), (a[k], r1, r2))
+                for k in range(n)]
+
     def infer_outcome(self, l, a, c, query):
-        (td_a, r1, r2) = a
+        return self.infer_outcome_batch([(l, a)], [c], query)[0]
 
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        """Infer the outcomes of all impressions at once; the list
+        probabilities under each ranker pair are computed from a single
+        ranking of each ranker."""
+        outcomes = [None] * len(interleavings)
         # for comparisons with TD, use naive comparison
         if self.compare_td:
-            c1 = sum([1 if val_a == 0 and val_c == 1 else 0
-                for val_a, val_c in zip(td_a, c)])
-            c2 = sum([1 if val_a == 1 and val_c == 1 else 0
-                for val_a, val_c in zip(td_a, c)])
-            return -1 if c1 > c2 else 1 if c2 > c1 else 0
-
-        # comparison with marginalization
-        # are there any clicks? (otherwise it's a tie)
-        click_ids = where(asarray(c) == 1)
-        if not len(click_ids[0]):  # no clicks, will be a tie
-            return 0, 0
+            td_a = asarray([a[0] for _, a in interleavings])
+            c = asarray(clicks) == 1
+            c1 = (c & (td_a == 0)).sum(axis=1)
+            c2 = (c & (td_a == 1)).sum(axis=1)
+            return sign(c2 - c1).tolist()
 
-        r1.init_ranking(query)
-        r2.init_ranking(query)
-
-        # enumerate all possible assignments that go with l, add their
-        # outcomes weighted by probabilities
-        # original outcome is not needed in this case, only clicks and probs
-        root = SimpleBinaryTree(None, 0.0, 0)  # root
-        nextLevel = [root]
-        currentLevel = []
-
-        # traverse possible assignments breath-first
-        log_p_a = len(l) * log(0.5)
-        log_p_l = len(l) * log(0.5)
-
-        for n in range(len(l)):
-            currentLevel = nextLevel
-            nextLevel = []
-            p_r1 = r1.get_document_probability(l[n])
-            p_r2 = r2.get_document_probability(l[n])
-            # zero probability: observed list is not possible (e.g., with
-            # deterministic rankers and historical data)
-            if p_r1 == 0 and p_r2 == 0:
-                return .0
-            r1.rm_document(l[n])
-            try:
-                r2.rm_document(l[n])
-            except:
-                pass
-            log_p_l += log(p_r1 + p_r2)
-
-            for node in currentLevel:
-                # expand children and add new nodes to queue for nextLevel
-                # left child: r1 is selected, only expand if p > 0
-                if p_r1 > 0:
-                    p_left = node.prob + log(0.5 * p_r1)
-                    o_left = node.outcome
-                    if c[n] == 1:
-                        o_left += -1
-                    node.left = SimpleBinaryTree(node, p_left, o_left)
-                    nextLevel.append(node.left)
-                # right child: r2 is selected, only expand if p > 0
-                if p_r2 > 0:
-                    p_right = node.prob + log(0.5 * p_r2)
-                    o_right = node.outcome
-                    if c[n] == 1:
-                        o_right += 1
-                    node.right = SimpleBinaryTree(node, p_right, o_right)
-                    nextLevel.append(node.right)
-        # we have all log probabilities for outcomes =! 0
-        o1 = 0.0
-        o2 = 0.0
-        for node in nextLevel:
-            if node.outcome != 0:
-                # log_p_a and log_p_l cancel out if we turn the outcome into a
-                # ratio for now, keep them for clarity
-                if node.outcome < 0:
-                    o1 += e ** (node.prob + log_p_a - log_p_l)
+        # comparison with marginalization, per ranker pair (and list length)
+        groups = {}
+        for k, (l, (_, r1, r2)) in enumerate(interleavings):
+            groups.setdefault((id(r1), id(r2), len(l)), []).append(k)
+        for group in groups.values():
+            _, r1, r2 = interleavings[group[0]][1]
+            lists = [interleavings[k][0] for k in group]
+            c = asarray([asarray(clicks[k])[:len(lists[0])] for k in group]
+                        ).reshape(len(group), -1)
+            o1, o2, log_p_l = self._marginalize(
+                self._get_list_probabilities(lists, r1, query),
+                self._get_list_probabilities(lists, r2, query), c == 1)
+            for i, k in enumerate(group):
+                # are there any clicks? (otherwise it's a tie)
+                if not (c[i] == 1).any():
+                    outcomes[k] = 0, 0
+                # zero probability: observed list is not possible (e.g., with
+                # deterministic rankers and historical data)
+                elif log_p_l[i] == -inf:
+                    outcomes[k] = .0
                 else:
-                    o2 += e ** (node.prob + log_p_a - log_p_l)
+                    outcomes[k] = (self._aggregate_outcome(o1[i], o2[i]),
+                                   exp(log_p_l[i]))
+        return outcomes
+
+    def _get_list_probabilities(self, lists, r, query):
+        """Probability that r produces the document at each rank of each list
+        (of equal length) next, after the documents above it were removed."""
+        r.init_ranking(query)
+        ranked, weights = r.get_document_weights()
+        ranks = asarray([get_positions(l, ranked) for l in lists]).reshape(
+            len(lists), -1)
+        in_ranking = ranks >= 0
+        if weights is None:
+            # the document is drawn if all documents ranked above it were
+            # removed
+            positions = arange(ranks.shape[1])
+            above = (ranks[:, newaxis, :] < ranks[:, :, newaxis]) & \
+                in_ranking[:, newaxis, :] & \
+                (positions < positions[:, newaxis])
+            return (in_ranking & (above.sum(axis=2) == ranks)).astype(float)
+        w = where(in_ranking, weights[ranks], 0)
+        remaining_weight = weights.sum() - (w.cumsum(axis=1) - w)
+        return where(in_ranking, w / remaining_weight, 0)
+
+    def _marginalize(self, p1, p2, c):
+        """Marginalize over all possible assignments that go with each list,
+        given the probability that r1 and r2 produce each document (see
+        _get_list_probabilities) and the clicks. Returns the probabilities o1
+        and o2 that r1, resp. r2, wins given the list and clicks, and the log
+        probability of the list (-inf if r1 and r2 cannot produce it)."""
+        n, length = c.shape
+        # only the difference between the clicks credited to r2 and r1
+        # matters, so instead of enumerating all assignments keep the log
+        # probability of each possible outcome (-length..length) so far
+        log_p_o = full((n, 2 * length + 1), -inf)
+        log_p_o[:, length] = 0.0
+
+        log_p_a = length * log(0.5)
+        log_p_l = full(n, length * log(0.5))
 
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(length):
+                log_p_r1 = log(0.5 * p1[:, i])[:, newaxis]
+                log_p_r2 = log(0.5 * p2[:, i])[:, newaxis]
+                log_p_l += log(p1[:, i] + p2[:, i])
+                # r1 is selected: outcome - 1, r2 is selected: outcome + 1
+                left = full(log_p_o.shape, -inf)
+                right = full(log_p_o.shape, -inf)
+                left[:, :-1] = log_p_o[:, 1:] + log_p_r1
+                right[:, 1:] = log_p_o[:, :-1] + log_p_r2
+                log_p_o = where(c[:, i, newaxis], logaddexp(left, right),
+                                log_p_o + logaddexp(log_p_r1, log_p_r2))
+
+            # log_p_a and log_p_l cancel out if we turn the outcome into a
+            # ratio for now, keep them for clarity
+            p_o = exp(log_p_o + log_p_a - log_p_l[:, newaxis])
+        return (p_o[:, :length].sum(axis=1), p_o[:, length + 1:].sum(axis=1),
+                log_p_l)
+
+    def _get_outcome_probabilities(self, l, c, r1, r2, query):
+        """Marginalize over all possible assignments that go with l. Returns
+        the probabilities o1 and o2 that r1, resp. r2, wins given the list
+        and clicks, and the log probability of the list, or None if the list
+        cannot be produced by r1 and r2."""
+        o1, o2, log_p_l = self._marginalize(
+            self._get_list_probabilities([l], r1, query),
+            self._get_list_probabilities([l], r2, query),
+            asarray(c).reshape(1, -1)[:, :len(l)] == 1)
+        if log_p_l[0] == -inf:
+            return None
+        return o1[0], o2[0], log_p_l[0]
+
+    def _aggregate_outcome(self, o1, o2):
         # return -1 if o1 > o2 else 1 if o2 > o1 else 0
         if o1 == o2:
             outcome = 0
@@ -180,7 +265,7 @@ class ProbabilisticInterleave(AbstractInterleavedComparison):
             outcome = -1 if o1 > o2 else 1 if o2 > o1 else 0
         else:
             raise ValueError("Unknown aggregation method: %s", self.aggregate)
-        return outcome, exp(log_p_l)
+        return outcome
 
     def get_probability_of_list(self, result_list, context, query):
         # P(l) = \prod_{doc in result_list} 1/2 P_1(doc) + 1/2 P_2(doc)
@@ -196,13 +281,3 @@ class ProbabilisticInterleave(AbstractInterleavedComparison):
             p_l *= 0.5 * (p_r1 + p_r2)
         return p_l
 
-
-class SimpleBinaryTree:
-    """tree that keeps track of outcome, probability of arriving at this
-    outcome"""
-    parent, left, right, prob, outcome = None, None, None, 0.0, 0
-
-    def __init__(self, parent, prob, outcome):
-        self.parent = parent
-        self.prob = prob
-        self.outcome = outcome
@@ -18,8 +18,9 @@
 import argparse
 import logging
 
-from numpy import mean, var
+from numpy import asarray, exp, mean, var, where
 
+from .AbstractInterleavedComparison import AbstractInterleavedComparison
 from .ProbabilisticInterleave import ProbabilisticInterleave
 from ..utils import string_to_boolean, split_arg_str
 
@@ -50,23 +51,24 @@ class ProbabilisticInterleaveWithHistory(ProbabilisticInterleave):
         # initialize history
         self.history = []
 
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        # each outcome depends on the history of the previous impressions
+        return AbstractInterleavedComparison.infer_outcome_batch(self,
+            interleavings, clicks, query)
+
     def infer_outcome(self, l, context, c, query):
         # infer live outcome
-        live_outcome = ProbabilisticInterleave.infer_outcome(self, l, context,
-            c, query)
-        # The following seems to work only from Python 3 onwards (currently
-        # using 2.7).
-        #live_outcome = super().infer_outcome(l, context, c, query)
+        live_outcome, _ = self._infer_outcome_and_probability(l, context, c,
+            query)
         # For each historic data point, infer outcome under the target rankers
         # and re-weight outcomes using importance sampling
         h_outcomes = []
         for h_item in self.history:
-            # use the current context (rankers), but historical list and clicks
-            raw_outcome = ProbabilisticInterleave.infer_outcome(self,
-                h_item.result_list, context, h_item.clicks, h_item.query)
+            # use the current context (rankers), but historical list and
+            # clicks; marginalizing over assignments also gives the
             # probability of the result list under the target distribution
-            p_list_target = self.get_probability_of_list(h_item.result_list,
-                context, h_item.query)
+            raw_outcome, p_list_target = self._infer_outcome_and_probability(
+                h_item.result_list, context, h_item.clicks, h_item.query)
             if self.biased:
                 weight = 1.0
             else:
@@ -107,6 +109,19 @@ class ProbabilisticInterleaveWithHistory(ProbabilisticInterleave):
         # return the combined outcome
         return combined_outcome
 
+    def _infer_outcome_and_probability(self, l, context, c, query):
+        """Outcome of the comparison of the rankers in context, and the
+        probability of l under these rankers (0 if there are no clicks)."""
+        (_, r1, r2) = context
+        if not len(where(asarray(c) == 1)[0]):
+            return .0, .0
+        outcome_probabilities = self._get_outcome_probabilities(l, c, r1, r2,
+            query)
+        if outcome_probabilities is None:
+            return .0, .0
+        o1, o2, log_p_l = outcome_probabilities
+        return self._aggregate_outcome(o1, o2), exp(log_p_l)
+
 
 class HistoryItem:
     """Helper class to store a history item."""
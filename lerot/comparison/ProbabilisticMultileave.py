@@ -14,13 +14,13 @@
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
-from collections import defaultdict
 from random import randint
 import random
 
 from AbstractInterleavedComparison import AbstractInterleavedComparison
 import numpy as np
 
+from ..ranker.AbstractRankingFunction import init_rankings
 from ..utils import split_arg_str
 
 
@@ -84,9 +84,7 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
         - l: multileaved list of documents
         - a: list indicating which ranker is used at each row of l
         '''
-        d = defaultdict(list)
-        for i, r in enumerate(rankers):
-            d[i] = r.init_ranking(query)
+        init_rankings(rankers, query)
 
         length = min([length] + [r.document_count() for r in rankers])
         # start with empty document list
@@ -139,8 +137,7 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
                 return [1.0/float(len(rankers))] * len(rankers)
             return [1] * len(rankers)
 
-        for r in rankers:
-            r.init_ranking(query)
+        init_rankings(rankers, query)
         p = self.probability_of_list(l, rankers, click_ids)
 
         creds = self.credits_of_list(p)
@@ -159,15 +156,10 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
         - documents
 
         RETURN:
-        - a list containing the rank in the ranker for each of the documents
+        - an array containing the rank in the ranker for each of the
+          documents (0 for documents that are not ranked)
         '''
-        ranks = [None] * len(documents)
-        docsInRanker = ranker.docids
-
-        for i, d in enumerate(documents):
-            if d in docsInRanker:
-                ranks[i] = docsInRanker.index(d) + 1
-        return ranks
+        return ranker.get_document_ranks(documents)
 
     def probability_of_list(self, result_list, rankers, clickedDocs):
         '''
@@ -183,17 +175,18 @@ class ProbabilisticMultileave(AbstractInterleavedComparison):
         tau = 0.3
         n = len(rankers[0].docids)
         sigmoid_total = np.sum(float(n) / (np.arange(n) + 1) ** tau)
-        sigmas = np.zeros([len(clickedDocs), len(rankers)])
-        for i, r in enumerate(rankers):
-            ranks = np.array(self.get_rank(r, result_list))
-            for j in range(len(clickedDocs)):
-                click = clickedDocs[j]
-                sigmas[j, i] = ranks[click] / (sigmoid_total
-                                               - np.sum(float(n) /
-                                                        (ranks[: click]
-                                                         ** tau)))
-        for i in range(sigmas.shape[0]):
-            sigmas[i, :] = sigmas[i, :] / np.sum(sigmas[i, :])
+        # ranks of the documents up to the last click (rankers x documents)
+        ranks = np.vstack([self.get_rank(r, result_list)
+                           for r in rankers]).astype(float)
+        ranks = ranks[:, :max(clickedDocs) + 1]
+        if not ranks.all():
+            raise ValueError("Not all documents are ranked by all rankers")
+        # for each click, the sum over the documents above it
+        weights = float(n) / ranks ** tau
+        above = np.cumsum(weights, axis=1) - weights
+        sigmas = (ranks[:, clickedDocs] /
+                  (sigmoid_total - above[:, clickedDocs])).T
+        sigmas /= sigmas.sum(axis=1)[:, np.newaxis]
         return list(sigmas)
 
     def credits_of_list(self, p):
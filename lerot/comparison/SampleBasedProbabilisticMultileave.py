@@ -151,15 +151,10 @@ class SampleBasedProbabilisticMultileave(AbstractInterleavedComparison):
         - documents
 
         RETURN:
-        - a list containing the rank in the ranker for each of the documents
+        - an array containing the rank in the ranker for each of the
+          documents (0 for documents that are not ranked)
         '''
-        ranks = [None] * len(documents)
-        docsInRanker = ranker.docids
-
-        for i, d in enumerate(documents):
-            if d in docsInRanker:
-                ranks[i] = docsInRanker.index(d) + 1
-        return ranks
+        return ranker.get_document_ranks(documents)
 
     def probability_of_list(self, result_list, rankers, clickedDocs):
         '''
@@ -175,17 +170,18 @@ class SampleBasedProbabilisticMultileave(AbstractInterleavedComparison):
         tau = 0.3
         n = len(rankers[0].docids)
         sigmoid_total = np.sum(float(n) / (np.arange(n) + 1) ** tau)
-        sigmas = np.zeros([len(clickedDocs), len(rankers)])
-        for i, r in enumerate(rankers):
-            ranks = np.array(self.get_rank(r, result_list))
-            for j in range(len(clickedDocs)):
-                click = clickedDocs[j]
-                sigmas[j, i] = ranks[click] / (sigmoid_total
-                                               - np.sum(float(n) /
-                                                        (ranks[: click]
-                                                         ** tau)))
-        for i in range(sigmas.shape[0]):
-            sigmas[i, :] = sigmas[i, :] / np.sum(sigmas[i, :])
+        # ranks of the documents up to the last click (rankers x documents)
+        ranks = np.vstack([self.get_rank(r, result_list)
+                           for r in rankers]).astype(float)
+        ranks = ranks[:, :max(clickedDocs) + 1]
+        if not ranks.all():
+            raise ValueError("Not all documents are ranked by all rankers")
+        # for each click, the sum over the documents above it
+        weights = float(n) / ranks ** tau
+        above = np.cumsum(weights, axis=1) - weights
+        sigmas = (ranks[:, clickedDocs] /
+                  (sigmoid_total - above[:, clickedDocs])).T
+        sigmas /= sigmas.sum(axis=1)[:, np.newaxis]
         return list(sigmas)
 
     def pick_from_probability(self, probability_list):
@@ -221,14 +217,25 @@ class SampleBasedProbabilisticMultileave(AbstractInterleavedComparison):
         RETURNS:
         - credits: list of credits for each ranker
         '''
-        total_pref = np.zeros((len(p[0]), len(p[0])))
-
-        for i in range(self.n_samples):
-            creds = np.zeros(len(p[0]))
-            for probs in p:
-                creds[self.pick_from_probability(probs)] += 1
-            total_pref += self.preferencesFromCredits(creds)
-        return total_pref/self.n_samples
+        p = np.asarray(p, dtype=float)
+        n_clicks, n_rankers = p.shape
+        # assign each click to a ranker, for all samples at once (like
+        # pick_from_probability, rounding errors go to the last ranker)
+        cumprobs = np.cumsum(p, axis=1)
+        picks = (np.random.random((self.n_samples, n_clicks, 1)) >
+                 cumprobs[np.newaxis, :, :]).sum(axis=2)
+        picks = np.minimum(picks, n_rankers - 1)
+        # credits of each ranker in each sample
+        offsets = np.arange(self.n_samples)[:, np.newaxis] * n_rankers
+        creds = np.bincount((picks + offsets).ravel(),
+                            minlength=self.n_samples * n_rankers)
+        creds = creds.reshape(self.n_samples, n_rankers)
+        # average of preferencesFromCredits over the samples
+        total_pref = np.zeros((n_rankers, n_rankers))
+        for i in range(n_rankers):
+            total_pref[i] = ((creds[:, i:i + 1] < creds).sum(axis=0) +
+                             0.5 * (creds[:, i:i + 1] == creds).sum(axis=0))
+        return total_pref / self.n_samples
 
 
     def preferencesFromCredits(self, creds):
@@ -15,10 +15,68 @@
 
 # KH, 2012/06/19
 
-from numpy import asarray
-from random import randint
+import numpy as np
+from numpy import asarray, count_nonzero, empty, sign
 
 from .AbstractInterleavedComparison import AbstractInterleavedComparison
+from ..document import Document
+
+# documents with larger ids are encoded with a dictionary
+MAX_BITMAP_SIZE = 1 << 16
+
+
+def encode_rankings(rankings):
+    """Encode the documents of the rankings as small non-negative integers:
+    their ids if they are Documents, or 0..n-1 otherwise. Returns a function
+    that decodes a list of codes (to an array of documents), the size of
+    the codes, and each ranking as a list of codes."""
+    if all(isinstance(d, Document) for r in rankings for d in r):
+        encoded = [[d.docid for d in r] for r in rankings]
+        ids = [d for r in encoded for d in r]
+        if not ids or (min(ids) >= 0 and max(ids) < MAX_BITMAP_SIZE):
+            docs = {}
+            for r, e in zip(rankings, encoded):
+                docs.update(zip(e, r))
+
+            def decode(l):
+                # much faster than asarray for a list of objects
+                array = empty(len(l), dtype=object)
+                array[:] = [docs[d] for d in l]
+                return array
+            return decode, max(ids) + 1 if ids else 0, encoded
+    codes = {}
+    encoded = [[codes.setdefault(d, len(codes)) for d in r] for r in rankings]
+    docs = [None] * len(codes)
+    for d, code in codes.iteritems():
+        docs[code] = d
+    return lambda l: asarray([docs[d] for d in l]), len(docs), encoded
+
+
+def get_team_stream(n, num_teams, length):
+    """The order in which the teams pick a document, for n drafts of length
+    documents: in each round every team picks once, in random order."""
+    rounds = -(-length // num_teams)
+    return np.random.random((n, rounds, num_teams)).argsort(axis=2).reshape(
+        n, rounds * num_teams)[:, :length]
+
+
+def draft(rankings, overlap, teams, seen):
+    """Draft a list of encoded documents: first the overlap of the rankings,
+    then each team (in the given order) picks its highest ranked document
+    that was not picked yet. seen is a cleared bitmap over the codes, which
+    is cleared again afterwards."""
+    l = rankings[0][:overlap]
+    indexes = [overlap] * len(rankings)
+    for t in teams:
+        ranking, i = rankings[t], indexes[t]
+        while seen[ranking[i]]:
+            i += 1
+        seen[ranking[i]] = 1
+        l.append(ranking[i])
+        indexes[t] = i + 1
+    for d in l:
+        seen[d] = 0
+    return l
 
 
 class TeamDraft(AbstractInterleavedComparison):
@@ -29,59 +87,46 @@ class TeamDraft(AbstractInterleavedComparison):
 
     def interleave(self, r1, r2, query, length1=None):
         """updated to match the original method"""
+        return self.interleave_n(r1, r2, query, length1, 1)[0]
+
+    def interleave_n(self, r1, r2, query, length, num_repeat_interleaving):
+        """Draft num_repeat_interleaving lists from a single ranking of each
+        ranker."""
         r1.init_ranking(query)
         r2.init_ranking(query)
+        length1 = length
         length = min(r1.document_count(), r2.document_count())
         if length1 is not None:
             length = min(length, length1)
-        # start with empty document list and assignments
-        l, a = [], []
-        # get ranked list for each ranker
-
-        l1 = r1.docids[:length]
-        l2 = r2.docids[:length]
-        i1, i2 = 0, 0
-#        for i in range(length):
-#            l1.append(r1.next())
-#            l2.append(r2.next())
+        # get ranked list for each ranker, as integer codes
+        decode, size, (l1, l2) = encode_rankings([r1.getDocs(length),
+                                                  r2.getDocs(length)])
 
         # determine overlap in top results
-        for i in range(length):
-            if l1[i] == l2[i]:
-                l.append(l1[i])
-                a.append(-1)
-                i1 += 1
-                i2 += 1
-            else:
-                break
-
-        a1, a2 = 0, 0
-        while len(l) < length:
-            if (a1 < a2) or (a1 == a2 and randint(0, 1) == 0):
-                a.append(0)
-                a1 += 1
-                while True:
-                    next_doc = l1[i1]
-                    i1 += 1
-                    if next_doc not in l:
-                        l.append(next_doc)
-                        break
-            else:
-                a.append(1)
-                a2 += 1
-                while True:
-                    next_doc = l2[i2]
-                    i2 += 1
-                    if next_doc not in l:
-                        l.append(next_doc)
-                        break
-        return (asarray(l), asarray(a))
+        overlap = 0
+        while overlap < length and l1[overlap] == l2[overlap]:
+            overlap += 1
+        # the overlap is assigned to both, then the teams take turns
+        teams = get_team_stream(num_repeat_interleaving, 2, length - overlap)
+        a = empty((num_repeat_interleaving, length), dtype=int)
+        a[:, :overlap] = -1
+        a[:, overlap:] = teams
+        seen = bytearray(size)
+        return [(decode(draft([l1, l2], overlap, t, seen)), a[i])
+                for i, t in enumerate(teams.tolist())]
 
     def infer_outcome(self, l, a, c, query):
         """assign clicks for contributed documents"""
-
-        c1 = sum([1 if val_a == 0 and val_c == 1 else 0
-            for val_a, val_c in zip(a, c)])
-        c2 = sum([1 if val_a == 1 and val_c == 1 else 0
-            for val_a, val_c in zip(a, c)])
+        a, c = asarray(a), asarray(c) == 1
+        c1 = count_nonzero(c & (a == 0))
+        c2 = count_nonzero(c & (a == 1))
         return -1 if c1 > c2 else 1 if c2 > c1 else 0
+
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        """count the clicks on the documents contributed by each team, for
+        all impressions at once"""
+        a = asarray([a for _, a in interleavings])
+        c = asarray(clicks) == 1
+        c1 = (c & (a == 0)).sum(axis=1)
+        c2 = (c & (a == 1)).sum(axis=1)
+        return sign(c2 - c1).tolist()
@@ -15,10 +15,11 @@
 
 # KH, 2012/06/19
 
-from numpy import asarray
-from random import randint, choice
+from numpy import arange, asarray, bincount, empty, newaxis
 
 from AbstractInterleavedComparison import AbstractInterleavedComparison
+from TeamDraft import draft, encode_rankings, get_team_stream
+from ..ranker.AbstractRankingFunction import init_rankings
 
 
 class TeamDraftMultileave(AbstractInterleavedComparison):
@@ -29,53 +30,46 @@ class TeamDraftMultileave(AbstractInterleavedComparison):
 
     def interleave(self, rankers, query, length):
         """updated to match the original method"""
-        rankings = []
-        for r in rankers:
-            r.init_ranking(query)
-            rankings.append(r.docids)
+        return self.interleave_n(rankers, query, length, 1)[0]
+
+    def interleave_n(self, rankers, query, length, num_repeat_interleaving):
+        """Draft num_repeat_interleaving lists from a single ranking of each
+        ranker."""
+        init_rankings(rankers, query)
         self.nrrankers = len(rankers)
-        length = min(min([len(r) for r in rankings]), length)
-        # start with empty document list and assignments
-        l = []
-        lassignments = []
+        length = min(min([r.document_count() for r in rankers]), length)
+        # each ranker contributes at most length documents, and skips at most
+        # length - 1 documents that are already in the list
+        decode, size, rankings = encode_rankings([r.getDocs(2 * length)
+                                                  for r in rankers])
         # determine overlap in top results
-        index = 0
-        for i in range(length):
-            if len(set([r[i] for r in rankings])) == 1:
-                l.append(rankings[0][i])
-                lassignments.append(-1)
-                index += 1
-            else:
-                break
-
-        indexes = [index] * len(rankings)
-
-        assignments = [0] * len(rankings)
-
-        while len(l) < length:
-            minassignment = min(assignments)
-            minassigned = [i for i, a in enumerate(assignments)
-                           if a == minassignment]
-
-            rindex = choice(minassigned)
-            assignments[rindex] += 1
-            lassignments.append(rindex)
-
-            while True:
-                next_doc = rankings[rindex][indexes[rindex]]
-                indexes[rindex] += 1
-                if next_doc not in l:
-                    l.append(next_doc)
-                    break
-
-        return (asarray(l), asarray(lassignments))
+        overlap = 0
+        while overlap < length and all(r[overlap] == rankings[0][overlap]
+                                       for r in rankings):
+            overlap += 1
+        # the overlap is assigned to all, then the teams take turns, picking
+        # in random order in each round
+        teams = get_team_stream(num_repeat_interleaving, len(rankers),
+                                length - overlap)
+        a = empty((num_repeat_interleaving, length), dtype=int)
+        a[:, :overlap] = -1
+        a[:, overlap:] = teams
+        seen = bytearray(size)
+        return [(decode(draft(rankings, overlap, t, seen)), a[i])
+                for i, t in enumerate(teams.tolist())]
 
     def infer_outcome(self, l, a, c, query):
         """assign clicks for contributed documents"""
+        return self.infer_outcome_batch([(l, a)], [c], query)[0]
 
-        credits = []
-        for r in range(self.nrrankers):
-            credit = sum([1 if val_a == r and val_c == 1 else 0
-                     for val_a, val_c in zip(list(a), list(c))])
-            credits.append(credit)
-        return credits
+    def infer_outcome_batch(self, interleavings, clicks, query):
+        """count the clicks on the documents contributed by each ranker, for
+        all impressions at once"""
+        a = asarray([a for _, a in interleavings]).reshape(len(interleavings),
+                                                           -1)
+        c = asarray(clicks).reshape(a.shape) == 1
+        credited = c & (a >= 0)
+        # one bin per impression and ranker
+        bins = (arange(len(a))[:, newaxis] * self.nrrankers + a)[credited]
+        return bincount(bins, minlength=len(a) * self.nrrankers).reshape(
+            len(a), self.nrrankers).tolist()
@@ -18,6 +18,7 @@ import itertools
 
 from numpy import asarray
 
+from .AbstractInterleavedComparison import AbstractInterleavedComparison
 from .TeamDraft import TeamDraft
 
 
@@ -64,6 +65,11 @@ class VaTdi(TeamDraft):
         raise Exception("Unable to interleave after %d attempts" % NUM_RETRIES)
 
 
+    def interleave_n(self, r1, r2, query, length, num_repeat_interleaving):
+        # the vertical-aware lists cannot be drafted in one batch
+        return AbstractInterleavedComparison.interleave_n(self, r1, r2, query,
+            length, num_repeat_interleaving)
+
     def _interleave(self, r1, r2, query, length1=None):
         r1.init_ranking(query)
         r2.init_ranking(query)
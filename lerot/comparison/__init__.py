@@ -20,6 +20,7 @@ from HistBalancedInterleave import HistBalancedInterleave
 from HistDocumentConstraints import HistDocumentConstraints
 from HistProbabilisticInterleave import HistProbabilisticInterleave
 from HistTeamDraft import  HistTeamDraft
+from HistoryLog import HistoryLog
 from OptimizedInterleave import OptimizedInterleave
 from OptimizedInterleaveVa import OptimizedInterleaveVa
 from ProbabilisticInterleave import ProbabilisticInterleave
@@ -39,6 +40,7 @@ __all__ = [
     'HistDocumentConstraints',
     'HistProbabilisticInterleave',
     'HistTeamDraft',
+    'HistoryLog',
     'OptimizedInterleave',
     'OptimizedInterleaveVa',
     'ProbabilisticInterleave',
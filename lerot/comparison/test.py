@@ -13,9 +13,11 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
+import itertools
 import unittest
 import sys
 import os
+import types
 import cStringIO
 import numpy as np
 
@@ -26,19 +28,79 @@ from lerot.ranker import (DeterministicRankingFunction,
                           ProbabilisticRankingFunction)
 
 from BalancedInterleave import BalancedInterleave
-from TeamDraft import TeamDraft
+from TeamDraft import TeamDraft, draft, encode_rankings, get_team_stream
+from TeamDraftMultileave import TeamDraftMultileave
 from DocumentConstraints import DocumentConstraints
 from ProbabilisticInterleave import ProbabilisticInterleave
 
 from HistBalancedInterleave import HistBalancedInterleave
+from OptimizedInterleave import OptimizedInterleave
+from OptimizedMultileave import OptimizedMultileave
+from OptimizedSolver import LinprogSolver
+from SampleBasedProbabilisticMultileave import \
+    SampleBasedProbabilisticMultileave
 from HistTeamDraft import HistTeamDraft
 from HistDocumentConstraints import HistDocumentConstraints
 from HistProbabilisticInterleave import HistProbabilisticInterleave
+from HistoryLog import HistoryLog
 
 from ExploitativeProbabilisticInterleave import \
     ExploitativeProbabilisticInterleave
 
 
+class FakeGurobiModel:
+    """Records the calls of the solvers to a Gurobi model that is always
+    infeasible until it is relaxed."""
+
+    models = []
+
+    def __init__(self, name):
+        self.params = types.ModuleType("params")
+        self.calls = []
+        self.vars = []
+        self.status = None
+        FakeGurobiModel.models.append(self)
+
+    def addVar(self, lb, ub, name):
+        self.vars.append(types.ModuleType(name))
+        return self.vars[-1]
+
+    def addConstr(self, constraint, name):
+        self.calls.append(("addConstr", name))
+
+    def feasRelaxS(self, *args):
+        self.calls.append(("feasRelaxS", args))
+
+    def optimize(self):
+        relaxed = any(call[0] == "feasRelaxS" for call in self.calls)
+        self.status = 2 if relaxed else 3
+        for v in self.vars:
+            v.x = 1.0 / len(self.vars)
+        self.calls.append(("optimize",))
+
+    def update(self):
+        pass
+
+    def setObjective(self, objective, sense):
+        pass
+
+
+class FakeGurobiExpr:
+    def __eq__(self, other):
+        return self
+
+
+def get_fake_gurobipy():
+    gurobipy = types.ModuleType("gurobipy")
+    gurobipy.Model = FakeGurobiModel
+    gurobipy.quicksum = lambda variables: FakeGurobiExpr()
+    gurobipy.LinExpr = lambda coefficients, variables: FakeGurobiExpr()
+    gurobipy.GRB = types.ModuleType("GRB")
+    gurobipy.GRB.MAXIMIZE, gurobipy.GRB.MINIMIZE = -1, 1
+    gurobipy.GRB.INFEASIBLE = 3
+    return gurobipy
+
+
 class TestEvaluation(unittest.TestCase):
 
     def setUp(self):
@@ -206,6 +268,22 @@ class TestEvaluation(unittest.TestCase):
         self.assertIn(assignments.tolist(), [[0, 1, 0, 1], [1, 0, 1, 0],
             [1, 0, 0, 1], [0, 1, 1, 0]])
 
+    def testTeamDraftStream(self):
+        teams = get_team_stream(1000, 3, 7)
+        self.assertEqual((1000, 7), teams.shape)
+        # each team picks once per round
+        for start in [0, 3]:
+            self.assertTrue((np.sort(teams[:, start:start + 3], axis=1) ==
+                             [0, 1, 2]).all())
+        self.assertEqual(set([0, 1, 2]), set(teams[:, 6]))
+        seen = bytearray(5)
+        self.assertEqual([4, 1, 0, 3, 2], draft([[4, 0, 1, 2, 3],
+            [4, 1, 0, 3, 2]], 1, [1, 0, 1, 0], seen))
+        self.assertEqual(bytearray(5), seen)
+        decode, size, encoded = encode_rankings([self.query.get_docids()])
+        self.assertEqual((4, [[0, 1, 2, 3]]), (size, encoded))
+        self.assertEqual(self.query.get_docids()[2:], decode([2, 3]).tolist())
+
     def testHistTeamDraft_getPossibleAssignment(self):
         r1 = DeterministicRankingFunction(None, self.weights_1)
         r2 = DeterministicRankingFunction(None, self.weights_2)
@@ -341,6 +419,183 @@ class TestEvaluation(unittest.TestCase):
         self.assertAlmostEquals(o, 0.0, 4,
             "Tie for click on last doc (o = %.4f)." % o)
 
+    def testProbabilisticInterleaveOutcomeProbabilities(self):
+        pi = ProbabilisticInterleave(None)
+        r1 = ProbabilisticRankingFunction([3], "first", 6, init="zero")
+        r1.update_weights(self.weights_1)
+        r2 = ProbabilisticRankingFunction([3], "first", 6, init="zero")
+        r2.update_weights(self.weights_2)
+        docids = self.query.get_docids()
+        l, c = [docids[i] for i in [3, 1, 0, 2]], [0, 1, 1, 0]
+        # enumerate all assignments
+        expected = [.0, .0]
+        for a in itertools.product([0, 1], repeat=len(l)):
+            r1.init_ranking(self.query)
+            r2.init_ranking(self.query)
+            p_a, outcome = 1.0, 0
+            for doc, val_a, val_c in zip(l, a, c):
+                p_a *= 0.5 * [r1, r2][val_a].get_document_probability(doc)
+                r1.rm_document(doc)
+                r2.rm_document(doc)
+                outcome += val_c * (2 * val_a - 1)
+            if outcome != 0:
+                expected[outcome > 0] += p_a
+        p_l = pi.get_probability_of_list(l, (None, r1, r2), self.query)
+        o1, o2, log_p_l = pi._get_outcome_probabilities(l, c, r1, r2,
+                                                        self.query)
+        self.assertAlmostEqual(p_l, np.exp(log_p_l))
+        # outcomes are weighted by p(l, a) p(a) / p(l)
+        p_a = 0.5 ** len(l)
+        self.assertAlmostEqual(expected[0] * p_a / p_l, o1)
+        self.assertAlmostEqual(expected[1] * p_a / p_l, o2)
+        self.assertAlmostEqual(o2 - o1,
+            pi.infer_outcome(l, (None, r1, r2), c, self.query)[0])
+
+    def testOptimizedInterleave(self):
+        oi = OptimizedInterleave()
+        r1 = DeterministicRankingFunction([None], "first", 6, init="zero")
+        r1.update_weights(self.weights_1)
+        r2 = DeterministicRankingFunction([None], "first", 6, init="zero")
+        r2.update_weights(self.weights_2)
+        r1.init_ranking(self.query)
+        r2.init_ranking(self.query)
+        rA, rB = r1.getDocs(), r2.getDocs()
+        L = oi.allowed_leavings([rA, rB], 4)
+        for l, credit in oi.interleave_n(r1, r2, self.query, 4, 10):
+            self.assertIn(l.tolist(), L)
+        # the solution is reused for recurring (and swapped) rankings
+        self.assertEqual((0, 1), (oi.hits, oi.misses))
+        oi.interleave(r1, r2, self.query, 4)
+        (l, credit) = oi.interleave(r2, r1, self.query, 4)
+        self.assertEqual((2, 1), (oi.hits, oi.misses))
+        rankA, rankB = oi.precompute_rank(rA), oi.precompute_rank(rB)
+        self.assertEqual([oi.credit(li, rankB, rankA) for li in l], credit)
+        # the solution is unbiased, equation (8)
+        credit = np.asarray([[oi.credit(li, rankA, rankB) for li in l]
+                             for l in L], dtype=float)
+        P, relaxed = LinprogSolver().solve(oi.get_sensitivity(credit),
+                                           credit.T, np.zeros(4), True)
+        self.assertFalse(relaxed)
+        self.assertAlmostEqual(1.0, P.sum())
+        self.assertTrue(np.allclose(0, np.dot(P, credit), atol=1e-6))
+        # infeasible constraints are relaxed
+        P, relaxed = LinprogSolver().solve([0, 0, 0], [[1, -1, 0],
+                                                       [0, 0, 1]], [2, 0])
+        self.assertTrue(relaxed)
+        self.assertEqual([1, 0, 0], P.round(6).tolist())
+
+    def testGurobiRelaxation(self):
+        rankers = [DeterministicRankingFunction([None], "first", 6,
+                                                init="zero")
+                   for _ in range(3)]
+        for r, w in zip(rankers, [self.weights_1, self.weights_2,
+                                  self.weights_1[::-1]]):
+            r.update_weights(w)
+        gurobipy = sys.modules.get("gurobipy")
+        sys.modules["gurobipy"] = get_fake_gurobipy()
+        FakeGurobiModel.models = []
+        try:
+            # interleaving restores the hard constraints after relaxing them
+            oi = OptimizedInterleave("--solver gurobi")
+            oi.interleave(rankers[0], rankers[1], self.query, 4)
+            self.assertTrue(oi.relaxed)
+            calls = FakeGurobiModel.models[-1].calls
+            self.assertEqual([("feasRelaxS", (1, False, False, True)),
+                              ("addConstr", "sum"), ("addConstr", "c"),
+                              ("optimize",)],
+                             calls[calls.index(("optimize",)) + 1:])
+            # multileaving relaxes the bounds as well, and restores nothing
+            om = OptimizedMultileave("--solver gurobi")
+            om.interleave(rankers, self.query, 4)
+            self.assertTrue(om.relaxed)
+            calls = FakeGurobiModel.models[-1].calls
+            self.assertEqual([("feasRelaxS", (1, False, True, True)),
+                              ("optimize",)],
+                             calls[calls.index(("optimize",)) + 1:])
+        finally:
+            if gurobipy is None:
+                del sys.modules["gurobipy"]
+            else:
+                sys.modules["gurobipy"] = gurobipy
+
+    def testInterleaveBatch(self):
+        docids = self.query.get_docids()
+        clicks = np.random.randint(0, 2, (20, 4))
+        for comparison, ranker in [
+                (TeamDraft(None), DeterministicRankingFunction),
+                (BalancedInterleave(), DeterministicRankingFunction),
+                (DocumentConstraints(), DeterministicRankingFunction),
+                (ProbabilisticInterleave(None), ProbabilisticRankingFunction),
+                (ProbabilisticInterleave(None), DeterministicRankingFunction)]:
+            r1 = ranker([3], "first", 6, init="zero")
+            r1.update_weights(self.weights_1)
+            r2 = ranker([3], "first", 6, init="zero")
+            r2.update_weights(self.weights_2)
+            interleavings = comparison.interleave_n(r1, r2, self.query, 10,
+                                                    20)
+            self.assertEqual(20, len(interleavings))
+            for l, _ in interleavings:
+                self.assertEqual(sorted(docids), sorted(l.tolist()))
+            outcomes = comparison.infer_outcome_batch(interleavings, clicks,
+                                                      self.query)
+            for (l, a), c, o in zip(interleavings, clicks, outcomes):
+                self.assertTrue(np.allclose(
+                    np.asarray(comparison.infer_outcome(l, a, c, self.query),
+                               dtype=float), np.asarray(o, dtype=float)))
+        tdm = TeamDraftMultileave()
+        rankers = [DeterministicRankingFunction([None], "first", 6,
+                                                init="zero")
+                   for _ in range(3)]
+        for r, w in zip(rankers, [self.weights_1, self.weights_2,
+                                  self.zero_weights]):
+            r.update_weights(w)
+        interleavings = tdm.interleave_n(rankers, self.query, 4, 20)
+        credits = tdm.infer_outcome_batch(interleavings, clicks, self.query)
+        for (l, a), c, credit in zip(interleavings, clicks, credits):
+            self.assertEqual(tdm.infer_outcome(l, a, c, self.query), credit)
+            self.assertEqual(sum(c), sum(credit))
+
+    def testHistoryLog(self):
+        r1 = DeterministicRankingFunction([3], "first", 6, init="zero")
+        r1.update_weights(self.weights_1)
+        r2 = DeterministicRankingFunction([3], "first", 6, init="zero")
+        r2.update_weights(self.weights_2)
+        r1_test = DeterministicRankingFunction([3], "first", 6, init="zero")
+        r1_test.update_weights(self.weights_1)
+        docids = self.query.get_docids()
+        clicks = np.random.randint(0, 2, (20, 4))
+        # clicks below the first rank pair would make the team draft outcome
+        # depend on how ties between possible assignments are broken
+        clicks[10:, 2:] = 0
+        for hist, comparison in [
+                (HistTeamDraft(), TeamDraft(None)),
+                (HistBalancedInterleave(), BalancedInterleave()),
+                (HistDocumentConstraints(), DocumentConstraints())]:
+            log = HistoryLog()
+            for c in clicks:
+                l, a = comparison.interleave(r1, r2, self.query, 4)
+                log.add(l, a, c, self.query)
+            # impossible for team draft with r1 and r2
+            log.add([docids[i] for i in [1, 0, 2, 3]], None, [0, 0, 1, 1],
+                    self.query)
+            self.assertEqual(21, len(log))
+            for target_r1, target_r2 in [(r1, r2), (r2, r1), (r1, r1_test)]:
+                outcomes = hist.infer_outcomes(log, target_r1, target_r2)
+                start = 10 if isinstance(hist, HistTeamDraft) else 0
+                for (l, a, c, query), o in zip(log.impressions[start:],
+                                               outcomes[start:]):
+                    self.assertEqual(hist.infer_outcome(l, a, c, target_r1,
+                        target_r2, query), o)
+
+    def testSampleBasedPreferencesOfList(self):
+        multil = SampleBasedProbabilisticMultileave("--n_samples 5000")
+        pref = multil.preferences_of_list([[1, 0, 0], [0, 1, 0], [1, 0, 0]])
+        self.assertEqual([[.5, 0, 0], [1, .5, 0], [1, 1, .5]], pref.tolist())
+        # ranker 0 gets the only click with probability .25
+        pref = multil.preferences_of_list([[.25, .75]])
+        self.assertAlmostEqual(.75, pref[0][1], 1)
+        self.assertAlmostEqual(1, pref[0][1] + pref[1][0])
+
     def testHistProbabilisticInterleave(self):
         r1 = ProbabilisticRankingFunction(3, self.weights_1)
         r2 = ProbabilisticRankingFunction(3, self.weights_2)
@@ -15,8 +15,10 @@
 
 # KH, 2012/06/20
 
-from random import sample
-from numpy import mean
+import numpy as np
+
+from ..query import QueryCollection
+from ..utils import get_tie_breaker, sort_with_ties
 
 
 class AbstractEval:
@@ -25,18 +27,34 @@ class AbstractEval:
     labels.
     """
 
+    # shared by evaluations of the same collection, see set_ranking_cache
+    ranking_cache = None
+
     def __init__(self):
         self.prev_solution_w = None
         self.prev_score = None
 
+    def set_ranking_cache(self, ranking_cache):
+        """
+        Use the rankings of a RankingCache when evaluating its collection, so
+        that evaluations that share the cache rank it only once per weight
+        vector.
+        """
+        self.ranking_cache = ranking_cache
+
     def evaluate_all(self, solution, queries, cutoff=-1, ties="random"):
         """
         Evaluate all queries given a certain solution
         """
-        outcomes = []
-        for query in queries:
-            outcomes.append(self.evaluate_one(solution, query, cutoff, ties))
-        score = mean(outcomes)
+        if isinstance(queries, QueryCollection):
+            outcomes = self.evaluate_collection(solution, queries, cutoff,
+                                                ties)
+        else:
+            outcomes = []
+            for query in queries:
+                outcomes.append(self.evaluate_one(solution, query, cutoff,
+                                                  ties))
+        score = np.mean(outcomes)
 
         self.prev_solution_w = solution.w
         self.prev_score = score
@@ -53,18 +71,58 @@ class AbstractEval:
                                                  ties=ties)
         return self.evaluate_ranking(sorted_docs, query, cutoff)
 
+    def evaluate_collection(self, solution, queries, cutoff=-1, ties="random"):
+        """
+        Evaluate all queries of a QueryCollection, returns the outcomes in
+        storage order. Derived classes can override this with a batched
+        implementation.
+        """
+        return [self.evaluate_one(solution, query, cutoff, ties)
+                for query in queries]
+
+    def _rank_collection(self, solution, queries, ties="random"):
+        """
+        Row indices of all documents of a collection, sorted by decreasing
+        score of the solution within each query.
+        """
+        if self.ranking_cache is not None and \
+                self.ranking_cache.queries is queries:
+            return self.ranking_cache.get_ranking(solution, ties)
+        return _sort_collection_by_score(
+            solution.score(queries.get_feature_matrix()),
+            queries.get_offsets(), ties)
+
+    def _rank_collection_by_labels(self, queries):
+        """
+        Row indices of all documents of a collection, sorted by decreasing
+        label within each query.
+        """
+        if self.ranking_cache is not None and \
+                self.ranking_cache.queries is queries:
+            return self.ranking_cache.get_label_ranking()
+        return _sort_collection_by_score(queries.get_label_vector(),
+                                         queries.get_offsets(), "first")
+
     def evaluate_ranking(self, ranking, query, cutoff=-1):
         raise NotImplementedError("Derived class needs to implement this.")
 
     def _sort_docids_by_score(self, docids, scores, ties="random"):
-        n = len(docids)
-        if ties == "first":
-            scored_docids = zip(scores, reversed(range(n)), docids)
-        elif ties == "last":
-            scored_docids = zip(scores, range(n), docids)
-        elif ties == "random":
-            scored_docids = zip(scores, sample(range(n), n), docids)
-        else:
-            raise Exception("Unknown method for breaking ties: \"%s\"" % ties)
-        scored_docids.sort(reverse=True)
-        return [docid for _, _, docid in scored_docids]
+        order, _ = sort_with_ties(scores, ties, reverse=True)
+        return [docids[i] for i in order]
+
+
+def _sort_collection_by_score(scores, offsets, ties="random"):
+    """
+    Segmented version of AbstractEval._sort_docids_by_score: returns the row
+    indices of all documents in a collection, sorted by decreasing score
+    within each query (the queries stay in storage order).
+    """
+    segments = _get_segments(offsets)
+    # ties are broken as in sort_with_ties, the last key is the primary key
+    tie_breaker = get_tie_breaker(np.shape(scores), ties)
+    return np.lexsort((-tie_breaker, -np.asarray(scores), segments))
+
+
+def _get_segments(offsets):
+    """the query index of each row in a collection with the given offsets"""
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
@@ -15,7 +15,7 @@
 
 import numpy as np
 
-from .AbstractEval import AbstractEval
+from .AbstractEval import AbstractEval, _get_segments
 
 
 class DcgEval(AbstractEval):
@@ -33,6 +33,35 @@ class DcgEval(AbstractEval):
         return ((np.power(2, np.asarray(ranked_labels[:cutoff])) - 1) /
                 np.log2(2 + rank)).sum()
 
+    def get_discounts(self, n):
+        """The discounts (divisors of the gains) of the first n ranks."""
+        return np.log2(2 + np.arange(n))
+
+    def get_dcgs(self, ranked_labels, offsets, cutoff=-1):
+        """
+        Get the dcg values of all queries in a collection, given the labels
+        of the documents of each query in rank order (concatenated in
+        storage order, query i spans offsets[i]:offsets[i + 1]).
+        """
+        counts = np.diff(offsets)
+        segments = _get_segments(offsets)
+        positions = np.arange(len(ranked_labels)) - offsets[segments]
+        gains = ((np.power(2, np.asarray(ranked_labels)) - 1) /
+                 self.get_discounts(counts.max() if len(counts) else 0)[
+                     positions])
+        if cutoff != -1:
+            gains[positions >= cutoff] = 0
+        return np.bincount(segments, weights=gains, minlength=len(counts))
+
+    def evaluate_collection(self, solution, queries, cutoff=-1, ties="random"):
+        """
+        Compute DCG for all queries in a collection, scoring all documents at
+        once and ranking them with a segmented sort.
+        """
+        ranking = self._rank_collection(solution, queries, ties)
+        return self.get_dcgs(queries.get_label_vector()[ranking],
+                             queries.get_offsets(), cutoff)
+
     def evaluate_ranking(self, ranking, query, cutoff=-1):
         """
         Compute DCG for the provided ranking. The ranking is expected
@@ -15,7 +15,7 @@
 
 # KH, 2012/06/20
 
-from numpy import log2
+from numpy import arange, log2, ones
 
 from .NdcgEval import NdcgEval
 
@@ -38,3 +38,8 @@ class LetorNdcgEval(NdcgEval):
             else:
                 dcg += (2 ** label - 1) / log2(1 + r)
         return dcg
+
+    def get_discounts(self, n):
+        discounts = ones(n)
+        discounts[1:] = log2(1 + arange(1, n))
+        return discounts
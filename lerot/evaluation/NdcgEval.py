@@ -15,6 +15,8 @@
 
 # KH, 2012/06/20
 
+import numpy as np
+
 from .DcgEval import DcgEval
 
 class NdcgEval(DcgEval):
@@ -33,12 +35,16 @@ class NdcgEval(DcgEval):
         """
         if cutoff == -1 or cutoff > len(ranking):
             cutoff = len(ranking)
-        if query.has_ideal():
-            ideal_dcg = query.get_ideal()
+        # the ideal dcg depends on the cutoff and on how dcg is computed
+        ideals = query.get_ideal() if query.has_ideal() else {}
+        key = (self.__class__, cutoff)
+        if key in ideals:
+            ideal_dcg = ideals[key]
         else:
             ideal_labels = list(reversed(sorted(query.get_labels())))[:cutoff]
             ideal_dcg = self.get_dcg(ideal_labels, cutoff)
-            query.set_ideal(ideal_dcg)
+            ideals[key] = ideal_dcg
+            query.set_ideal(ideals)
 
         if ideal_dcg == .0:
             # return 0 when there are no relevant documents. This is consistent
@@ -52,3 +58,19 @@ class NdcgEval(DcgEval):
             sorted_labels[i] = query.get_label(ranking[i])
         dcg = self.get_dcg(sorted_labels, cutoff)
         return dcg / ideal_dcg
+
+    def evaluate_collection(self, solution, queries, cutoff=-1, ties="random"):
+        """
+        Compute NDCG for all queries in a collection, scoring all documents
+        at once and ranking them with a segmented sort.
+        """
+        dcgs = DcgEval.evaluate_collection(self, solution, queries, cutoff,
+                                           ties)
+        ideal_ranking = self._rank_collection_by_labels(queries)
+        ideal_dcgs = self.get_dcgs(queries.get_label_vector()[ideal_ranking],
+                                   queries.get_offsets(), cutoff)
+        # 0 when there are no relevant documents, as in evaluate_ranking
+        relevant = ideal_dcgs != 0
+        ndcgs = np.zeros(len(dcgs))
+        ndcgs[relevant] = dcgs[relevant] / ideal_dcgs[relevant]
+        return ndcgs
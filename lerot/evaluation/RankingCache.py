@@ -0,0 +1,76 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from .AbstractEval import _sort_collection_by_score
+
+
+class RankingCache:
+    """
+    Bounded LRU cache of the rankings of all documents of a QueryCollection,
+    keyed on a hash of the weight vector of the ranker. Evaluations that share
+    a cache (see AbstractEval.set_ranking_cache) score and rank the collection
+    only once per distinct weight vector, whatever their metric or cutoff.
+    """
+
+    def __init__(self, queries, size=16):
+        self.queries = queries
+        self.size = size
+        self.rankings = OrderedDict()
+        self.label_ranking = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, solution, ties="random"):
+        w = np.ascontiguousarray(solution.w)
+        return (solution.ranking_model.__class__, ties, w.dtype.str, w.shape,
+                hashlib.sha1(w.tostring()).hexdigest())
+
+    def get_ranking(self, solution, ties="random"):
+        """
+        Row indices of all documents, sorted by decreasing score of the
+        solution within each query.
+        """
+        key = self.get_key(solution, ties)
+        ranking = self.rankings.pop(key, None)
+        if ranking is None:
+            self.misses += 1
+            ranking = _sort_collection_by_score(
+                solution.score(self.queries.get_feature_matrix()),
+                self.queries.get_offsets(), ties)
+            if self.size < 1:
+                return ranking
+            if len(self.rankings) >= self.size:
+                # evict the least recently used ranking
+                self.rankings.popitem(last=False)
+        else:
+            self.hits += 1
+        self.rankings[key] = ranking
+        return ranking
+
+    def get_label_ranking(self):
+        """
+        Row indices of all documents, sorted by decreasing label within each
+        query (i.e., the ideal rankings).
+        """
+        if self.label_ranking is None:
+            self.label_ranking = _sort_collection_by_score(
+                self.queries.get_label_vector(), self.queries.get_offsets(),
+                "first")
+        return self.label_ranking
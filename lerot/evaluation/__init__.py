@@ -18,6 +18,7 @@ from DcgEval import DcgEval
 from NdcgEval import NdcgEval
 from LetorNdcgEval import LetorNdcgEval
 from PAKEval import PAKEval
+from RankingCache import RankingCache
 
 from VSEval import VSEval
 from VDEval import VDEval
@@ -37,4 +38,5 @@ __all__ = [
     'RPEval',
     'LivingLabsEval',
     'PAKEval',
+    'RankingCache',
 ]
@@ -19,9 +19,13 @@ import os
 import cStringIO
 import numpy as np
 
-from lerot.query import Queries
+from lerot.query import Queries, QueryCollection
+from lerot.evaluation.DcgEval import DcgEval
 from lerot.evaluation.LetorNdcgEval import LetorNdcgEval
 from lerot.evaluation.NdcgEval import NdcgEval
+from lerot.evaluation.RankingCache import RankingCache
+from lerot.ranker.DeterministicRankingFunction import \
+    DeterministicRankingFunction
 
 
 class TestEvaluation(unittest.TestCase):
@@ -147,6 +151,54 @@ class TestEvaluation(unittest.TestCase):
         self.assertAlmostEquals(0.5081831, ev.evaluate_one(self.zero_weights,
             self.query, ties="last"))
 
+    def testEvaluateCollection(self):
+        counts = np.random.randint(1, 15, size=30)
+        offsets = np.hstack([0, np.cumsum(counts)])
+        # few distinct feature values, so that there are many ties
+        features = np.random.randint(0, 3, size=(offsets[-1],
+            self.test_num_features)).astype(float)
+        labels = np.random.randint(0, 3, size=offsets[-1])
+        labels[offsets[0]:offsets[1]] = 0
+        collection = QueryCollection([str(i) for i in range(len(counts))],
+                                     offsets, features, labels,
+                                     self.test_num_features)
+        solution = DeterministicRankingFunction([None], "random",
+            self.test_num_features, init="1,0.5,0,0,1,0")
+        for ev in [DcgEval(), NdcgEval(), LetorNdcgEval()]:
+            for cutoff in [-1, 3, 100]:
+                for ties in ["first", "last"]:
+                    outcomes = [ev.evaluate_one(solution, query, cutoff, ties)
+                                for query in collection]
+                    batched = ev.evaluate_collection(solution, collection,
+                                                     cutoff, ties)
+                    self.assertTrue(np.allclose(outcomes, batched))
+                    self.assertAlmostEqual(np.mean(outcomes),
+                        ev.evaluate_all(solution, collection, cutoff, ties))
+
+    def testRankingCache(self):
+        offsets = np.array([0, 3, 7])
+        features = np.random.rand(7, self.test_num_features)
+        labels = np.array([0, 1, 2, 1, 0, 0, 1])
+        collection = QueryCollection(["1", "2"], offsets, features, labels,
+                                     self.test_num_features)
+        cache = RankingCache(collection, size=1)
+        evaluations = [(NdcgEval(), -1), (NdcgEval(), 1), (DcgEval(), 2)]
+        solution = DeterministicRankingFunction([None], "random",
+            self.test_num_features)
+        for ev, cutoff in evaluations:
+            ev.set_ranking_cache(cache)
+            self.assertAlmostEqual(ev.evaluate_all(solution, collection,
+                cutoff), np.mean([ev.evaluate_one(solution, query, cutoff)
+                                  for query in collection]))
+        self.assertEqual((1, 2), (cache.misses, cache.hits))
+        # the least recently used ranking is evicted
+        old_w = solution.w
+        solution.update_weights(old_w + 1)
+        evaluations[0][0].evaluate_all(solution, collection)
+        solution.update_weights(old_w)
+        evaluations[0][0].evaluate_all(solution, collection)
+        self.assertEqual((3, 2), (cache.misses, cache.hits))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -14,6 +14,7 @@
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
 import random
+from ..evaluation import RankingCache
 from ..utils import get_class
 
 
@@ -45,7 +46,7 @@ class AbstractLearningExperiment:
             kwargs = {}
             # read in additional arguments
             for i in xrange(1, len(split_args)-1, 2):
-                kwargs[split_args[i]] = int(split_args[i+1])
+                kwargs[split_args[i].lstrip("-")] = int(split_args[i+1])
 
             # Here go default values
             if 'cutoff' not in kwargs:
@@ -55,6 +56,12 @@ class AbstractLearningExperiment:
             eval_name = split_args[0]
             kwargs['eval_class'] = get_class(eval_name)()
             self.evaluations.append((eval_name, kwargs))
+        # rank the test queries once per weight vector for all evaluations
+        self.ranking_cache = RankingCache(self.test_queries,
+                                          args.get("evaluation_cache_size",
+                                                   16))
+        for _, eval_dict in self.evaluations:
+            eval_dict['eval_class'].set_ranking_cache(self.ranking_cache)
         self.queryid = None
 
     def _sample_qid(self, query_keys, query_count, query_length):
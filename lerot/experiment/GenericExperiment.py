@@ -124,6 +124,24 @@ class GenericExperiment:
             self.experiment_args["evaluation"] = "evaluation.NdcgEval"
         if "processes" not in self.experiment_args:
             self.experiment_args["processes"] = 0
+        # offline evaluation schedule, see LearningExperiment
+        if "offline_evaluation_schedule" not in self.experiment_args:
+            self.experiment_args["offline_evaluation_schedule"] = "every"
+        if "offline_evaluation_interval" not in self.experiment_args:
+            self.experiment_args["offline_evaluation_interval"] = 1
+        if "offline_evaluation_checkpoints" not in self.experiment_args:
+            self.experiment_args["offline_evaluation_checkpoints"] = 100
+        if "offline_evaluation_sample" not in self.experiment_args:
+            self.experiment_args["offline_evaluation_sample"] = 0
+        if "evaluation_cache_size" not in self.experiment_args:
+            self.experiment_args["evaluation_cache_size"] = 16
+        if "query_cache" not in self.experiment_args:
+            self.experiment_args["query_cache"] = True
+        # map query features from the cache, so that worker processes share
+        # them instead of each holding a copy (requires the query cache)
+        if "shared_queries" not in self.experiment_args:
+            self.experiment_args["shared_queries"] = \
+                self.experiment_args["processes"] > 1
 
         # locate or create directory for the current fold
         if not os.path.exists(self.experiment_args["output_dir"]):
@@ -157,11 +175,15 @@ class GenericExperiment:
         test_file = self.experiment_args["test_queries"]
         self.feature_count = self.experiment_args["feature_count"]
         logging.info("Loading training data: %s " % training_file)
-        self.training_queries = load_queries(training_file, self.feature_count)
+        self.training_queries = load_queries(training_file, self.feature_count,
+            cache=self.experiment_args["query_cache"],
+            shared=self.experiment_args["shared_queries"])
         logging.info("... found %d queries." %
             self.training_queries.get_size())
         logging.info("Loading test data: %s " % test_file)
-        self.test_queries = load_queries(test_file, self.feature_count)
+        self.test_queries = load_queries(test_file, self.feature_count,
+            cache=self.experiment_args["query_cache"],
+            shared=self.experiment_args["shared_queries"])
         logging.info("... found %d queries." % self.test_queries.get_size())
 
         # initialize and run the experiment num_run times
@@ -175,7 +197,7 @@ class GenericExperiment:
             from multiprocessing import Pool
             pool = Pool(processes=self.experiment_args["processes"])
             results = [
-                pool.apply_async(self._run, (run_count,))
+                pool.apply_async(_run_in_worker, (self, run_count))
                 for run_count in range(self.num_runs)
             ]
             pool.close()
@@ -214,3 +236,9 @@ class GenericExperiment:
             aux_log_fh, self.experiment_args)
 
         return experiment.run()
+
+
+def _run_in_worker(experiment, run_id):
+    # bound methods cannot be pickled, so workers receive the experiment
+    # itself; shared query collections are sent as a reference to their cache
+    return experiment._run(run_id)
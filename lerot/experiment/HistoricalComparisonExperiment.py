@@ -22,11 +22,12 @@ import argparse
 import random
 import yaml
 
-from numpy import log, mean, zeros
+from numpy import arange, lexsort, zeros
 from scipy.stats import kendalltau
 
 from .. import evaluation
-from ..utils import get_class
+from ..utils import (get_class, get_jensen_shannon_divergence,
+                     get_kullback_leibler_divergence, get_l1_norm)
 
 
 class HistoricalComparisonExperiment():
@@ -44,6 +45,10 @@ class HistoricalComparisonExperiment():
         self.result_length = args["result_length"]
         self.num_queries = args["num_queries"]
         self.query_sampling_method = args["query_sampling_method"]
+        # compute the similarities between the ranker pairs for all queries
+        # before the first query is processed
+        self.precompute_similarities = "precompute_similarities" in args \
+            and args["precompute_similarities"]
         self.um_class = get_class(args["user_model"])
         self.um_args = args["user_model_args"]
         self.um = self.um_class(self.um_args)
@@ -152,31 +157,57 @@ class HistoricalComparisonExperiment():
         """get the most likely interleaved list for a given pair of rankers"""
         (docids, probs) = self._get_combined_document_distribution(r1, r2,
             query)
-        tmp = [(prob, docid) for docid, prob in zip(docids, probs)]
-        tmp.sort(reverse=True)
-        l = [docid for prob, docid in tmp]
-        return l
+        return [docids[i] for i in self._get_most_likely_order(probs)]
+
+    def _get_most_likely_order(self, probs):
+        """indexes of the documents by decreasing probability (ties by
+        decreasing index)"""
+        return lexsort((arange(len(probs)), probs))[::-1]
 
     def _get_combined_document_distribution(self, r1, r2, query):
         """get the distribution over documents given a pair of rankers"""
-        r1.init_ranking(query)
-        r2.init_ranking(query)
-        docids = query.get_docids()
-        probs = [r1.get_document_probability(docid) +
-                 r2.get_document_probability(docid) for docid in docids]
-        return (docids, probs)
+        return (query.get_docids(), r1.get_document_distribution(query) +
+                r2.get_document_distribution(query))
 
     def _get_kullback_leibler_divergence(self, probs1, probs2):
-        return sum([p1 * log(p1 / p2) for p1, p2 in zip(probs1, probs2)])
+        return get_kullback_leibler_divergence(probs1, probs2)
 
     def _get_jensen_shannon_divergence(self, probs1, probs2):
-        mean_probs = [mean([p1, p2]) for p1, p2 in zip(probs1, probs2)]
-        return float(
-            .5 * self._get_kullback_leibler_divergence(probs1, mean_probs) +
-            .5 * self._get_kullback_leibler_divergence(probs2, mean_probs))
+        return get_jensen_shannon_divergence(probs1, probs2)
 
     def _get_l1_norm(self, probs1, probs2):
-        return sum([abs(p1 - p2) for p1, p2 in zip(probs1, probs2)])
+        return get_l1_norm(probs1, probs2)
+
+    def _get_similarities(self, queries, src_rankers, tar_rankers):
+        """Kendall tau between the most likely lists of the source and target
+        ranker pairs, and the divergences between their combined document
+        distributions, for each query (by qid)."""
+        taus, src_dists, tar_dists = [], [], []
+        for query in queries:
+            (_, src_dist) = self._get_combined_document_distribution(
+                src_rankers[0], src_rankers[1], query)
+            (_, tar_dist) = self._get_combined_document_distribution(
+                tar_rankers[0], tar_rankers[1], query)
+            # the lists compared as document indexes (the docids of query)
+            k = kendalltau(self._get_most_likely_order(src_dist),
+                           self._get_most_likely_order(tar_dist))
+            if isinstance(k, tuple):
+                k = k[0]
+            taus.append(float(k))
+            src_dists.append(src_dist)
+            tar_dists.append(tar_dist)
+        # compare all distributions at once, padded with zero probabilities
+        # (which do not change the divergences)
+        src = zeros((len(queries), max(len(d) for d in src_dists)))
+        tar = zeros(src.shape)
+        for i, (src_dist, tar_dist) in enumerate(zip(src_dists, tar_dists)):
+            src[i, :len(src_dist)] = src_dist
+            tar[i, :len(tar_dist)] = tar_dist
+        return dict(zip([query.get_qid() for query in queries], zip(taus,
+            self._get_kullback_leibler_divergence(src, tar).tolist(),
+            self._get_kullback_leibler_divergence(tar, src).tolist(),
+            self._get_jensen_shannon_divergence(src, tar).tolist(),
+            self._get_l1_norm(src, tar).tolist())))
 
     def run(self):
         """Run the experiment for num_queries queries."""
@@ -207,6 +238,12 @@ class HistoricalComparisonExperiment():
         for method_id in self.hist_methods:
             hist_outcomes[method_id] = []
             hist_click_counts[method_id] = []
+        # similarities between the ranker pairs, per qid
+        similarities = {}
+        if self.precompute_similarities:
+            similarities = self._get_similarities(
+                [self.queries[qid] for qid in query_keys], prob_src_rankers,
+                prob_tar_rankers)
         # process num_queries queries
         for query_count in range(self.num_queries):
             qid = self._sample_qid(query_keys, query_count, query_length)
@@ -219,32 +256,15 @@ class HistoricalComparisonExperiment():
             ndcg_diffs.append(float(o2 - o1))
             # compute similarities between ranker pairs (for probabilistic
             # rankers)
-            most_likely_source_list = self._get_most_likely_list(
-                prob_src_rankers[0], prob_src_rankers[1], query)
-            most_likely_target_list = self._get_most_likely_list(
-                prob_tar_rankers[0], prob_tar_rankers[1], query)
-            k = kendalltau(most_likely_source_list, most_likely_target_list)
-            if isinstance(k, tuple):
-                k = k[0]
-            per_query_kendalltau.append(float(k))
-            (_, combined_source_dist) = \
-                self._get_combined_document_distribution(prob_src_rankers[0],
-                    prob_src_rankers[1], query)
-            (_, combined_target_dist) = \
-                self._get_combined_document_distribution(prob_tar_rankers[0],
-                    prob_tar_rankers[1], query)
-            per_query_kullback_leibler_src.append(float(
-                self._get_kullback_leibler_divergence(combined_source_dist,
-                                                      combined_target_dist)))
-            per_query_kullback_leibler_tar.append(float(
-                self._get_kullback_leibler_divergence(combined_target_dist,
-                                                      combined_source_dist)))
-            per_query_jensen_shannon.append(float(
-                self._get_jensen_shannon_divergence(combined_source_dist,
-                                                    combined_target_dist)))
-            per_query_l1_norm.append(float(
-                self._get_l1_norm(combined_source_dist,
-                                        combined_target_dist)))
+            if qid not in similarities:
+                similarities.update(self._get_similarities([query],
+                    prob_src_rankers, prob_tar_rankers))
+            (k, kl_src, kl_tar, js, l1) = similarities[qid]
+            per_query_kendalltau.append(k)
+            per_query_kullback_leibler_src.append(kl_src)
+            per_query_kullback_leibler_tar.append(kl_tar)
+            per_query_jensen_shannon.append(js)
+            per_query_l1_norm.append(l1)
             # apply live methods (use target rankers only)
             for method_id, method in self.live_methods.items():
                 ranker_pairs = \
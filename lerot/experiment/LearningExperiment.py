@@ -22,9 +22,12 @@ lists
 
 import sys
 import logging
+import random
 import warnings
+import numpy as np
 from numpy.linalg import norm
 
+from ..evaluation import RankingCache
 from ..utils import get_cosine_similarity
 from AbstractLearningExperiment import AbstractLearningExperiment
 
@@ -34,8 +37,76 @@ class LearningExperiment(AbstractLearningExperiment):
     Represents an experiment in which a retrieval system learns from
     implicit user feedback. The experiment is initialized as specified in the
     provided arguments, or config file.
+
+    Offline performance is evaluated after the queries given by the
+    offline_evaluation_schedule: "every" offline_evaluation_interval queries,
+    or at offline_evaluation_checkpoints "log"-spaced queries. If
+    offline_evaluation_sample is set, the evaluations during learning use a
+    sample of that many (or that fraction of) test queries, stratified by
+    their highest relevance label (all test queries if the sample would hold
+    as many). The final weights are always evaluated on all test queries.
     """
 
+    def __init__(self, training_queries, test_queries, feature_count, log_fh,
+                 args):
+        AbstractLearningExperiment.__init__(self, training_queries,
+            test_queries, feature_count, log_fh, args)
+        # the defaults of GenericExperiment, for experiments that are not
+        # created through it
+        self.offline_checkpoints = self._get_offline_checkpoints(
+            args.get("offline_evaluation_schedule", "every"),
+            args.get("offline_evaluation_interval", 1),
+            args.get("offline_evaluation_checkpoints", 100))
+        self.offline_test_queries = self.test_queries
+        if args.get("offline_evaluation_sample", 0):
+            self.offline_test_queries = self._sample_test_queries(
+                args["offline_evaluation_sample"])
+            self.offline_ranking_cache = RankingCache(
+                self.offline_test_queries,
+                args.get("evaluation_cache_size", 16))
+            for _, eval_dict in self.evaluations:
+                eval_dict['eval_class'].set_ranking_cache(
+                    self.offline_ranking_cache)
+
+    def _get_offline_checkpoints(self, schedule, interval, checkpoints):
+        """indices of the queries after which offline performance is
+        evaluated, always including the first and the last query"""
+        if schedule == "every":
+            indices = range(0, self.num_queries, interval)
+        elif schedule == "log":
+            indices = np.logspace(0, np.log10(self.num_queries), checkpoints)
+            indices = np.round(indices).astype(int) - 1
+        else:
+            raise ValueError("Unknown offline evaluation schedule: %s" %
+                             schedule)
+        return sorted(set(indices) | set([0, self.num_queries - 1]))
+
+    def _sample_test_queries(self, sample_size):
+        """stratified sample of test queries, stratified by the highest
+        relevance label of each query"""
+        offsets = self.test_queries.get_offsets()
+        max_labels = np.maximum.reduceat(self.test_queries.get_label_vector(),
+                                         offsets[:-1])
+        if sample_size < 1:
+            sample_size *= len(max_labels)
+        if sample_size >= len(max_labels):
+            # the sample would hold all test queries
+            return self.test_queries
+        indices = []
+        for label in np.unique(max_labels):
+            stratum = np.flatnonzero(max_labels == label).tolist()
+            size = int(round(sample_size * len(stratum) / len(max_labels)))
+            indices.extend(random.sample(stratum,
+                                         min(len(stratum), max(1, size))))
+        return self.test_queries.get_subset(sorted(indices))
+
+    def _evaluate_offline(self, solution, queries, offline_evaluation):
+        for eval_name, eval_dict in self.evaluations:
+            dict_name = eval_name + '@' + str(eval_dict['cutoff'])
+            offline_evaluation[dict_name].append(float(
+                eval_dict['eval_class'].evaluate_all(solution, queries,
+                                                     eval_dict['cutoff'])))
+
     def run(self):
         """
         A single run of the experiment.
@@ -57,6 +128,8 @@ class LearningExperiment(AbstractLearningExperiment):
             offline_test_evaluation[dict_name] = []
             # offline_train_evaluation[dict_name] = []
         similarities = [.0]
+        offline_checkpoints = set(self.offline_checkpoints)
+        evaluated_w = None
 
         # Process queries
         for query_count in xrange(self.num_queries):
@@ -79,29 +152,30 @@ class LearningExperiment(AbstractLearningExperiment):
             # send feedback to system
             current_solution = self.system.update_solution(clicks)
 
-            # compute current offline performance (over all documents)
-            for eval_name, eval_dict in self.evaluations:
-                # Create dict name as done above
-                dict_name = eval_name + '@' + str(eval_dict['cutoff'])
-                if (not (previous_solution_w == current_solution.w).all()) or \
-                        len(offline_test_evaluation[dict_name]) == 0:
-                    e1 = eval_dict['eval_class'].evaluate_all(
-                        current_solution, self.test_queries,
-                        eval_dict['cutoff'])
-                    # e2 = eval_dict['eval_class'].evaluate_all(
-                    #     current_solution, self.training_queries,
-                    #     eval_dict['cutoff'])
-                    offline_test_evaluation[dict_name].append(float(e1))
-                    # offline_train_evaluation[dict_name].append(float(e2))
+            # compute offline performance (over all documents) at the
+            # scheduled checkpoints, the final weights are evaluated below
+            if query_count in offline_checkpoints and \
+                    query_count < self.num_queries - 1:
+                if evaluated_w is not None and \
+                        (evaluated_w == current_solution.w).all():
+                    for eval_name, eval_dict in self.evaluations:
+                        dict_name = eval_name + '@' + str(eval_dict['cutoff'])
+                        offline_test_evaluation[dict_name].append(
+                            offline_test_evaluation[dict_name][-1])
                 else:
-                    offline_test_evaluation[dict_name].append(
-                                    offline_test_evaluation[dict_name][-1])
-                    # offline_train_evaluation[dict_name].append(
-                    #                 offline_train_evaluation[dict_name][-1])
+                    self._evaluate_offline(current_solution,
+                        self.offline_test_queries, offline_test_evaluation)
+                    evaluated_w = current_solution.w.copy()
 
             similarities.append(float(get_cosine_similarity(
                 previous_solution_w, current_solution.w)))
 
+        # exact evaluation of the final weights, on all test queries
+        for _, eval_dict in self.evaluations:
+            eval_dict['eval_class'].set_ranking_cache(self.ranking_cache)
+        self._evaluate_offline(current_solution, self.test_queries,
+                               offline_test_evaluation)
+
         # Print new line for the next run
         sys.stdout.write('\nDone')
         sys.stdout.write('\n')
@@ -110,6 +184,13 @@ class LearningExperiment(AbstractLearningExperiment):
         # Finalize evaluation measures after training is done
         summary = {"weight_sim": similarities, "final_weights":
                    previous_solution_w.tolist()}
+        # record the schedule, so that analysis tools can interpolate
+        if len(self.offline_checkpoints) < self.num_queries:
+            summary["offline_evaluation_checkpoints"] = \
+                [int(i) for i in self.offline_checkpoints]
+        if self.offline_test_queries is not self.test_queries:
+            summary["offline_evaluation_sample"] = \
+                self.offline_test_queries.get_qids()
         for eval_name, eval_dict in self.evaluations:
             dict_name = eval_name + '@' + str(eval_dict['cutoff'])
             logging.info("Final offline %s = %.3f" % (dict_name,
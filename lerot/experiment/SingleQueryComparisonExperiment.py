@@ -21,11 +21,12 @@ import logging
 import os.path
 import yaml
 
-from numpy import asarray, log, mean, where, zeros
+from numpy import arange, asarray, lexsort, where, zeros
 from random import choice, randint
 from scipy.stats.stats import kendalltau
 
-from ..utils import get_class
+from ..utils import (get_class, get_jensen_shannon_divergence,
+                     get_kullback_leibler_divergence, get_l1_norm)
 from ..evaluation import NdcgEval
 from ..query import load_queries
 
@@ -237,31 +238,23 @@ class SingleQueryComparisonExperiment():
         """get the most likely interleaved list for a given pair of rankers"""
         (docids, probs) = self._get_combined_document_distribution(r1, r2,
             query)
-        tmp = [(prob, docid) for docid, prob in zip(docids, probs)]
-        tmp.sort(reverse=True)
-        l = [docid for prob, docid in tmp]
-        return l
+        # by decreasing probability, ties by decreasing index
+        return [docids[i] for i in lexsort((arange(len(probs)),
+                                            probs))[::-1]]
 
     def _get_combined_document_distribution(self, r1, r2, query):
         """get the distribution over documents given a pair of rankers"""
-        r1.init_ranking(query)
-        r2.init_ranking(query)
-        docids = query.get_docids()
-        probs = [r1.get_document_probability(docid) +
-                 r2.get_document_probability(docid) for docid in docids]
-        return (docids, probs)
+        return (query.get_docids(), r1.get_document_distribution(query) +
+                r2.get_document_distribution(query))
 
     def _get_kullback_leibler_divergence(self, probs1, probs2):
-        return sum([p1 * log(p1 / p2) for p1, p2 in zip(probs1, probs2)])
+        return get_kullback_leibler_divergence(probs1, probs2)
 
     def _get_jensen_shannon_divergence(self, probs1, probs2):
-        mean_probs = [mean([p1, p2]) for p1, p2 in zip(probs1, probs2)]
-        return float(
-            .5 * self._get_kullback_leibler_divergence(probs1, mean_probs) +
-            .5 * self._get_kullback_leibler_divergence(probs2, mean_probs))
+        return get_jensen_shannon_divergence(probs1, probs2)
 
     def _get_l1_norm(self, probs1, probs2):
-        return sum([abs(p1 - p2) for p1, p2 in zip(probs1, probs2)])
+        return get_l1_norm(probs1, probs2)
 
     def run(self):
         """Run the experiment for num_queries queries."""
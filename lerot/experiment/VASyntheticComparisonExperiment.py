@@ -322,16 +322,17 @@ class VASyntheticComparisonExperiment():
                             self.rankers[0].getDocs(), self.rankers[1].getDocs())
                     traceback.print_exc()
                     continue
-                for (interleaved, a) in n_interleavings:
-                    # record outcomes and number of clicks
-                    output["outcomes"][method_id].append(
-                        method["instance"].infer_outcome(
-                            [x.get_id() for x in interleaved],
-                            a,
-                            self.um.get_clicks(interleaved, labels, orientation=orientations),
-                            None
-                        )
+                # record outcomes and number of clicks
+                output["outcomes"][method_id].extend(
+                    method["instance"].infer_outcome_batch(
+                        [([x.get_id() for x in interleaved], a)
+                         for (interleaved, a) in n_interleavings],
+                        [self.um.get_clicks(interleaved, labels, orientation=orientations)
+                         for (interleaved, _) in n_interleavings],
+                        None
                     )
+                )
+                for (interleaved, a) in n_interleavings:
                     if self.compute_interleaved_metrics:
                         block_cnts = VASyntheticComparisonExperiment.block_counts(interleaved)
                         block_szs = VASyntheticComparisonExperiment.block_sizes(interleaved)
@@ -22,12 +22,16 @@ format, both sequentially and in batch mode.
 import sys
 import gc
 import gzip
+import logging
 import numpy as np
 import os.path
 import requests
+import shutil
+import tempfile
 from .document import Document
 import time
-__all__ = ['Query', 'Queries', 'QueryStream', 'load_queries', 'write_queries']
+__all__ = ['Query', 'Queries', 'QueryCollection', 'QueryStream',
+           'load_queries', 'write_queries']
 
 
 
@@ -75,10 +79,10 @@ class Query:
         self.__qid__ = qid
         self.__feature_vectors__ = feature_vectors
         self.__labels__ = labels
-        self.__docids__ = [Document(x) for x in range(len(labels))]
+        # created on first access, many queries are never ranked
+        self.__docids__ = None
         self.__comments__ = comments
-        
-        
+
     def has_ideal(self):
         return not self.__ideal__ is None
 
@@ -92,10 +96,13 @@ class Query:
         return self.__qid__
 
     def get_docids(self):
+        if self.__docids__ is None:
+            self.__docids__ = [Document(x) for x in
+                               range(len(self.__labels__))]
         return self.__docids__
 
     def get_document_count(self):
-        return len(self.__docids__)
+        return len(self.__labels__)
 
     def get_feature_vectors(self):
         return self.__feature_vectors__
@@ -138,7 +145,7 @@ class Query:
         self.__predictions__ = predictions
 
     def write_to(self, fh, sparse=False):
-        for doc in self.__docids__:
+        for doc in self.get_docids():
             features = [':'.join((repr(pos + 1),
                 repr(value))) for pos, value in enumerate(
                 self.get_feature_vector(doc)) if not (value == 0 and sparse)]
@@ -169,11 +176,12 @@ class QueryStream:
     # takes self and number of expected features
     # returns qid and features, one query at a time
     def next(self):
+        """Read the lines of the next query as one block, then tokenize the
+        block and fill preallocated feature and label buffers at once."""
         prev = None
-        instances = None
-        targets = None
-        comments = None
-        initialized = False
+        targets = []
+        feature_strs = []
+        comments = []
         while self.__reader__.has_next():
             line = self.__reader__.next()
             line = line.rstrip("\n")
@@ -181,7 +189,7 @@ class QueryStream:
             if line.startswith("# qid "):
                 # if we have already read a query - break
                 # don't need to rewind, we'll just skip the comment next time
-                if initialized:
+                if prev is not None:
                     break
                 # otherwise just start reading
                 else:
@@ -190,12 +198,12 @@ class QueryStream:
             if line.startswith("#"):
                 continue
             comment = ""
-            if line.find("#") >= 0:
-                comment_index = line.find("#")
+            comment_index = line.find("#")
+            if comment_index >= 0:
                 comment = line[comment_index:]
                 line = line[:comment_index]
-            # extract target and features
-            tokens = line.split()
+            # extract target and qid, keep the features for block parsing
+            tokens = line.split(None, 2)
             if not tokens:
                 continue
             target = int(tokens[0])
@@ -208,28 +216,17 @@ class QueryStream:
             if qid != prev:
                 self.__reader__.rewind()
                 break
-            features = [tuple(t.split(":")) for t in tokens[2:]]
-            tmp_array = np.zeros((1, self.__num_features__))
-            for k, v in features:
-                tmp_array[0, int(k) - 1] = float(v)
-            if not initialized:
-                instances = tmp_array
-                targets = np.array([target])
-                if self.__preserve_comments__:
-                    comments = [comment]
-                initialized = True
-            else:
-                instances = np.vstack((instances, tmp_array))
-
-                targets = np.hstack((targets, target))
-                if self.__preserve_comments__:
-                    comments.append(comment)
+            targets.append(target)
+            feature_strs.append(tokens[2] if len(tokens) > 2 else "")
+            comments.append(comment)
 
-        if not initialized:
+        if prev is None:
             raise StopIteration
-        else:
-            #(qid, [[featuresDoc1], [featuresDocN], targets, comments])
-            return Query(prev, instances, targets, comments)
+        instances = _parse_feature_block(feature_strs, self.__num_features__)
+        if not self.__preserve_comments__:
+            comments = None
+        #(qid, [[featuresDoc1], [featuresDocN], targets, comments])
+        return Query(prev, instances, np.array(targets), comments)
 
     # read all queries from a file at once
     def read_all(self):
@@ -239,6 +236,23 @@ class QueryStream:
         return queries
 
 
+def _parse_feature_block(feature_strs, num_features):
+    """Parse the "index:value" feature strings of all documents of a query
+    into a dense (documents x features) matrix in a single pass."""
+    instances = np.zeros((len(feature_strs), num_features))
+    counts = [s.count(":") for s in feature_strs]
+    num_pairs = sum(counts)
+    if num_pairs == 0:
+        return instances
+    pairs = np.fromstring(" ".join(feature_strs).replace(":", " "), sep=" ")
+    if pairs.size != 2 * num_pairs:
+        raise ValueError("Could not parse features: %s" % feature_strs)
+    pairs = pairs.reshape((num_pairs, 2))
+    rows = np.repeat(np.arange(len(feature_strs)), counts)
+    instances[rows, pairs[:, 0].astype(int) - 1] = pairs[:, 1]
+    return instances
+
+
 class Queries:
     """a list of queries with some convenience functions"""
     __num_features__ = 0
@@ -249,9 +263,12 @@ class Queries:
     __feature_vectors__ = None
     __labels__ = None
 
-    def __init__(self, fh, num_features, preserve_comments=False):
-        self.__queries__ = QueryStream(fh, num_features,
-            preserve_comments).read_all()
+    def __init__(self, fh, num_features, preserve_comments=False,
+                 queries=None):
+        if queries is None:
+            queries = QueryStream(fh, num_features,
+                preserve_comments).read_all()
+        self.__queries__ = queries
 
         self.__num_features__ = num_features
 
@@ -304,6 +321,111 @@ class Queries:
 
 
 
+class QueryCollection(Queries):
+    """Queries stored as one contiguous feature matrix and label vector. Each
+    query is a view on the rows between its qid offsets, so that no per-query
+    arrays are allocated and computations can be batched over all queries."""
+
+    # (filename, features, preserve_comments) of a collection that is
+    # memory-mapped from its cache, see load_queries
+    __shared_source__ = None
+
+    def __init__(self, qids, offsets, feature_vectors, labels, num_features,
+                 comments=None):
+        self.__qid_list__ = list(qids)
+        self.__offsets__ = np.asarray(offsets)
+        self.__feature_matrix__ = feature_vectors
+        self.__label_vector__ = labels
+        self.__comment_list__ = comments
+        queries = {}
+        for i, qid in enumerate(self.__qid_list__):
+            start, end = self.__offsets__[i], self.__offsets__[i + 1]
+            queries[qid] = Query(qid, feature_vectors[start:end],
+                                 labels[start:end],
+                                 None if comments is None else
+                                 comments[start:end])
+        Queries.__init__(self, None, num_features, queries=queries)
+
+    def __iter__(self):
+        # iterate in storage order, so that batched results line up
+        return (self.__queries__[qid] for qid in self.__qid_list__)
+
+    def values(self):
+        return list(self)
+
+    def get_qids(self):
+        """qids in storage order"""
+        return self.__qid_list__
+
+    def get_offsets(self):
+        """row offsets of the queries, query i spans rows
+        offsets[i]:offsets[i + 1]"""
+        return self.__offsets__
+
+    def get_feature_matrix(self):
+        return self.__feature_matrix__
+
+    def get_label_vector(self):
+        return self.__label_vector__
+
+    def get_comment_list(self):
+        return self.__comment_list__
+
+    def get_subset(self, indices):
+        """A new QueryCollection holding (a copy of) the queries at the given
+        positions in storage order."""
+        indices = np.asarray(indices, dtype=int)
+        starts = self.__offsets__[indices]
+        counts = self.__offsets__[indices + 1] - starts
+        offsets = np.hstack([0, np.cumsum(counts)]).astype(int)
+        # row j of the subset is row starts[q] + j - offsets[q] of this
+        # collection, where q is the selected query that contains row j
+        rows = np.repeat(starts - offsets[:-1], counts) + \
+            np.arange(offsets[-1])
+        comments = None
+        if self.__comment_list__ is not None:
+            comments = [self.__comment_list__[row] for row in rows]
+        return QueryCollection([self.__qid_list__[i] for i in indices],
+                               offsets,
+                               self.__feature_matrix__[rows],
+                               self.__label_vector__[rows],
+                               self.__num_features__, comments)
+
+    def __getstate__(self):
+        # shared collections are pickled by reference to their cache, so that
+        # worker processes map the same file instead of receiving a copy
+        if self.__shared_source__ is not None:
+            return {"__shared_source__": self.__shared_source__}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "__shared_source__" in state and len(state) == 1:
+            filename, features, preserve_comments = state["__shared_source__"]
+            state = load_queries(filename, features, preserve_comments,
+                                 cache=True, shared=True).__dict__
+        self.__dict__.update(state)
+
+
+def _collect_queries(queries, num_features, preserve_comments=False):
+    """Pack the queries of a Queries object into a QueryCollection."""
+    query_list = queries.values()
+    offsets = np.cumsum([0] + [q.get_document_count() for q in query_list])
+    if query_list:
+        feature_vectors = np.vstack([q.get_feature_vectors()
+                                     for q in query_list])
+        labels = np.hstack([q.get_labels() for q in query_list])
+    else:
+        feature_vectors = np.zeros((0, num_features))
+        labels = np.zeros(0, dtype=int)
+    comments = None
+    if preserve_comments:
+        comments = []
+        for q in query_list:
+            comments.extend(q.get_comments())
+    return QueryCollection([q.get_qid() for q in query_list], offsets,
+                           feature_vectors, labels, num_features, comments)
+
+
 class LivingLabsQueries(Queries):
     __KEY__ = ''
     __HOST__ = "http://living-labs.net:5000/api"
@@ -420,16 +542,127 @@ def load_livinglabs_queries(key):
 
 
 
-def load_queries(filename, features, preserve_comments=False):
-    """Utility method for loading queries from a file."""
+def _get_query_cache_dir(filename, features):
+    """Directory in which the binary cache of a query file is stored."""
+    return "%s.%d.cache" % (filename, features)
+
+
+def _get_query_cache_key(filename, features):
+    return "%s\n%r\n%d\n" % (os.path.abspath(filename),
+                              os.path.getmtime(filename), features)
+
+
+def _read_query_cache(filename, features, preserve_comments=False,
+                      mmap_mode="c"):
+    """Load queries from the binary cache of a query file. Returns None if
+    there is no cache, or if it is stale (the file path, modification time or
+    feature count changed). With the default mmap_mode "c" the features are
+    mapped copy-on-write, with "r" they are read-only."""
+    cache_dir = _get_query_cache_dir(filename, features)
+    try:
+        with open(os.path.join(cache_dir, "key.txt")) as key_fh:
+            if key_fh.read() != _get_query_cache_key(filename, features):
+                return None
+        comments = None
+        if preserve_comments:
+            comments_file = os.path.join(cache_dir, "comments.npy")
+            if not os.path.exists(comments_file):
+                return None
+            comments = np.load(comments_file).tolist()
+        qids = np.load(os.path.join(cache_dir, "qids.npy")).tolist()
+        offsets = np.load(os.path.join(cache_dir, "offsets.npy"))
+        labels = np.load(os.path.join(cache_dir, "labels.npy"))
+        feature_vectors = np.load(os.path.join(cache_dir, "features.npy"),
+                                  mmap_mode=mmap_mode)
+    except (IOError, OSError, ValueError):
+        return None
+    return QueryCollection(qids, offsets, feature_vectors, labels, features,
+                           comments)
+
+
+def _write_query_cache(filename, features, queries):
+    """Store a QueryCollection, i.e., one contiguous feature matrix, plus
+    labels, qid offsets and (optionally) comments, in the cache directory of a
+    query file. An existing (stale) cache is replaced."""
+    cache_dir = _get_query_cache_dir(filename, features)
+    key = _get_query_cache_key(filename, features)
+    tmp_dir = tempfile.mkdtemp(prefix=os.path.basename(cache_dir) + ".",
+                               dir=os.path.dirname(os.path.abspath(cache_dir)))
+    try:
+        np.save(os.path.join(tmp_dir, "qids.npy"),
+                np.array(queries.get_qids()))
+        np.save(os.path.join(tmp_dir, "offsets.npy"), queries.get_offsets())
+        np.save(os.path.join(tmp_dir, "labels.npy"),
+                queries.get_label_vector())
+        np.save(os.path.join(tmp_dir, "features.npy"),
+                queries.get_feature_matrix())
+        if queries.get_comment_list() is not None:
+            np.save(os.path.join(tmp_dir, "comments.npy"),
+                    np.array(queries.get_comment_list()))
+        with open(os.path.join(tmp_dir, "key.txt"), "w") as key_fh:
+            key_fh.write(key)
+        if os.path.exists(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.rename(tmp_dir, cache_dir)
+    finally:
+        # only left behind if writing failed, or another process was faster
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+
+
+def load_queries(filename, features, preserve_comments=False, cache=False,
+                 shared=False):
+    """Utility method for loading queries from a file into a QueryCollection.
+    If cache is True, the queries are memory-mapped from a binary cache next
+    to the file when the cache is up to date, and the cache is (re)built
+    otherwise (experiments enable this with their query_cache option).
+
+    If shared is True as well, the features are mapped read-only. All
+    processes that load the same file then share one copy of the features in
+    the page cache, and the collection is pickled as a reference to the
+    cache rather than by value. If the cache cannot be written, the queries
+    are loaded without sharing them."""
+    if shared and cache:
+        queries = _read_query_cache(filename, features, preserve_comments,
+                                    mmap_mode="r")
+        if queries is None:
+            queries = load_queries(filename, features, preserve_comments,
+                                   cache=False)
+            try:
+                _write_query_cache(filename, features, queries)
+            except (IOError, OSError) as e:
+                logging.warn("Could not write query cache for %s, the "
+                             "queries are not shared: %s" % (filename, e))
+                return queries
+            shared_queries = _read_query_cache(filename, features,
+                                               preserve_comments,
+                                               mmap_mode="r")
+            if shared_queries is None:
+                logging.warn("Could not map query cache for %s, the queries "
+                             "are not shared" % filename)
+                return queries
+            queries = shared_queries
+        queries.__shared_source__ = (filename, features, preserve_comments)
+        return queries
+    if cache:
+        queries = _read_query_cache(filename, features, preserve_comments)
+        if queries is not None:
+            return queries
     if filename.endswith(".gz"):
         fh = gzip.open(filename)
     else:
         fh = open(filename)
     gc.disable()
-    queries = Queries(fh, features, preserve_comments)
+    queries = _collect_queries(Queries(fh, features, preserve_comments),
+                              features, preserve_comments)
     gc.enable()
     fh.close()
+    if cache and len(queries):
+        try:
+            _write_query_cache(filename, features, queries)
+        except (IOError, OSError) as e:
+            logging.warn("Could not write query cache for %s: %s" %
+                         (filename, e))
     return queries
 
 
@@ -13,12 +13,22 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-from ..utils import get_class
+import copy
+
+import numpy as np
+
+from ..utils import get_class, get_positions
 
 
 class AbstractRankingFunction:
     """Abstract base class for ranking functions."""
 
+    # shared cache of rankings, see set_ranking_cache
+    ranking_cache = None
+    # attributes set by init_ranking (and changed while ranking), not shared
+    # with candidates, see get_candidate
+    ranking_state = ("qid",)
+
     def __init__(self,
                  ranker_arg_str,
                  ties,
@@ -47,6 +57,40 @@ class AbstractRankingFunction:
     def score(self, features):
         return self.ranking_model.score(features, self.w.transpose())
 
+    def get_candidate(self, w):
+        """A ranker with weights w that shares the ranking model, the
+        configuration and the ranking cache of this ranker. Only the weights
+        and the ranking state are its own (call init_ranking before ranking
+        with it)."""
+        candidate = copy.copy(self)
+        for name in self.ranking_state:
+            candidate.__dict__.pop(name, None)
+        candidate.dirty = True
+        candidate.update_weights(w)
+        return candidate
+
+    def set_ranking_cache(self, ranking_cache):
+        """Reuse the scores and rankings of init_ranking for recurring
+        weights and queries (a QueryRankingCache, or None)."""
+        self.ranking_cache = ranking_cache
+
+    def _get_cached(self, query, name, compute):
+        if self.ranking_cache is None:
+            return compute()
+        return self.ranking_cache.get(self, query, name, compute)
+
+    def get_scores(self, query, scores=None):
+        """scores of the documents of query under the current weights (if
+        they are not given, e.g., computed by init_rankings)"""
+        def compute():
+            computed = np.array(self.ranking_model.score(
+                query.get_feature_vectors(), self.w.transpose())
+                if scores is None else scores, dtype=float)
+            # may be shared through the ranking cache
+            computed.flags.writeable = False
+            return computed
+        return self._get_cached(query, "scores", compute)
+
     def get_candidate_weight(self, delta):
         """Delta is a change parameter: how much are your weights affected by
         the weight change?"""
@@ -54,7 +98,9 @@ class AbstractRankingFunction:
         u = self.sample(self.ranking_model.get_feature_count())
         return self.w + delta * u, u
 
-    def init_ranking(self, query):
+    def init_ranking(self, query, scores=None):
+        """Start ranking the documents of query (with the given document
+        scores, if the ranker is based on a ranking model)."""
         self.dirty = False
         raise NotImplementedError("Derived class needs to implement "
             "init_ranking.")
@@ -96,6 +142,26 @@ class AbstractRankingFunction:
             i += 1
         return docs
 
+    def get_document_weights(self):
+        """Remaining documents in rank order, and the weights next() draws
+        them with (proportionally, among the remaining documents), or None if
+        next() produces them in rank order."""
+        return self.getDocs(), None
+
+    def get_document_distribution(self, query):
+        """Probability of each document of query (in query order) to be the
+        first document produced after init_ranking(query)."""
+        self.init_ranking(query)
+        docids, weights = self.get_document_weights()
+        positions = get_positions(docids, query.get_docids())
+        probs = np.zeros(query.get_document_count())
+        if weights is None:
+            # documents are produced in rank order
+            probs[positions[:1]] = 1.
+        else:
+            probs[positions] = weights / weights.sum()
+        return probs
+
     def rm_document(self, docid):
         raise NotImplementedError("Derived class needs to implement "
             "rm_document.")
@@ -110,3 +176,28 @@ class AbstractRankingFunction:
             self.w = w
         else:
             self.w = self.w + alpha * w
+
+
+def init_rankings(rankers, query):
+    """init_ranking(query) for each of the rankers. The documents are scored
+    at once for all rankers whose ranking models have the same settings (see
+    AbstractRankingModel.get_settings and score_many)."""
+    groups = {}
+    for i, r in enumerate(rankers):
+        model = getattr(r, "ranking_model", None)
+        if model is not None:
+            groups.setdefault(model.get_settings(), []).append(i)
+    scores = [None] * len(rankers)
+    for indexes in groups.values():
+        if len(indexes) < 2:
+            continue
+        W = np.vstack([rankers[i].w for i in indexes])
+        group_scores = rankers[indexes[0]].ranking_model.score_many(
+            query.get_feature_vectors(), W)
+        for column, i in enumerate(indexes):
+            scores[i] = group_scores[:, column]
+    for r, r_scores in zip(rankers, scores):
+        if r_scores is None:
+            r.init_ranking(query)
+        else:
+            r.init_ranking(query, r_scores)
@@ -14,38 +14,82 @@
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
 from random import randint
+import numpy as np
 
 from .AbstractRankingFunction import AbstractRankingFunction
-from ..utils import rank
+from ..utils import sort_with_ties
 
 
 class DeterministicRankingFunction(AbstractRankingFunction):
+    """Ranks documents by decreasing score. Only the top_k documents are
+    ranked when a ranking is initialized; the remaining documents are ranked
+    when they are requested (by next(), getDocs() or get_ranking())."""
 
-    def init_ranking(self, query):
+    top_k = 10
+    ranking_state = AbstractRankingFunction.ranking_state + (
+        "query_docids", "scores", "pos", "ranked", "unranked")
+
+    def init_ranking(self, query, scores=None):
         self.dirty = False
 
         self.qid = query.get_qid()
-        scores = self.ranking_model.score(query.get_feature_vectors(),
-                                          self.w.transpose())
-        ranks = rank(scores, reverse=False, ties=self.ties)
-        # sort documents by ranks, ties are broken at random by default
-        ranked_docids = []
-        for pos, docid in enumerate(query.get_docids()):
-            ranked_docids.append((ranks[pos], docid))
-        ranked_docids.sort(reverse=True)
-        self.docids = [docid for (_, docid) in ranked_docids]
+        self.query_docids = query.get_docids()
+        self.scores = self.get_scores(query, scores)
+        n = len(self.query_docids)
+        # ranked documents (including those already returned by next()),
+        # the position of the next document, and the indexes of the documents
+        # that have not been ranked yet (all of which rank below self.ranked)
+        self.pos = 0
+        if self.ranking_cache is not None and self.ties != "random":
+            # the complete ranking is shared through the cache (random ties
+            # are broken anew for each ranking)
+            self.ranked = list(self._get_cached(query, "ranking",
+                lambda: tuple(self.query_docids[i] for i in sort_with_ties(
+                    self.scores, self.ties, reverse=True)[0])))
+            self.unranked = np.arange(0)
+        else:
+            self.ranked = []
+            self.unranked = np.arange(n)
+            self._rank_more(self.top_k)
+
+    def _rank_more(self, count=None):
+        """rank at least count (or all) of the remaining unranked documents"""
+        unranked = self.unranked
+        if count is not None and count < len(unranked):
+            # all documents that tie with the count-th best may rank among
+            # the next count documents, depending on the tie breaking
+            scores = self.scores[unranked]
+            threshold = scores[np.argpartition(-scores, count - 1)[count - 1]]
+            head = unranked[scores >= threshold]
+            self.unranked = unranked[scores < threshold]
+        else:
+            head = unranked
+            self.unranked = unranked[:0]
+        # head is in document order, so ties are broken as in sort_with_ties
+        order, _ = sort_with_ties(self.scores[head], self.ties, reverse=True)
+        self.ranked.extend(self.query_docids[i] for i in head[order])
+
+    def _get_ranked(self, count=None):
+        """make sure that (at least) the next count documents are ranked"""
+        while len(self.unranked) and (count is None or
+                                      len(self.ranked) - self.pos < count):
+            self._rank_more(None if count is None else
+                            count - len(self.ranked) + self.pos)
 
     def document_count(self):
-        return len(self.docids)
+        return len(self.ranked) - self.pos + len(self.unranked)
 
     def next(self):
         """produce the next document"""
 
         # if there are no more documents
-        if len(self.docids) < 1:
+        if self.document_count() < 1:
             raise Exception("There are no more documents to be selected")
         # otherwise, return highest ranked document
-        return self.docids.pop(0)  # pop first element
+        if self.pos == len(self.ranked):
+            self._rank_more(self.top_k)
+        self.pos += 1
+        return self.ranked[self.pos - 1]
 
     def next_det(self):
         return self.next()
@@ -54,27 +98,56 @@ class DeterministicRankingFunction(AbstractRankingFunction):
         """produce a random next document"""
 
         # if there are no more documents
-        if len(self.docids) < 1:
+        if self.document_count() < 1:
             raise Exception("There are no more documents to be selected")
         # otherwise, return a random document
-        rn = randint(0, len(self.docids) - 1)
-        return self.docids.pop(rn)
+        rn = randint(0, self.document_count() - 1)
+        if rn < len(self.ranked) - self.pos:
+            return self.ranked.pop(self.pos + rn)
+        rn -= len(self.ranked) - self.pos
+        docid = self.query_docids[self.unranked[rn]]
+        self.unranked = np.delete(self.unranked, rn)
+        return docid
+
+    def get_ranking(self):
+        self._get_ranked()
+        return self.ranked[self.pos:]
 
     def get_document_probability(self, docid):
         """get probability of producing doc as the next document drawn"""
-        pos = self.docids.index(docid)
-        return 1.0 if pos == 0 else 0.0
+        self._get_ranked(1)
+        if self.pos < len(self.ranked) and self.ranked[self.pos] == docid:
+            return 1.0
+        self._find(docid)
+        return 0.0
+
+    def _find(self, docid):
+        """position of a remaining document in self.ranked, followed by
+        self.unranked"""
+        try:
+            return self.ranked.index(docid, self.pos)
+        except ValueError:
+            pass
+        if docid in self.query_docids:
+            index = np.flatnonzero(
+                self.unranked == self.query_docids.index(docid))
+            if len(index):
+                return len(self.ranked) + index[0]
+        raise ValueError("%s is not in the list" % docid)
 
     def rm_document(self, docid):
         """remove doc from list of available docs and adjust probabilities"""
         # find position of the document
-        pos = self.docids.index(docid)
-        # delete doc and renormalize
-        self.docids.pop(pos)
+        pos = self._find(docid)
+        if pos < len(self.ranked):
+            self.ranked.pop(pos)
+        else:
+            self.unranked = np.delete(self.unranked, pos - len(self.ranked))
 
     def getDocs(self, numdocs=None):
         """ Copied from StatelessRankingFunction. """
+        self._get_ranked(numdocs)
         if numdocs is None:
-            return self.docids
+            return self.ranked[self.pos:]
         else:
-            return self.docids[:numdocs]
\ No newline at end of file
+            return self.ranked[self.pos:self.pos + numdocs]
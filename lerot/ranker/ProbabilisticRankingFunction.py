@@ -13,36 +13,112 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
+from bisect import bisect_left, insort
+import copy
 from random import random, randint
 import numpy as np
 
 from .AbstractRankingFunction import AbstractRankingFunction
-from ..utils import rank
+from ..document import Document
+from ..utils import sort_with_ties
+
+
+def _get_id(docid):
+    return docid.get_id() if isinstance(docid, Document) else docid
 
 
 class ProbabilisticRankingFunction(AbstractRankingFunction):
 
-    def init_ranking(self, query):
+    ranking_state = AbstractRankingFunction.ranking_state + (
+        "docids", "doc_weights", "total_weight", "removed_slots", "tree",
+        "slots", "slot_index")
+
+    def init_ranking(self, query, scores=None):
         self.dirty = False
         self.qid = query.get_qid()
-        scores = self.ranking_model.score(query.get_feature_vectors(),
-                                          self.w.transpose())
-        # rank scores
-        ranks = rank(scores, ties=self.ties, reverse=False)
-        # get docids for the ranked scores
-        ranked_docids = []
-        for pos, docid in enumerate(query.__docids__):
-            ranked_docids.append((ranks[pos], docid))
-        # sort docids by rank
-        ranked_docids.sort(reverse=True)
-        self.docids = [docid for (_, docid) in ranked_docids]
-        # break ties randomly and sort ranks to compute probabilities
-        ranks = np.asarray([i + 1.0 for i in
-            sorted(rank(scores, ties=self.ties, reverse=False))])
+        if self.ties == "random":
+            # ties are broken anew for each ranking
+            self._set_sampler(self._get_query_sampler(query, scores))
+        else:
+            self._set_sampler(self._get_cached(query, "sampler",
+                lambda: self._get_query_sampler(query, scores)))
+
+    def _get_query_sampler(self, query, scores=None):
+        scores = self.get_scores(query, scores)
+        # sort docids by decreasing score
+        order, _ = sort_with_ties(scores, self.ties, reverse=True)
+        docids = query.get_docids()
         # determine probabilities based on (reverse) document ranks
-        max_rank = len(ranks)
-        tmp_val = max_rank / pow(ranks, self.ranker_type)
-        self.probs = tmp_val / sum(tmp_val)
+        max_rank = len(order)
+        return self._get_sampler([docids[i] for i in order],
+            max_rank / pow(np.arange(1.0, max_rank + 1), self.ranker_type))
+
+    def _init_sampler(self, docids, weights):
+        self._set_sampler(self._get_sampler(docids, weights))
+
+    def _get_sampler(self, docids, weights):
+        """Prepare drawing the documents (in rank order) proportionally to the
+        given (unnormalized) weights. Draws and removals take O(log n): the
+        weights are kept in a Fenwick tree, and each document has a fixed
+        slot, its position in the initial ranking."""
+        weights = np.asarray(weights, dtype=float).tolist()
+        slots = dict((docid, slot) for slot, docid in enumerate(docids))
+        return (tuple(docids), weights, sum(weights), slots,
+                _WeightTree(weights))
+
+    def _set_sampler(self, sampler):
+        """Start drawing from the initial state of a (possibly shared)
+        sampler; only the state that draws and removals change is copied."""
+        docids, weights, total_weight, self.slots, tree = sampler
+        self.docids = list(docids)
+        self.doc_weights = list(weights)
+        self.total_weight = total_weight
+        self.removed_slots = []
+        self.tree = tree.copy()
+        # slot of each document indexed by document id, built on first use
+        self.slot_index = None
+
+    def _get_slot(self, docid):
+        """slot of a document that has not been drawn or removed yet"""
+        slot = self.slots.get(docid)
+        if slot is None or self.doc_weights[slot] < 0:
+            raise ValueError("%s is not in the list" % docid)
+        return slot
+
+    def _remove_slot(self, slot):
+        # slots before this one that were removed are not in self.docids
+        pos = slot - bisect_left(self.removed_slots, slot)
+        insort(self.removed_slots, slot)
+        self.tree.add(slot, -self.doc_weights[slot])
+        self.total_weight -= self.doc_weights[slot]
+        # negative weights mark removed slots
+        self.doc_weights[slot] = -1
+        return self.docids.pop(pos)
+
+    def _get_slots(self, docids):
+        """slot of each document, -1 for documents that were never ranked"""
+        if self.slot_index is None:
+            ids = np.asarray([_get_id(d) for d in self.slots])
+            if len(ids) and ids.dtype.kind in "iu" and ids.min() >= 0:
+                self.slot_index = np.empty(ids.max() + 1, dtype=int)
+                self.slot_index.fill(-1)
+                self.slot_index[ids] = self.slots.values()
+        ids = np.asarray([_get_id(d) for d in docids])
+        if self.slot_index is None or ids.dtype.kind not in "iu":
+            return np.asarray([self.slots.get(d, -1) for d in docids],
+                              dtype=int)
+        known = (ids >= 0) & (ids < len(self.slot_index))
+        return np.where(known, self.slot_index[np.where(known, ids, 0)], -1)
+
+    def get_document_ranks(self, docids):
+        """Rank (1-based position in self.docids) of each document, 0 for
+        documents that are not (or no longer) ranked."""
+        slots = self._get_slots(docids)
+        removed = np.asarray(self.removed_slots, dtype=int)
+        ranked = (slots >= 0) & ~np.in1d(slots, removed)
+        # slots before a document that were removed are not in self.docids
+        return np.where(ranked, slots + 1 - np.searchsorted(removed, slots),
+                        0)
 
     def document_count(self):
         return len(self.docids)
@@ -57,40 +133,18 @@ class ProbabilisticRankingFunction(AbstractRankingFunction):
 
         # if there's only one document
         if len(self.docids) == 1:
-            self.probs = np.delete(self.probs, 0)  # should be empty now
-            pick = self.docids.pop()  # pop, because it's a list
-            return pick
+            return self._remove_slot(self.slots[self.docids[0]])
 
         # sample if there are more documents
-        # how to do this efficiently?
-        # take cumulative probabilities, then do binary search?
-        # if we sort docs and probabilities, we can start search at the
-        # beginning. This will be efficient, because we'll look at the most
-        # likely docs first.
-        cumprobs = np.cumsum(self.probs)
-        pick = -1
-        rand = random()  # produces a float in range [0.0, 1.0)
-        for pos, cp in enumerate(cumprobs):
-            if rand < cp:
-                pick = self.docids.pop(pos)  # pop, because it's a list
-                break
-
-        if (pick == -1):
-            print "Cumprobs:", cumprobs
-            print "rand", rand
-            raise Exception("Could not select document!")
-        # renormalize
-        self.probs = np.delete(self.probs, pos)  # delete, it's a numpy array
-        self.probs = self.probs / sum(self.probs)
-        return pick
+        slot = self.tree.find(random() * self.total_weight)
+        # rounding errors can only lead to a removed slot, or past the end
+        if slot >= len(self.doc_weights) or self.doc_weights[slot] < 0:
+            slot = self.slots[self.docids[-1]]
+        return self._remove_slot(slot)
 
     def next_det(self):
-        pos = 0  # first is the most likely document
-        pick = self.docids.pop(pos)
-        # renormalize
-        self.probs = np.delete(self.probs, pos)  # delete, it's a numpy array
-        self.probs = self.probs / sum(self.probs)
-        return pick
+        # first is the most likely document
+        return self._remove_slot(self.slots[self.docids[0]])
 
     def next_random(self):
         """produce a random next document"""
@@ -100,35 +154,85 @@ class ProbabilisticRankingFunction(AbstractRankingFunction):
             raise Exception("There are no more documents to be selected")
         # otherwise, return a random document
         rn = randint(0, len(self.docids) - 1)
-        return self.docids.pop(rn)
+        return self._remove_slot(self.slots[self.docids[rn]])
 
     def get_ranking(self):
         return self.docids
 
     def get_document_probability(self, docid):
         """get probability of producing doc as the next document drawn"""
-        pos = self.docids.index(docid)
-        return self.probs[pos]
+        return self.doc_weights[self._get_slot(docid)] / self.total_weight
+
+    def get_document_weights(self):
+        return list(self.docids), np.asarray(
+            [self.doc_weights[self.slots[docid]] for docid in self.docids])
+
+    def get_document_distribution(self, query):
+        """computed from the document scores, without a sampler"""
+        order, _ = sort_with_ties(self.get_scores(query), self.ties,
+                                  reverse=True)
+        # the weights of _get_query_sampler, summed in the same order (near
+        # ties in the combined distribution of two rankers are common)
+        max_rank = len(order)
+        weights = max_rank / pow(np.arange(1.0, max_rank + 1),
+                                 self.ranker_type)
+        probs = np.empty(max_rank)
+        probs[order] = weights / sum(weights.tolist())
+        return probs
 
     def rm_document(self, docid):
         """remove doc from list of available docs and adjust probabilities"""
-        # find position of the document
         try:
-            pos = self.docids.index(docid)
+            slot = self._get_slot(docid)
         except ValueError:
 #            raise Exception("Cannot remove %s. Current document list: %s "
 #                            "for qid: %s. \nProbably, you are trying to "
 #                            "interleave two identical rankers." %
 #                            (docid, self.docids, self.qid))
             return
-        # delete doc and renormalize
-        self.docids.pop(pos)
-        self.probs = np.delete(self.probs, pos)
-        self.probs = self.probs / sum(self.probs)
+        self._remove_slot(slot)
 
     def getDocs(self, numdocs=None):
         """ Copied from StatelessRankingFunction. """
         if numdocs is None:
             return self.docids
         else:
-            return self.docids[:numdocs]
\ No newline at end of file
+            return self.docids[:numdocs]
+
+
+class _WeightTree:
+    """Fenwick tree over the weights of a fixed number of slots. Supports
+    changing a weight, and finding the slot in which a value falls on the
+    cumulative weights, both in O(log n)."""
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        # node i (1-based) holds the sum of the weights of slots
+        # (i - lowbit(i), i], computed from the cumulative weights at once
+        nodes = np.arange(1, self.size + 1)
+        cumulative = np.hstack([0, np.cumsum(weights)])
+        self.tree = [0.0] + (cumulative[nodes] -
+                             cumulative[nodes - (nodes & -nodes)]).tolist()
+        self.top = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def copy(self):
+        tree = copy.copy(self)
+        tree.tree = list(self.tree)
+        return tree
+
+    def add(self, slot, delta):
+        i = slot + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, value):
+        """the first slot for which the cumulative weight exceeds value"""
+        pos = 0
+        step = self.top
+        while step:
+            if pos + step <= self.size and self.tree[pos + step] <= value:
+                pos += step
+                value -= self.tree[pos]
+            step >>= 1
+        return pos
@@ -0,0 +1,77 @@
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class QueryRankingCache:
+    """
+    Bounded LRU cache of what rankers compute in init_ranking (document
+    scores, rankings and sampling weights), keyed on a hash of the weight
+    vector of the ranker and the query. Rankers that share a cache (see
+    AbstractRankingFunction.set_ranking_cache) rank a query only once per
+    distinct weight vector; each init_ranking only copies the (small)
+    mutable state that next() and rm_document() change.
+
+    Cached values are shared between rankers and must not be modified.
+    Copies of a ranker (copy.deepcopy or get_candidate) share its cache,
+    pickled rankers get an empty one.
+    """
+
+    def __init__(self, size=128):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        # the cached values are not pickled
+        state = self.__dict__.copy()
+        state["entries"] = OrderedDict()
+        return state
+
+    def get_key(self, ranker, query, name):
+        w = np.ascontiguousarray(ranker.w)
+        return (name, ranker.__class__, ranker.ranking_model.__class__,
+                ranker.ties, getattr(ranker, "ranker_type", None),
+                query.get_qid(), w.dtype.str, w.shape,
+                hashlib.sha1(w.tostring()).hexdigest())
+
+    def get(self, ranker, query, name, compute):
+        """
+        The value called name for the current weights of ranker and query,
+        computed by compute() if it is not in the cache.
+        """
+        key = self.get_key(ranker, query, name)
+        entry = self.entries.pop(key, None)
+        # different query sets may reuse the same qids
+        if entry is None or entry[0] is not query:
+            self.misses += 1
+            entry = (query, compute())
+            if self.size < 1:
+                return entry[1]
+            if len(self.entries) >= self.size:
+                # evict the least recently used value
+                self.entries.popitem(last=False)
+        else:
+            self.hits += 1
+        self.entries[key] = entry
+        return entry[1]
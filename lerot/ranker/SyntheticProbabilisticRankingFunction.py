@@ -13,7 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import array, delete
+from numpy import arange
 from ProbabilisticRankingFunction import ProbabilisticRankingFunction
 
 
@@ -28,38 +28,10 @@ class SyntheticProbabilisticRankingFunction(ProbabilisticRankingFunction):
         if not synthetic_docids:
             return
         # assume that synthetic_docids are in rank order
-        self.docids = synthetic_docids
-        ranks = array(range(1, len(self.docids) + 1))
         # determine probabilities based on (reverse) document ranks
-        tmp_val = 1. / pow(ranks, self.ranker_type)
-        self.probs = tmp_val / sum(tmp_val)
-
-    def _get_doc_pos(self, docid):
-        try:
-            pos = self.docids.index(docid)
-        except:
-            pos = [i for i, d in
-                   enumerate(self.docids) if d[0] == docid][0]
-        return pos
-
-    def get_document_probability(self, docid):
-        """get probability of producing doc as the next document drawn"""
-        pos = self._get_doc_pos(docid)
-        return self.probs[pos]
-
-    def rm_document(self, docid):
-        """remove doc from list of available docs, adjust probabilities"""
-        # find position of the document
-        try:
-            pos = self._get_doc_pos(docid)
-        except ValueError:
-            print "cannot remove", docid,
-            print "current document list:", self.docids
-            print "qid:", self.qid
-        # delete doc and renormalize
-        self.docids.pop(pos)
-        self.probs = delete(self.probs, pos)
-        self.probs = self.probs / sum(self.probs)
+        ranks = arange(1.0, len(synthetic_docids) + 1)
+        self._init_sampler(list(synthetic_docids),
+                           1. / pow(ranks, self.ranker_type))
 
     def update_weights(self, new_weights):
         """not required under synthetic data"""
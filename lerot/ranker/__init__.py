@@ -16,6 +16,7 @@
 from DeterministicRankingFunction import DeterministicRankingFunction
 from ModelRankingFunction import ModelRankingFunction
 from ProbabilisticRankingFunction import ProbabilisticRankingFunction
+from QueryRankingCache import QueryRankingCache
 from StatelessRankingFunction import StatelessRankingFunction
 from SyntheticDeterministicRankingFunction import SyntheticDeterministicRankingFunction
 from SyntheticProbabilisticRankingFunction import SyntheticProbabilisticRankingFunction
@@ -24,6 +25,7 @@ __all__ = [
     'DeterministicRankingFunction',
     'ModelRankingFunction',
     'ProbabilisticRankingFunction',
+    'QueryRankingCache',
     'StatelessRankingFunction',
     'SyntheticDeterministicRankingFunction',
     'SyntheticProbabilisticRankingFunction'
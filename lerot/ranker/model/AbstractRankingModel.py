@@ -13,7 +13,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
-from numpy import array, zeros
+from numpy import array, column_stack, zeros
 from random import gauss
 
 from ...utils import sample_unit_sphere
@@ -27,6 +27,12 @@ class AbstractRankingModel(object):
     def get_feature_count(self):
         return self.feature_count
 
+    def get_settings(self):
+        """Everything besides the weights that the scores of the model depend
+        on. Models with equal settings can be scored together, see
+        ranker.AbstractRankingFunction.init_rankings."""
+        return (self.__class__, self.feature_count)
+
     def initialize_weights(self, method):
         if method == "zero":
             return zeros(self.feature_count)
@@ -57,3 +63,9 @@ class AbstractRankingModel(object):
     def score(self, features, w):
         raise NotImplementedError("Derived class needs to implement "
             "next.")
+
+    def score_many(self, features, W):
+        """Scores of the documents (rows of features) for each weight vector
+        (rows of W), as a documents x weight vectors matrix."""
+        return column_stack([self.score(features, w) for w in W]).reshape(
+            len(features), len(W))
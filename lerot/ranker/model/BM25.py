@@ -19,6 +19,33 @@ from .AbstractRankingModel import AbstractRankingModel
 from ...utils import sample_unit_sphere
 
 
+def get_term_features(features):
+    """The features of the query terms as a (documents x terms x 4) array.
+    Each group of four features holds the idf, tf, qtf and document length
+    of a query term. This is a view of features when they are contiguous."""
+    features = np.asarray(features, dtype=float)
+    nr_terms = features.shape[1] / 4
+    return features[:, :nr_terms * 4].reshape(len(features), nr_terms, 4)
+
+
+def score_bm25(terms, W):
+    """BM25 scores of the documents for each row (k1, k3, b) of W, given the
+    term features (see get_term_features). Terms with document length 0 are
+    skipped."""
+    idf, tf, qtf, dl = [terms[:, :, i, np.newaxis] for i in range(4)]
+    k1, k3, b = np.asarray(W, dtype=float).T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = ((idf * tf * (k1 + 1)) / (tf + k1 * (1 - b + b * dl))) * \
+            (((k3 + 1) * qtf) / (k3 + qtf))
+    s = np.where(dl != 0, s, 0)
+    # documents x weight vectors, the terms are added up in order (as
+    # opposed to sum(), which adds them up pairwise)
+    scores = np.zeros((len(terms), len(k1)))
+    for i in range(terms.shape[1]):
+        scores += s[:, i]
+    return scores
+
+
 class BM25(AbstractRankingModel):
 
     def __init__(self, feature_count):
@@ -30,19 +57,7 @@ class BM25(AbstractRankingModel):
         return np.array([2.5, 0, 0.8])
 
     def score(self, features, w):
-        scores = []
-        for docfeatures in features:
-            k1, k3, b = w
-            s = 0.0
-            nr_terms = len(docfeatures) / 4
-            for i in range(nr_terms):
-                idf = docfeatures[i * 4]
-                tf = docfeatures[i * 4 + 1]
-                qtf = docfeatures[i * 4 + 2]
-                dl = docfeatures[i * 4 + 3]
-                if dl == 0:
-                    continue
-                s += ((idf * tf * (k1 + 1)) / (tf + k1 * (1-b+b*dl))) * (((k3+1)*qtf)/(k3+qtf))
-            scores.append(s)
-        return scores
-    
+        return self.score_many(features, [w])[:, 0]
+
+    def score_many(self, features, W):
+        return score_bm25(get_term_features(features), W)
@@ -16,42 +16,57 @@
 import numpy as np
 
 from .AbstractRankingModel import AbstractRankingModel
+from .BM25 import get_term_features, score_bm25
 from ...utils import sample_unit_sphere
 
 
 class BM25Ensemble(AbstractRankingModel):
+    """Linear model over the first feature_count features, of which feature
+    bm25_feature is replaced by the BM25 score computed from the term
+    features that follow them (see BM25). The last three weights are the BM25
+    parameters (k1, k3, b)."""
+
+    bm25_feature = 24
 
     def __init__(self, feature_count):
         self.originalcount = feature_count
         self.feature_count = feature_count + 3
+        # features derived from the last scored feature matrix
+        self._derived = None
+
+    def __getstate__(self):
+        # the derived features are not copied or pickled
+        state = self.__dict__.copy()
+        state["_derived"] = None
+        return state
+
+    def get_settings(self):
+        return AbstractRankingModel.get_settings(self) + (self.originalcount,
+                                                          self.bm25_feature)
 
     def initialize_weights(self, init_method):
         if init_method == "random":
             return sample_unit_sphere(self.feature_count)
         return np.array([2.5, 0, 0.8])
 
-    def scoreLinear(self, features, w):
-        return np.dot(features, w)
-
-    def scoreBM25(self, features, w):
-        k1, k3, b = w
-        s = 0.0
-        nr_terms = len(features) / 4
-        for i in range(nr_terms):
-            idf = features[i * 4]
-            tf = features[i * 4 + 1]
-            qtf = features[i * 4 + 2]
-            dl = features[i * 4 + 3]
-            if dl == 0: continue
-            s += ((idf * tf * (k1 + 1)) / (tf + k1 * (1-b+b*dl))) * (((k3+1)*qtf)/(k3+qtf))
-        return s
+    def _get_derived(self, features):
+        """The linear features (with the BM25 feature set to 0) and the term
+        features of features. These are computed once for a feature matrix,
+        which is not modified."""
+        if self._derived is None or self._derived[0] is not features:
+            matrix = np.asarray(features, dtype=float)
+            linear = matrix[:, :self.originalcount].copy()
+            linear[:, self.bm25_feature] = 0
+            terms = get_term_features(matrix[:, self.originalcount:])
+            self._derived = (features, linear, terms)
+        return self._derived[1:]
 
     def score(self, features, w):
-        scores = []
-        for docfeatures in features:
-            bm25s = self.scoreBM25(docfeatures[self.originalcount:], w[-3:])
-            docfeatures[24] = bm25s
-            s = self.scoreLinear(docfeatures[:self.originalcount], w[:-3])
-            scores.append(s)
-        return scores
+        return self.score_many(features, [w])[:, 0]
 
+    def score_many(self, features, W):
+        W = np.asarray(W, dtype=float)
+        linear, terms = self._get_derived(features)
+        bm25s = score_bm25(terms, W[:, -3:])
+        W = W[:, :-3]
+        return np.dot(linear, W.T) + bm25s * W[:, self.bm25_feature]
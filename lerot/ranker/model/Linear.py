@@ -21,3 +21,6 @@ class Linear(AbstractRankingModel):
 
     def score(self, features, w):
         return np.dot(features, w)
+
+    def score_many(self, features, W):
+        return np.dot(features, np.asarray(W).T)
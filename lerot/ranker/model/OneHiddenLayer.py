@@ -13,27 +13,91 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
+from collections import OrderedDict
+
 import numpy as np
 from .AbstractRankingModel import AbstractRankingModel
 
 
 class OneHiddenLayer(AbstractRankingModel):
+    """Neural network with one hidden layer of tanh units. The input is the
+    feature vector with a bias feature (1) in front of it.
+
+    The inputs of recently scored feature matrices (e.g., one per query) are
+    kept, so that recurring queries are not copied again. Each holds a copy
+    of the features in dtype, plus one column; the least recently used ones
+    are dropped when they take more than cache_bytes (64MB by default, 0
+    disables the cache). With dtype numpy.float32 the network is evaluated
+    in single precision, which halves the memory of the cached inputs and is
+    faster for large document sets.
+    """
 
-    def __init__(self, feature_count):
+    def __init__(self, feature_count, dtype=np.float64,
+                 cache_bytes=64 * 2 ** 20):
         self.hiddensize = 10
         self.inputsize = feature_count + 1
         self.feature_count = (self.inputsize * self.hiddensize) \
                                                             + self.hiddensize
+        self.dtype = np.dtype(dtype)
+        self.cache_bytes = cache_bytes
+        self._inputs = OrderedDict()
+        self._inputs_bytes = 0
+
+    def __getstate__(self):
+        # the cached inputs are not copied or pickled
+        state = self.__dict__.copy()
+        state["_inputs"] = OrderedDict()
+        state["_inputs_bytes"] = 0
+        return state
+
+    def get_settings(self):
+        return AbstractRankingModel.get_settings(self) + (self.hiddensize,
+                                                          self.dtype.str)
 
     def initialize_weights(self, init_method):
         return AbstractRankingModel.initialize_weights(self, init_method)
 
+    def get_inputs(self, features):
+        """features with the bias feature added, computed once for a feature
+        matrix (which is not modified)."""
+        key = id(features)
+        entry = self._inputs.pop(key, None)
+        if entry is None or entry[0] is not features:
+            matrix = np.asarray(features)
+            inputs = np.empty((len(matrix), self.inputsize), dtype=self.dtype)
+            inputs[:, 0] = 1
+            inputs[:, 1:] = matrix
+            if entry is not None:
+                self._inputs_bytes -= entry[1].nbytes
+            entry = (features, inputs)
+            if inputs.nbytes > self.cache_bytes:
+                return inputs
+            while self._inputs_bytes + inputs.nbytes > self.cache_bytes:
+                # drop the least recently used inputs
+                _, (_, dropped) = self._inputs.popitem(last=False)
+                self._inputs_bytes -= dropped.nbytes
+            self._inputs_bytes += inputs.nbytes
+        self._inputs[key] = entry
+        return entry[1]
+
     def score(self, features, w):
-        features = np.vstack((np.ones(len(features)),
-                              features.transpose())).transpose()
+        features = self.get_inputs(features)
+        w = np.asarray(w, dtype=self.dtype)
         w1 = w[:-self.hiddensize]
         w1 = w1.reshape((self.inputsize, self.hiddensize))
         w2 = w[-self.hiddensize:]
         s = np.tanh(np.dot(np.tanh(np.dot(features, w1)), w2))
         return s
-    
+
+    def score_many(self, features, W):
+        features = self.get_inputs(features)
+        W = np.asarray(W, dtype=self.dtype)
+        # the input weights of all weight vectors side by side, so that the
+        # hidden layers are computed in a single matrix product
+        W1 = W[:, :-self.hiddensize].reshape((len(W), self.inputsize,
+            self.hiddensize)).transpose(1, 0, 2).reshape((self.inputsize, -1))
+        W2 = W[:, -self.hiddensize:]
+        # hidden layer activations, documents x weight vectors x hidden units
+        hidden = np.tanh(np.dot(features, W1)).reshape((len(features), len(W),
+                                                        self.hiddensize))
+        return np.tanh(np.einsum("drh,rh->dr", hidden, W2))
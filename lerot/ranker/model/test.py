@@ -23,6 +23,8 @@ sys.path.insert(0, os.path.abspath('..'))
 
 from OneHiddenLayer import OneHiddenLayer
 from Linear import Linear
+from BM25 import BM25
+from BM25Ensemble import BM25Ensemble
 
 
 class TestRankers(unittest.TestCase):
@@ -65,5 +67,70 @@ class TestRankers(unittest.TestCase):
             orderings.add(ordering)
         self.assertEqual(reps, len(orderings))
 
+    def testOneHiddenLayerInputs(self):
+        inputs = self.hidden_model.get_inputs(self.features)
+        self.assertTrue((inputs[:, 0] == 1).all())
+        self.assertTrue((inputs[:, 1:] == self.features).all())
+        self.assertIs(inputs, self.hidden_model.get_inputs(self.features))
+        self.assertIsNot(inputs,
+                         self.hidden_model.get_inputs(self.features.copy()))
+        # the cache holds at most cache_bytes of inputs
+        model = OneHiddenLayer(self.feature_count, cache_bytes=inputs.nbytes)
+        first = model.get_inputs(self.features)
+        self.assertIs(first, model.get_inputs(self.features))
+        model.get_inputs(self.features[:10])
+        self.assertIsNot(first, model.get_inputs(self.features))
+        self.assertEqual(inputs.nbytes, model._inputs_bytes)
+        single = OneHiddenLayer(self.feature_count, dtype=np.float32)
+        W = np.random.randn(3, self.hidden_model.feature_count)
+        scores = single.score_many(self.features, W)
+        self.assertEqual(np.float32, scores.dtype)
+        self.assertTrue(np.allclose(scores, self.hidden_model.score_many(
+            self.features, W), atol=1e-5))
+        self.assertTrue(np.allclose(scores[:, 0], single.score(
+            self.features, W[0]), atol=1e-5))
+
+    def testScoreMany(self):
+        # some query terms do not occur in some documents
+        self.features[::3, 3::4] = 0
+        for model in [self.linear_model, self.hidden_model,
+                      BM25(self.feature_count),
+                      BM25Ensemble(self.feature_count - 10)]:
+            W = np.random.rand(5, model.feature_count)
+            scores = model.score_many(self.features, W)
+            self.assertEqual((self.number_docs, 5), scores.shape)
+            for i, w in enumerate(W):
+                self.assertTrue(np.allclose(scores[:, i], model.score(
+                    self.features, w)))
+
+    def testBM25(self):
+        def bm25(docfeatures, w):
+            k1, k3, b = w
+            s = 0.0
+            nr_terms = len(docfeatures) / 4
+            for idf, tf, qtf, dl in docfeatures[:nr_terms * 4].reshape(-1, 4):
+                if dl == 0:
+                    continue
+                s += ((idf * tf * (k1 + 1)) / (tf + k1 * (1 - b + b * dl))) \
+                    * (((k3 + 1) * qtf) / (k3 + qtf))
+            return s
+
+        self.features[::3, 3::4] = 0
+        features = self.features.copy()
+        w = np.array([2.5, 0, 0.8])
+        self.assertEqual([bm25(f, w) for f in self.features],
+                         list(BM25(self.feature_count).score(features, w)))
+        model = BM25Ensemble(self.feature_count - 10)
+        w = np.random.rand(model.feature_count)
+        expected = []
+        for f in self.features:
+            f = f.copy()
+            f[24] = bm25(f[model.originalcount:], w[-3:])
+            expected.append(np.dot(f[:model.originalcount], w[:-3]))
+        for _ in range(2):
+            self.assertTrue(np.allclose(expected, model.score(features, w)))
+        # the features are not modified
+        self.assertTrue((features == self.features).all())
+
 if __name__ == '__main__':
         unittest.main()
@@ -16,14 +16,19 @@
 import unittest
 import sys
 import os
+import copy
 import cStringIO
 import numpy as np
 
 sys.path.insert(0, os.path.abspath('..'))
 
 from lerot import query
+from lerot.document import Document
 from DeterministicRankingFunction import DeterministicRankingFunction
 from ProbabilisticRankingFunction import ProbabilisticRankingFunction
+from QueryRankingCache import QueryRankingCache
+from AbstractRankingFunction import init_rankings
+from lerot.ranker.model import OneHiddenLayer
 
 
 class TestRankers(unittest.TestCase):
@@ -113,6 +118,143 @@ class TestRankers(unittest.TestCase):
         rf.init_ranking(self.query)
         self.assertAlmostEqual(0.0132678, rf.get_document_probability(0))
         self.assertAlmostEqual(0.8491400, rf.get_document_probability(1))
+    def testDeterministicTopK(self):
+        rf = DeterministicRankingFunction([None], "last",
+            self.test_num_features, init="0,0,1,0,0,0")
+        rf.top_k = 1
+        rf.init_ranking(self.query)
+        # docs 2 and 3 tie, only the top document is ranked at first
+        self.assertEqual(1, len(rf.ranked))
+        self.assertEqual(4, rf.document_count())
+        self.assertEqual([1, 3, 2, 0], [d.docid for d in rf.getDocs()])
+        self.assertEqual(1, rf.next().docid)
+        rf.rm_document(rf.getDocs(1)[0])
+        self.assertEqual([2, 0], [d.docid for d in rf.get_ranking()])
+        self.assertEqual([2, 0], [rf.next().docid for _ in range(2)])
+        self.assertEqual(0, rf.document_count())
+
+    def testProbabilisticRemoveDocuments(self):
+        rf = ProbabilisticRankingFunction([3], "first",
+            self.test_num_features, init="0,0,1,0,0,0")
+        rf.init_ranking(self.query)
+        self.assertEqual([1, 2, 3, 0], [d.docid for d in rf.docids])
+        probs = [rf.get_document_probability(d) for d in rf.docids]
+        self.assertAlmostEqual(1, sum(probs))
+        # removing a document renormalizes the remaining probabilities
+        docs = list(rf.docids)
+        rf.rm_document(docs[1])
+        self.assertEqual([docs[0], docs[2], docs[3]], rf.docids)
+        self.assertRaises(ValueError, rf.get_document_probability, docs[1])
+        for i in [0, 2, 3]:
+            self.assertAlmostEqual(probs[i] / (1 - probs[1]),
+                                   rf.get_document_probability(docs[i]))
+        drawn = [rf.next() for _ in range(3)]
+        self.assertEqual(set([docs[0], docs[2], docs[3]]), set(drawn))
+        self.assertEqual([], rf.docids)
+
+    def testProbabilisticDocumentRanks(self):
+        rf = ProbabilisticRankingFunction([3], "first",
+            self.test_num_features, init="0,0,1,0,0,0")
+        rf.init_ranking(self.query)
+        docs = list(rf.docids)
+        self.assertEqual([4, 1, 2, 3],
+            rf.get_document_ranks(self.query.get_docids()).tolist())
+        rf.rm_document(docs[1])
+        self.assertEqual([1, 0, 2, 3], rf.get_document_ranks(docs).tolist())
+        self.assertEqual([0], rf.get_document_ranks([Document(7)]).tolist())
+
+    def testQueryRankingCache(self):
+        cache = QueryRankingCache()
+        rf = ProbabilisticRankingFunction([3], "first",
+            self.test_num_features, init="0,0,1,0,0,0")
+        rf.set_ranking_cache(cache)
+        rf.init_ranking(self.query)
+        self.assertEqual((0, 2), (cache.hits, cache.misses))
+        probs = [rf.get_document_probability(d) for d in rf.docids]
+        rf.rm_document(rf.docids[0])
+        # copies share the cache, each ranking can be changed independently
+        rf_copy = copy.deepcopy(rf)
+        self.assertTrue(rf_copy.ranking_cache is cache)
+        rf_copy.init_ranking(self.query)
+        self.assertEqual((1, 2), (cache.hits, cache.misses))
+        self.assertEqual([1, 2, 3, 0], [d.docid for d in rf_copy.docids])
+        self.assertEqual(probs, [rf_copy.get_document_probability(d)
+                                 for d in rf_copy.docids])
+        self.assertEqual([2, 3, 0], [d.docid for d in rf.docids])
+        # rankers of other types, or with other weights, are cached separately
+        rd = DeterministicRankingFunction([None], "first",
+            self.test_num_features, init="0,0,1,0,0,0")
+        rd.set_ranking_cache(cache)
+        rd.init_ranking(self.query)
+        self.assertEqual((1, 4), (cache.hits, cache.misses))
+        self.assertEqual([1, 2, 3, 0], [d.docid for d in rd.getDocs()])
+        rd.update_weights(np.asarray([0, 0, 0, 0, 0, 1.]))
+        rd.init_ranking(self.query)
+        self.assertEqual((1, 6), (cache.hits, cache.misses))
+        self.assertEqual([2, 3, 1, 0], [d.docid for d in rd.getDocs()])
+
+    def testCandidate(self):
+        cache = QueryRankingCache()
+        for ranker in [ProbabilisticRankingFunction,
+                       DeterministicRankingFunction]:
+            rf = ranker([3], "first", self.test_num_features,
+                        init="0,0,1,0,0,0")
+            rf.set_ranking_cache(cache)
+            rf.init_ranking(self.query)
+            first = rf.next()
+            candidate = rf.get_candidate(np.asarray([0, 0, 0, 0, 0, 1.]))
+            self.assertTrue(candidate.ranking_model is rf.ranking_model)
+            self.assertTrue(candidate.ranking_cache is cache)
+            self.assertEqual([0, 0, 1, 0, 0, 0], rf.w.tolist())
+            self.assertRaises(Exception, candidate.getDocs)
+            candidate.init_ranking(self.query)
+            self.assertEqual([2, 3, 1, 0],
+                             [d.docid for d in candidate.getDocs()])
+            # the ranking of the parent is not affected
+            self.assertEqual(3, rf.document_count())
+            self.assertNotIn(first, rf.getDocs())
+
+    def testInitRankings(self):
+        weights = ["0,0,1,0,0,0", "0,0,0,0,0,1", "1,0,0,0,0,0"]
+        rankers = [ProbabilisticRankingFunction([3], "first",
+                       self.test_num_features, init=w) for w in weights] + \
+                  [DeterministicRankingFunction([None], "first",
+                       self.test_num_features, init=w) for w in weights]
+        init_rankings(rankers, self.query)
+        rankings = [[d.docid for d in r.getDocs()] for r in rankers]
+        for r in rankers:
+            r.init_ranking(self.query)
+        self.assertEqual([[d.docid for d in r.getDocs()] for r in rankers],
+                         rankings)
+        self.assertEqual([2, 3, 1, 0], rankings[1])
+        # models with different settings are not scored together
+        rankers = [DeterministicRankingFunction(
+                       ["ranker.model.OneHiddenLayer"], "first",
+                       self.test_num_features, init="random")
+                   for _ in range(3)]
+        rankers[2].ranking_model = OneHiddenLayer(self.test_num_features,
+                                                  dtype=np.float32)
+        init_rankings(rankers, self.query)
+        features = self.query.get_feature_vectors()
+        for r in rankers[:2]:
+            self.assertTrue(np.allclose(r.ranking_model.score(features, r.w),
+                                        r.scores))
+        # scored in single precision, on its own
+        self.assertEqual(rankers[2].ranking_model.score(features,
+            rankers[2].w).astype(float).tolist(), rankers[2].scores.tolist())
+
+    def testDocumentDistribution(self):
+        docids = self.query.get_docids()
+        rf = ProbabilisticRankingFunction([3], "first",
+            self.test_num_features, init="0,0,1,0,0,0")
+        probs = rf.get_document_distribution(self.query)
+        rf.init_ranking(self.query)
+        self.assertEqual([rf.get_document_probability(d) for d in docids],
+                         probs.tolist())
+        rd = DeterministicRankingFunction([None], "first",
+            self.test_num_features, init="0,0,1,0,0,0")
+        self.assertEqual([0, 1, 0, 0],
+                         rd.get_document_distribution(self.query).tolist())
 
 if __name__ == '__main__':
         unittest.main()
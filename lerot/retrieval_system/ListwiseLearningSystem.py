@@ -20,9 +20,9 @@ Retrieval system implementation for use in learning experiments.
 
 import argparse
 from numpy import array
-import copy
 
 from .AbstractLearningSystem import AbstractLearningSystem
+from ..ranker import QueryRankingCache
 from ..utils import get_class, split_arg_str
 
 
@@ -49,6 +49,10 @@ class ListwiseLearningSystem(AbstractLearningSystem):
         parser.add_argument("-a", "--alpha", required=True, type=str)
         parser.add_argument("--anneal", type=int, default=0)
         parser.add_argument("--normalize", default="False")
+        parser.add_argument("--ranking_cache_size", type=int, default=1024,
+            help="Number of document rankings (per weight vector and query) "
+            "to reuse between interleaving and inferring outcomes (0: no "
+            "caching).")
         args = vars(parser.parse_known_args(split_arg_str(arg_str))[0])
 
         self.ranker_class = get_class(args["ranker"])
@@ -62,6 +66,9 @@ class ListwiseLearningSystem(AbstractLearningSystem):
                                         self.feature_count,
                                         sample=self.sample_weights,
                                         init=self.init_weights)
+        if args["ranking_cache_size"] > 0:
+            self.ranker.set_ranking_cache(
+                QueryRankingCache(args["ranking_cache_size"]))
 
         if "," in args["delta"]:
             self.delta = array([float(x) for x in args["delta"].split(",")])
@@ -87,8 +94,7 @@ class ListwiseLearningSystem(AbstractLearningSystem):
         # Get a new candidate whose weights are slightly changed with strength
         # delta.
         w, u = self.ranker.get_candidate_weight(self.delta)
-        candidate_ranker = copy.deepcopy(self.ranker)
-        candidate_ranker.update_weights(w)
+        candidate_ranker = self.ranker.get_candidate(w)
         return candidate_ranker, u
 
     def _get_candidate(self):
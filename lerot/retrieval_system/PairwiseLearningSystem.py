@@ -20,7 +20,7 @@ Retrieval system implementation for use in learning experiments.
 
 import argparse
 
-from numpy import array, dot, ones, where, zeros
+from numpy import array, asarray, dot, nonzero, ones, outer, tril, zeros
 from numpy.linalg import norm
 from random import gauss, random
 
@@ -44,6 +44,10 @@ class PairwiseLearningSystem(AbstractLearningSystem):
         parser.add_argument("-e", "--epsilon", required=True, type=float)
         parser.add_argument("-f", "--eta", required=True, type=float)
         parser.add_argument("-l", "--lamb", type=float, default=0.0)
+        parser.add_argument("-u", "--update", default="sequential",
+            choices=["sequential", "batch"], help="Update the weights after "
+            "each document pair (sequential), or once for all document pairs "
+            "of a result list (batch, see update_solution).")
         parser.add_argument("-r", "--ranker", required=True)
         parser.add_argument("-s", "--ranker_args", nargs="*")
         parser.add_argument("-t", "--ranker_tie", default="random")
@@ -67,6 +71,7 @@ class PairwiseLearningSystem(AbstractLearningSystem):
         self.epsilon = args["epsilon"]
         self.eta = args["eta"]
         self.lamb = args["lamb"]
+        self.update = args["update"]
 
     def initialize_weights(self, method, feature_count):
         if method == "zero":
@@ -117,33 +122,44 @@ class PairwiseLearningSystem(AbstractLearningSystem):
         self.current_query = query
         return l
 
+    def get_pair_differences(self, clicks):
+        """Feature differences between the clicked and the skipped document of
+        each pairwise preference inferred from clicks (one pair per row). For
+        each clicked document (from the top of the list), the pairs are formed
+        with the documents above it that were not clicked."""
+        clicked = asarray(clicks) == 1
+        # pairs (hi, lo) with hi clicked, lo not clicked, and lo < hi, in
+        # row-major order
+        hi, lo = nonzero(tril(outer(clicked, ~clicked), -1))
+        features = self.current_query.get_feature_vectors()[
+            [docid.get_id() for docid in self.current_l]]
+        return features[hi] - features[lo]
+
     def update_solution(self, clicks):
         """"Ranker weights are updated after each observed document pair. This
         means that a pair may have been misranked when the result list was gen-
         erated, but is correctly labeled after an earlier update based on a
-        higher-ranked pair from the same list."""
-        click_ids = where(clicks == 1)[0]
-        if not len(click_ids):  # no clicks, will be a tie
+        higher-ranked pair from the same list.
+
+        With --update batch, the weights are instead updated once per result
+        list: the gradients of all pairs that are misranked (by a margin of
+        less than 1) under the current weights are added up, including the
+        regularization term once per misranked pair."""
+        feature_diffs = self.get_pair_differences(clicks)
+        if not len(feature_diffs):  # no clicks, will be a tie
             return self.ranker.w
-        # extract pairwise preferences from clicks
-        for hi in click_ids:
-            # now hi is the rank of the clicked document, l[hi] is the docid
-            # for each clicked document, get documents above it
-            doc_range = range(hi)
-            for lo in doc_range:
-                if lo in click_ids:  # y was clicked as well, no constraint.
-                    continue
-                # check current scores and update ranker weights as needed
-                feature_diff = (self.current_query.get_feature_vector(
-                    self.current_l[hi]) -
-                    self.current_query.get_feature_vector(self.current_l[lo]))
-                # hi is the document that should be ranked higher, so it should
-                # have a higher score
-                y = 1.0
-                if y * dot(feature_diff, self.ranker.w.transpose()) < 1.0:
-                    new_weights = (self.ranker.w + self.eta * y * feature_diff
-                        - self.eta * self.lamb * self.ranker.w)
-                    self.ranker.update_weights(new_weights)
+        w = self.ranker.w
+        # the document of each pair that was clicked should have a higher
+        # score
+        if self.update == "batch":
+            misranked = dot(feature_diffs, w) < 1.0
+            w = w + self.eta * (feature_diffs[misranked].sum(axis=0)
+                                - self.lamb * misranked.sum() * w)
+        else:
+            for feature_diff in feature_diffs:
+                if dot(feature_diff, w) < 1.0:
+                    w = w + self.eta * feature_diff - self.eta * self.lamb * w
+        self.ranker.update_weights(w)
         return self.ranker.w
 
     def get_solution(self):
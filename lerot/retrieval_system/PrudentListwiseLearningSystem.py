@@ -22,6 +22,7 @@ import argparse
 from numpy import array
 
 from .AbstractLearningSystem import AbstractLearningSystem
+from ..ranker import QueryRankingCache
 from ..utils import get_class, split_arg_str
 
 
@@ -48,6 +49,10 @@ class PrudentListwiseLearningSystem(AbstractLearningSystem):
         parser.add_argument("-a", "--alpha", required=True, type=str)
         parser.add_argument("--anneal", type=int, default=0)
         parser.add_argument("--normalize", default="False")
+        parser.add_argument("--ranking_cache_size", type=int, default=1024,
+            help="Number of document rankings (per weight vector and query) "
+            "to reuse between interleaving and inferring outcomes (0: no "
+            "caching).")
         args = vars(parser.parse_known_args(split_arg_str(arg_str))[0])
 
         self.ranker_class = get_class(args["ranker"])
@@ -61,6 +66,9 @@ class PrudentListwiseLearningSystem(AbstractLearningSystem):
                                         self.feature_count,
                                         sample=self.sample_weights,
                                         init=self.init_weights)
+        if args["ranking_cache_size"] > 0:
+            self.ranker.set_ranking_cache(
+                QueryRankingCache(args["ranking_cache_size"]))
 
         if "," in args["delta"]:
             self.delta = array([float(x) for x in args["delta"].split(",")])
@@ -83,15 +91,8 @@ class PrudentListwiseLearningSystem(AbstractLearningSystem):
 
     def _get_new_candidate(self):
         w, u = self.ranker.get_candidate_weight(self.delta)
-#        candidate_ranker1 = copy.deepcopy(self.ranker)
-#        candidate_ranker1.update_weights(w)
-        candidate_ranker2 = self.ranker_class(self.ranker_args,
-                                             self.ranker_tie,
-                                             self.feature_count,
-                                             sample=self.sample_weights,
-                                             init=self.init_weights)
-        candidate_ranker2.update_weights(w)
-        return candidate_ranker2, u
+        candidate_ranker = self.ranker.get_candidate(w)
+        return candidate_ranker, u
 
     def _get_candidate(self):
         return self._get_new_candidate()
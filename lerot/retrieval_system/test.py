@@ -85,5 +85,19 @@ class TestPairwiseLearning(unittest.TestCase):
             self.assertEqual(round(x, 4), round(y, 4),
                 "mismatch between %.4f - %.4f" % (x, y))
 
+    def testUpdateSolutionBatch(self):
+        learner = PairwiseLearningSystem(self.test_num_features,
+            "--init_weights 0,0,1,0,0,0 --epsilon 0.0 --eta 0.001 --ranker "
+            "ranker.DeterministicRankingFunction --ranker_tie first "
+            "--update batch")
+        learner.get_ranked_list(self.query)
+        learner.current_l = [self.query.get_docids()[i] for i in [1, 2, 3, 0]]
+        self.assertEqual(3, len(learner.get_pair_differences(
+            array([0, 0, 0, 1]))))
+        new_weights = learner.update_solution(array([0, 0, 0, 1]))
+        for x, y in zip([0.0056, 0, 0.9988, 0, 0, -0.0089], new_weights):
+            self.assertEqual(round(x, 4), round(y, 4),
+                "mismatch between %.4f - %.4f" % (x, y))
+
 if __name__ == '__main__':
         unittest.main()
@@ -14,7 +14,12 @@
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
 import cStringIO
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
+import numpy as np
 import lerot.query as qu
 
 
@@ -69,5 +74,136 @@ class TestQuery(unittest.TestCase):
             "# not relevant"], query.get_comments())
 #         self.assertEqual("# highly relevant", query.get_comment(0)) TODO: FIX
 
+    def test_sparse_queries(self):
+        query_fh = cStringIO.StringIO("""
+        # qid 7
+        2 qid:7 1:0.5 4:1.5
+        0 qid:7
+        1 qid:8 6:3 2:-1e-2 # comment
+        """)
+        queries = qu.Queries(query_fh, self.test_num_features)
+        query_fh.close()
+
+        self.assertEqual(2, queries.get_size())
+        self.assertEqual([[0.5, 0, 0, 1.5, 0, 0], [0, 0, 0, 0, 0, 0]],
+                         queries['7'].get_feature_vectors().tolist())
+        self.assertEqual([2, 0], queries['7'].get_labels().tolist())
+        self.assertEqual([[0, -0.01, 0, 0, 0, 3]],
+                         queries['8'].get_feature_vectors().tolist())
+        self.assertEqual([1], queries['8'].get_labels().tolist())
+
+    def test_load_queries_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "queries.txt")
+            with open(filename, "w") as fh:
+                fh.write(self.test_queries)
+            # no cache is written unless asked for
+            qu.load_queries(filename, self.test_num_features)
+            self.assertFalse(os.path.exists(filename + ".6.cache"))
+            parsed = qu.load_queries(filename, self.test_num_features, True,
+                                     cache=True)
+            self.assertTrue(os.path.isdir(filename + ".6.cache"))
+            cached = qu.load_queries(filename, self.test_num_features, True,
+                                     cache=True)
+            self.assertTrue(isinstance(cached['1'].get_feature_vectors(),
+                                       np.memmap))
+            self.assertEqual(parsed['1'].get_feature_vectors().tolist(),
+                             cached['1'].get_feature_vectors().tolist())
+            self.assertEqual([4, 1, 0, 0], cached['1'].get_labels().tolist())
+            self.assertEqual(parsed['1'].get_comments(),
+                             cached['1'].get_comments())
+            # a modified file invalidates the cache
+            with open(filename, "a") as fh:
+                fh.write("2 qid:2 1:1\n")
+            os.utime(filename, (0, 0))
+            rebuilt = qu.load_queries(filename, self.test_num_features,
+                                      cache=True)
+            self.assertEqual(2, rebuilt.get_size())
+            self.assertEqual(2, qu.load_queries(filename,
+                self.test_num_features, cache=True).get_size())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_load_shared_queries(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp_dir, "queries.txt")
+            with open(filename, "w") as fh:
+                fh.write(self.test_queries)
+            # sharing requires the cache
+            self.assertIsNone(qu.load_queries(filename,
+                self.test_num_features, shared=True).__shared_source__)
+            shared = qu.load_queries(filename, self.test_num_features,
+                                     cache=True, shared=True)
+            features = shared['1'].get_feature_vectors()
+            self.assertTrue(isinstance(features, np.memmap))
+            self.assertFalse(features.flags.writeable)
+            # pickled by reference to the cache, not by value
+            state = pickle.dumps(shared, pickle.HIGHEST_PROTOCOL)
+            self.assertTrue(len(state) < features.nbytes)
+            unpickled = pickle.loads(state)
+            self.assertEqual(features.tolist(),
+                             unpickled['1'].get_feature_vectors().tolist())
+            self.assertEqual([4, 1, 0, 0],
+                             unpickled['1'].get_labels().tolist())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_load_shared_queries_without_cache(self):
+        tmp_dir = tempfile.mkdtemp()
+        write_query_cache = qu._write_query_cache
+        def fail(*args):
+            raise IOError("read-only")
+        try:
+            filename = os.path.join(tmp_dir, "queries.txt")
+            with open(filename, "w") as fh:
+                fh.write(self.test_queries)
+            # the queries are loaded unshared if the cache cannot be written
+            qu._write_query_cache = fail
+            queries = qu.load_queries(filename, self.test_num_features,
+                                      cache=True, shared=True)
+            self.assertIsNone(queries.__shared_source__)
+            self.assertEqual([4, 1, 0, 0], queries['1'].get_labels().tolist())
+        finally:
+            qu._write_query_cache = write_query_cache
+            shutil.rmtree(tmp_dir)
+
+    def test_query_collection(self):
+        query_fh = cStringIO.StringIO(self.test_queries + """
+        2 qid:2 1:1 6:2
+        0 qid:2 2:1
+        """)
+        collection = qu._collect_queries(
+            qu.Queries(query_fh, self.test_num_features, True),
+            self.test_num_features, True)
+        query_fh.close()
+
+        self.assertEqual(2, collection.get_size())
+        self.assertEqual((6, 6), collection.get_feature_matrix().shape)
+        self.assertEqual(collection.get_qids(),
+                         [q.get_qid() for q in collection])
+        offsets = collection.get_offsets()
+        for i, query in enumerate(collection):
+            self.assertTrue(query.get_feature_vectors().base is
+                            collection.get_feature_matrix())
+            self.assertEqual(offsets[i + 1] - offsets[i],
+                             query.get_document_count())
+        query = collection['2']
+        self.assertEqual([[1, 0, 0, 0, 0, 2], [0, 1, 0, 0, 0, 0]],
+                         query.get_feature_vectors().tolist())
+        self.assertEqual([2, 0], query.get_labels().tolist())
+        self.assertEqual([0, 1], [d.docid for d in query.get_docids()])
+        self.assertEqual(["", ""], query.get_comments())
+
+        subset = collection.get_subset([1])
+        self.assertEqual(["2"], subset.get_qids())
+        self.assertEqual([0, 2], subset.get_offsets().tolist())
+        self.assertEqual(query.get_feature_vectors().tolist(),
+                         subset['2'].get_feature_vectors().tolist())
+        self.assertEqual([2, 0], subset['2'].get_labels().tolist())
+        self.assertEqual(["", ""], subset['2'].get_comments())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -64,6 +64,45 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(utils.rank(scores, reverse=True, ties="last"),
                          [5, 2, 4, 3, 0, 1])
 
+    def testSortWithTies(self):
+        scores = np.array([[2.1, 2.9, 2.3, 2.3, 5.5, 2.9],
+                           [1.0, 1.0, 1.0, 0.0, 3.0, 2.0]])
+        order, ranks = utils.sort_with_ties(scores, ties="first",
+                                            reverse=True)
+        self.assertEqual([[4, 1, 5, 2, 3, 0], [4, 5, 0, 1, 2, 3]],
+                         order.tolist())
+        for ties in ["first", "last", "random"]:
+            order, ranks = utils.sort_with_ties(scores, ties=ties)
+            for row in range(len(scores)):
+                self.assertEqual(range(scores.shape[1]),
+                                 sorted(ranks[row].tolist()))
+                self.assertEqual(order[row].tolist(),
+                                 np.argsort(ranks[row]).tolist())
+                self.assertEqual(sorted(scores[row]),
+                                 scores[row][order[row]].tolist())
+                if ties != "random":
+                    self.assertEqual(utils.rank(scores[row], ties=ties),
+                                     ranks[row].tolist())
+        self.assertRaises(Exception, utils.sort_with_ties, scores, "none")
+
+    def testInterpolateCheckpoints(self):
+        self.assertEqual([0.0, 0.5, 1.0, 1.0, 1.0],
+            utils.interpolate_checkpoints([0, 2, 4], [0.0, 1.0, 1.0], 5))
+
+    def testDivergences(self):
+        p = np.array([[.5, .25, .25], [1., 0, 0]])
+        q = np.array([[.25, .5, .25], [.5, .5, 0]])
+        self.assertTrue(np.allclose([.25 * np.log(2), np.log(2)],
+            utils.get_kullback_leibler_divergence(p, q)))
+        self.assertEqual(np.inf, utils.get_kullback_leibler_divergence(q[1],
+                                                                       p[1]))
+        js = utils.get_jensen_shannon_divergence(p, q)
+        self.assertTrue(np.allclose(js, utils.get_jensen_shannon_divergence(
+            q, p)))
+        self.assertAlmostEqual(js[1], utils.get_jensen_shannon_divergence(
+            p[1], q[1]))
+        self.assertEqual([.5, 1.], utils.get_l1_norm(p, q).tolist())
+
     def test_create_ranking_vector(self):
         feature_count = 5
         # Create queries to test with
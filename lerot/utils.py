@@ -22,7 +22,7 @@ from importlib import import_module
 from numpy import dot, sqrt
 import numpy as np
 from scipy.linalg import norm
-from random import sample
+from scipy.special import rel_entr
 
 
 def string_to_boolean(string):
@@ -74,19 +74,74 @@ def split_arg_str(arg_str):
     return s
 
 
-def rank(x, ties, reverse=False):
-    n = len(x)
+def get_tie_breaker(shape, ties):
+    """Secondary sort keys that break ties between equal scores (of arrays of
+    the given shape, along the last axis): with "first" earlier elements, and
+    with "last" later elements get higher keys; with "random" keys are
+    random."""
     if ties == "first":
-        ix = zip(x, reversed(range(n)), range(n))
+        return -np.arange(shape[-1]) * np.ones(shape, dtype=int)
     elif ties == "last":
-        ix = zip(x, range(n), range(n))
+        return np.arange(shape[-1]) * np.ones(shape, dtype=int)
     elif ties == "random":
-        ix = zip(x, sample(range(n), n), range(n))
+        return np.random.random(shape)
     else:
         raise Exception("Unknown method for breaking ties: \"%s\"" % ties)
-    ix.sort(reverse=reverse)
-    indexes = [i for _, _, i in ix]
-    return [i for _, i in sorted(zip(indexes, range(n)))]
+
+
+def sort_with_ties(x, ties, reverse=False):
+    """Sort x in increasing (or, if reverse, decreasing) order, breaking
+    ties as specified by get_tie_breaker. A 2-D x is sorted row by row.
+    Returns (order, ranks), where order holds the indexes of the elements in
+    sort order, and ranks the position of each element in that order."""
+    x = np.asarray(x)
+    tie_breaker = get_tie_breaker(x.shape, ties)
+    if reverse:
+        order = np.lexsort((-tie_breaker, -x))
+    else:
+        order = np.lexsort((tie_breaker, x))
+    ranks = np.empty_like(order)
+    positions = np.arange(x.shape[-1]) * np.ones(x.shape, dtype=int)
+    if x.ndim == 1:
+        ranks[order] = positions
+    else:
+        ranks[np.arange(x.shape[0])[:, np.newaxis], order] = positions
+    return order, ranks
+
+
+def rank(x, ties, reverse=False):
+    """the position of each element of x in sort order, see sort_with_ties"""
+    return sort_with_ties(x, ties, reverse)[1].tolist()
+
+
+def get_positions(l, ranking):
+    """Position of each document of l in ranking (-1 for documents that are
+    not in ranking)."""
+    positions = dict((d, i) for i, d in reversed(list(enumerate(ranking))))
+    return np.asarray([positions.get(d, -1) for d in l], dtype=int)
+
+
+def get_kullback_leibler_divergence(probs1, probs2):
+    """Kullback-Leibler divergence of probs2 from probs1 (along the last
+    axis, so each row of a matrix can be a distribution)."""
+    return rel_entr(probs1, probs2).sum(axis=-1)
+
+
+def get_jensen_shannon_divergence(probs1, probs2):
+    mean_probs = (np.asarray(probs1) + probs2) / 2.
+    return .5 * get_kullback_leibler_divergence(probs1, mean_probs) + \
+        .5 * get_kullback_leibler_divergence(probs2, mean_probs)
+
+
+def get_l1_norm(probs1, probs2):
+    return np.abs(np.subtract(probs1, probs2)).sum(axis=-1)
+
+
+def interpolate_checkpoints(checkpoints, values, length):
+    """Linearly interpolate values measured after the queries with the given
+    (increasing) indices, e.g., offline evaluations on a schedule, to a value
+    for each of the first length queries."""
+    return np.interp(np.arange(length), checkpoints, values).tolist()
 
 
 def get_cosine_similarity(v1, v2):
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# This file is part of Lerot.
+#
+# Lerot is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Lerot is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compare the latency of the solvers of OptimizedInterleave and
+OptimizedMultileave (time per interleaved list, including the enumeration
+of the allowed lists).
+"""
+
+import argparse
+import random
+import time
+
+from lerot.comparison import OptimizedInterleave, OptimizedMultileave
+from lerot.comparison.OptimizedSolver import SOLVERS
+
+
+class BenchmarkRanker:
+    def __init__(self, docids):
+        self.docids = docids
+
+    def init_ranking(self, query):
+        pass
+
+    def getDocs(self, numdocs=None):
+        return self.docids[:numdocs]
+
+    def get_ranking(self):
+        return self.docids
+
+
+def get_rankers(n_rankers, length, n_docs):
+    return [BenchmarkRanker(random.sample(range(n_docs), length))
+            for _ in range(n_rankers)]
+
+
+def benchmark(comparison, n_rankers, length, n_docs, repeat, distinct=0):
+    if distinct > 0:
+        # recurring queries, drawn from a fixed set of rankings
+        pool = [get_rankers(n_rankers, length, n_docs)
+                for _ in range(distinct)]
+        rankers = [random.choice(pool) for _ in range(repeat)]
+    else:
+        rankers = [get_rankers(n_rankers, length, n_docs)
+                   for _ in range(repeat)]
+    start = time.time()
+    for r in rankers:
+        if n_rankers == 2:
+            comparison.interleave(r[0], r[1], None, length)
+        else:
+            comparison.interleave(r, None, length)
+    return (time.time() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[4, 6, 8,
+                                                                   10])
+    parser.add_argument("--n_rankers", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--n_docs", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="Number of distinct rankings to draw the "
+                        "rankings of each impression from (0: all distinct).")
+    parser.add_argument("--cache_size", type=int, default=128)
+    args = parser.parse_args()
+
+    print "%-8s %-9s %-7s %12s" % ("solver", "rankers", "length", "ms / list")
+    for solver in sorted(SOLVERS):
+        try:
+            SOLVERS[solver]()
+        except ImportError as e:
+            print "%-8s skipped (%s)" % (solver, e)
+            continue
+        for n_rankers in args.n_rankers:
+            for length in args.lengths:
+                arg_str = "--solver %s --cache_size %d" % (solver,
+                                                           args.cache_size)
+                if n_rankers == 2:
+                    comparison = OptimizedInterleave(arg_str)
+                else:
+                    comparison = OptimizedMultileave(arg_str)
+                latency = benchmark(comparison, n_rankers, length,
+                                    args.n_docs, args.repeat, args.distinct)
+                print "%-8s %-9d %-7d %12.2f" % (solver, n_rankers, length,
+                                                 1000 * latency)
@@ -16,6 +16,7 @@
 # along with Lerot.  If not, see <http://www.gnu.org/licenses/>.
 
 from include import *
+from lerot.utils import interpolate_checkpoints
 import yaml
 try:
     from yaml import CLoader as Loader
@@ -128,6 +129,9 @@ if __name__ == "__main__":
                                     if not metric in ndcgpoints[exp]['raw'][umshort][datashort][foldshort]:
                                         ndcgpoints[exp]['raw'][umshort][datashort][foldshort][metric] = []
                                     scores = yamldata["offline_%s_evaluation.%s" % (args.traintest, metric)]
+                                    if "offline_evaluation_checkpoints" in yamldata:
+                                        checkpoints = yamldata["offline_evaluation_checkpoints"]
+                                        scores = interpolate_checkpoints(checkpoints, scores, checkpoints[-1] + 1)
                                     #prev = 0.0
                                     #scores = []
                                     #for s in rawscores: